@@ -3,12 +3,23 @@
 This page is mainly an image."""
 
 import base64
+import io
 import os
 import streamlit as st
+from PIL import Image
 
-def get_base64(bin_file: str) ->base64:
+# The background is scaled down to this width (it is stretched to cover the page anyway)
+BACKGROUND_MAX_WIDTH = 1920
+BACKGROUND_JPEG_QUALITY = 85
+
+# Encoded once per process and shared by every session: the original png is 3.3 MB,
+# which was read and encoded (4.5 MB of base64) on every rerun of the page
+@st.cache_resource(show_spinner=False)
+def get_base64(bin_file: str, max_width: int = BACKGROUND_MAX_WIDTH) -> str:
     """
     Generate base64 coding to use for background image.
+    The image is scaled down to max_width and re-encoded as a jpeg, which is about
+    twenty times smaller than the original png (the background has no transparency).
     Function courtesy of:
     https://discuss.streamlit.io/t/how-do-i-use-a-background-image-on-streamlit/5067
     https://stackoverflow.com/questions/72582550/how-do-i-add-background-image-in-streamlit
@@ -16,15 +27,21 @@ def get_base64(bin_file: str) ->base64:
     Arguments:
     ----------
     bin_file (str): bin file for image
+    max_width (int): width in pixels above which the image is scaled down
 
     Returns:
     ----------
-    base64 (str): encoded location
+    base64 (str): encoded jpeg image
 
     """
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
+    with Image.open(bin_file) as image:
+        image = image.convert("RGB")
+    if image.width > max_width:
+        height = round(image.height * max_width / image.width)
+        image = image.resize((max_width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=BACKGROUND_JPEG_QUALITY, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode()
 def set_background(img_file) -> None:
     """
     Set background image using file link and base 64 encoding.
@@ -46,7 +63,7 @@ def set_background(img_file) -> None:
     page_bg_img = '''
     <style>
     .stApp {
-    background-image: url("data:image/png;base64,%s");
+    background-image: url("data:image/jpeg;base64,%s");
     background-size: cover;
     }
     </style>
@@ -0,0 +1,407 @@
+"""
+This file contains the functions used to aggregate the data and to pick its resolution.
+1) summarize: downsamples raw readings (used by the transformers). Besides the mean and std,
+   every time bucket gets the count, min, max, quantiles and the first/last timestamp,
+   all from one sort of the readings.
+2) rollup: rolls the combined daily data up to the coarser resolutions in
+   config_combine.ROLLUPS (weekly, monthly, annual), without going back to the raw data.
+3) choose_resolution: the dashboard pages read the coarsest resolution that still fills
+   the plot for the selected date range, so a decade-long view reads a few hundred rows
+   instead of a hundred thousand.
+
+Every bucket is stored with mergeable statistics, so buckets can be combined without the
+raw data (merge_statistics). This is how overlapping sources are combined into one row
+(resolve_overlaps, unless a source is preferred), and how the rollups are built:
+- count, sum and sum of squares (sufficient statistics): the merged mean and std are exact
+- min, max, first/last timestamp: exact
+- quantiles: a small sketch of the distribution in each bucket. Together with the count they
+  describe a piecewise linear CDF, and the CDFs of several buckets can be mixed to get
+  approximate quantiles of the merged bucket (merge_quantiles).
+"""
+
+import os
+import pathlib
+import importlib
+
+import numpy as np
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+
+# quantile columns and their probabilities, min and max are the 0 and 1 quantiles
+QUANTILES = {
+    "value_min": 0.0,
+    "value_q10": 0.1,
+    "value_q25": 0.25,
+    "value_median": 0.5,
+    "value_q75": 0.75,
+    "value_q90": 0.9,
+    "value_max": 1.0,
+}
+# statistics added to the mean and std of every time bucket
+STATISTIC_COLUMNS = ["value_count", "value_sum", "value_sumsq"] + list(QUANTILES) \
+    + ["time_first", "time_last"]
+
+# columns of every rollup file
+ROLLUP_COLUMNS = ["times", "parameter", "Units", "value_mean", "value_std"] \
+    + STATISTIC_COLUMNS + ["location"]
+
+
+def bucket_times(times: pd.Series, rule: str) -> pd.Series:
+    """
+    Label of the time bucket of every timestamp, the same labels as pandas resample(rule),
+    except for weeks: they run from Monday to Sunday and are labelled with their Monday,
+    the first day they cover (pandas labels them with their ending Sunday), so a weekly
+    point is never dated after the days it covers.
+
+    Arguments:
+    times (pd.Series): datetime series
+    rule (str): one of the rules in config_combine.RESOLUTIONS
+
+    Returns:
+    labels (pd.Series)
+    """
+    if rule == "W":
+        # weeks start on Monday, and are labelled with it
+        return times.dt.normalize() - pd.to_timedelta(times.dt.dayofweek, unit="D")
+    if rule in ["MS", "YS"]:
+        return times.dt.to_period(rule[0]).dt.start_time
+    return times.dt.floor(rule)
+
+
+def sorted_quantiles(values: np.ndarray, counts: np.ndarray) -> dict:
+    """
+    Quantiles of every group of a sorted array (linear interpolation, as pandas quantile).
+
+    Arguments:
+    values (np.ndarray): values sorted by group, then by value
+    counts (np.ndarray): number of values of every group, in the same order (all > 0)
+
+    Returns:
+    quantiles (dict): {column: np.ndarray with one quantile per group} for every column of QUANTILES
+    """
+    starts = np.cumsum(counts) - counts
+    quantiles = {}
+    for column, probability in QUANTILES.items():
+        position = probability * (counts - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.ceil(position).astype(int)
+        low_values = values[starts + lower]
+        quantiles[column] = low_values + (position - lower) * (values[starts + upper] - low_values)
+    return quantiles
+
+
+def summarize(df: pd.DataFrame, rule: str, by: list) -> pd.DataFrame:
+    """
+    Downsample readings to time buckets. Every bucket gets the mean and std (as before),
+    and the statistics in STATISTIC_COLUMNS: count, sum, sum of squares, quantiles and
+    first/last timestamp.
+    The readings are sorted once, by bucket and value, to get all of them.
+
+    Arguments:
+    df (pd.DataFrame): readings with a datetime "times" column, a numeric "value" column
+        and the `by` columns
+    rule (str): fixed resample frequency, e.g. "H" or "D"
+    by (list): columns to group by, e.g. ["parameter", "Units"]
+
+    Returns:
+    summary_df (pd.DataFrame): the `by` columns, "times", "value_mean", "value_std"
+        and STATISTIC_COLUMNS. Buckets without readings are kept (like resample),
+        with a count of 0 and missing statistics.
+    """
+    summary_df = (df.astype({"value": "float64"})
+                    .set_index("times")
+                    .groupby(by, observed=True)["value"]
+                    .resample(rule)
+                    .agg(["mean", "std"])
+                    .reset_index()
+                    .rename(columns={"mean": "value_mean", "std": "value_std"}))
+
+    readings = df.dropna(subset=by + ["value"])
+    keys = readings[by].copy()
+    keys["times"] = bucket_times(readings["times"], rule)
+    codes = pd.MultiIndex.from_frame(summary_df[by + ["times"]]).get_indexer(
+        pd.MultiIndex.from_frame(keys))
+    values = readings["value"].to_numpy(dtype=float)
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=len(summary_df))
+    filled = counts > 0
+
+    summary_df["value_count"] = counts
+    summary_df["value_sum"] = np.bincount(codes, weights=values, minlength=len(summary_df))
+    summary_df["value_sumsq"] = np.bincount(codes, weights=values ** 2,
+                                            minlength=len(summary_df))
+    for column, quantile in sorted_quantiles(values[order], counts[filled]).items():
+        summary_df[column] = np.nan
+        summary_df.loc[filled, column] = quantile
+    times = readings["times"].groupby(codes).agg(["min", "max"])
+    summary_df["time_first"] = times["min"].reindex(summary_df.index)
+    summary_df["time_last"] = times["max"].reindex(summary_df.index)
+    return summary_df
+
+
+def merge_quantiles(quantiles: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Merge the quantile sketches of several buckets into the sketch of their union.
+    Each sketch is a piecewise linear CDF through its quantiles (a point mass where
+    quantiles are equal, e.g. a single value). The CDFs are mixed, weighted by the counts, and inverted
+    at the probabilities of QUANTILES. min and max are exact, the others approximate.
+
+    Arguments:
+    quantiles (np.ndarray): one row per bucket, one column per QUANTILES entry
+    counts (np.ndarray): number of values in every bucket
+
+    Returns:
+    merged (np.ndarray): quantiles of the merged bucket
+    """
+    probabilities = np.array(list(QUANTILES.values()))
+    if len(counts) == 1:
+        return quantiles[0]
+    knots = np.unique(quantiles)
+    # every bucket is split in segments between its quantiles, each with part of its mass
+    lower, upper = quantiles[:, :-1, None], quantiles[:, 1:, None]
+    mass = np.diff(probabilities)[None, :, None] * counts[:, None, None]
+    width = upper - lower
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # half of a point mass is counted at its own value (mid-point of the CDF jump)
+        filled = np.where(width > 0, np.clip((knots - lower) / width, 0, 1),
+                          (knots > lower) + 0.5 * (knots == lower))
+    cdf = (mass * filled).sum(axis=(0, 1)) / counts.sum()
+    merged = np.interp(probabilities, cdf, knots)
+    merged[0], merged[-1] = knots[0], knots[-1]
+    return merged
+
+
+def with_statistics(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fill in the STATISTIC_COLUMNS of rows that do not have them (files written before
+    they existed). Such a row counts as a single value, its mean. Rows that have a count
+    but no sums get them from their count, mean and std.
+
+    Arguments:
+    df (pd.DataFrame): data with "times", "value_mean" and "value_std" columns
+
+    Returns:
+    df (pd.DataFrame): a copy with all STATISTIC_COLUMNS
+    """
+    df = df.copy()
+    for column in STATISTIC_COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    # calculations are in float64, whatever the types of the input (see schema.py)
+    float_columns = ["value_mean", "value_std", "value_sum", "value_sumsq"] + list(QUANTILES)
+    df[float_columns] = df[float_columns].astype("float64")
+    filled = df["value_mean"].notna()
+    legacy = df["value_count"].isna()
+    df["value_count"] = df["value_count"].where(~legacy, filled.astype(int)).astype(int)
+    for column in QUANTILES:
+        df[column] = df[column].where(~legacy, df["value_mean"])
+    df["time_first"] = df["time_first"].where(~legacy, df["times"].where(filled))
+    df["time_last"] = df["time_last"].where(~legacy, df["times"].where(filled))
+
+    count = df["value_count"]
+    mean = df["value_mean"].fillna(0.0)
+    std = df["value_std"].where(count > 1, 0.0).fillna(0.0)
+    df["value_sum"] = df["value_sum"].fillna(count * mean)
+    df["value_sumsq"] = df["value_sumsq"].fillna((count - 1) * std ** 2 + count * mean ** 2)
+    df["time_first"] = schema_mod.to_datetime(df["time_first"])
+    df["time_last"] = schema_mod.to_datetime(df["time_last"])
+    return df
+
+
+def merge_statistics(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Merge the rows with the same keys into one row, e.g. the rows of overlapping sources
+    for one (location, parameter, Units, time). Counts, sums and sums of squares are added,
+    and the mean and std are computed from them, so they are the mean and std of all the
+    readings of the merged rows. Rows that are not merged are kept as they are.
+
+    Arguments:
+    df (pd.DataFrame): data with the keys, "times", "value_mean" and "value_std" columns,
+        and optionally the STATISTIC_COLUMNS (otherwise each row counts as a single value)
+    keys (list): columns that identify a row after merging
+
+    Returns:
+    merged_df (pd.DataFrame): one row per keys, in order of first appearance,
+        with the columns and types of df
+    """
+    dtypes = df.dtypes
+    df = with_statistics(df)
+    codes = df.groupby(keys, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    df = df.iloc[order].reset_index(drop=True)
+    codes = codes[order]
+    sizes = np.bincount(codes)
+    if (sizes == 1).all():
+        return df[dtypes.index].astype(dtypes)
+
+    grouped = df.groupby(codes, sort=True)
+    merged_df = grouped.first()
+    merged_df[["value_count", "value_sum", "value_sumsq"]] = \
+        grouped[["value_count", "value_sum", "value_sumsq"]].sum()
+    merged_df["time_first"] = grouped["time_first"].min()
+    merged_df["time_last"] = grouped["time_last"].max()
+
+    # mean and std of the merged readings from the sufficient statistics
+    merged = sizes > 1
+    count = merged_df["value_count"].to_numpy(dtype=float)
+    total = merged_df["value_sum"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(count > 0, total / count, np.nan)
+        variance = (merged_df["value_sumsq"].to_numpy(dtype=float) - total * mean) / (count - 1)
+        std = np.where(count > 1, np.sqrt(np.maximum(variance, 0)), np.nan)
+    merged_df.loc[merged, "value_mean"] = mean[merged]
+    merged_df.loc[merged, "value_std"] = std[merged]
+
+    quantiles = df[list(QUANTILES)].to_numpy(dtype=float)
+    counts = df["value_count"].to_numpy(dtype=float)
+    merged_quantiles = merged_df[list(QUANTILES)].to_numpy(dtype=float)
+    starts = np.cumsum(sizes) - sizes
+    for group in np.flatnonzero(merged):
+        rows = slice(starts[group], starts[group] + sizes[group])
+        filled = counts[rows] > 0
+        if filled.any():
+            merged_quantiles[group] = merge_quantiles(quantiles[rows][filled],
+                                                      counts[rows][filled])
+    merged_df[list(QUANTILES)] = merged_quantiles
+    return merged_df.reset_index(drop=True)[dtypes.index].astype(dtypes)
+
+
+def resolve_overlaps(df: pd.DataFrame, keys: list, rank: np.ndarray,
+                     rules: dict = None) -> pd.DataFrame:
+    """
+    Combine the rows of several sources that have the same keys (e.g. the same time,
+    parameter and Units, while a site moved to new dataloggers) into one row.
+    The rows are sorted once, by the keys and then by the rank of their source, so the rows
+    to combine are next to each other, and one pass finds them. Depending on the rule of
+    their parameter, the rows of an overlap are either merged (merge_statistics) or the row
+    of the preferred source (lowest rank) is kept. Only the overlapping rows go through
+    merge_statistics.
+
+    Arguments:
+    df (pd.DataFrame): data of all the sources with the keys, "parameter", "value_mean"
+        and "value_std" columns
+    keys (list): columns that identify a row after combining, the first one is the most
+        significant in the order of the output (e.g. ["times", "parameter", "Units"])
+    rank (np.ndarray): rank of the source of every row, lower is preferred
+    rules (dict): {parameter: "merge" or "priority"}, with the rule of the other
+        parameters under "default" ("merge" if there is none)
+
+    Returns:
+    resolved_df (pd.DataFrame): one row per keys, sorted by the keys,
+        with the columns and types of df
+    """
+    rules = rules or {}
+    codes = [pd.factorize(df[key], sort=True)[0] for key in keys]
+    order = np.lexsort([np.asarray(rank)] + codes[::-1])
+    df = df.iloc[order].reset_index(drop=True)
+    codes = np.stack([code[order] for code in codes])
+
+    # one pass over the sorted keys: a group starts wherever a key changes
+    starts = np.ones(len(df), dtype=bool)
+    starts[1:] = (codes[:, 1:] != codes[:, :-1]).any(axis=0)
+    groups = np.cumsum(starts) - 1
+    overlapping = np.bincount(groups)[groups] > 1
+    if not overlapping.any():
+        return df
+
+    rule = df["parameter"].astype(object).map(
+        lambda parameter: rules.get(parameter, rules.get("default", "merge"))).to_numpy()
+    # rows kept as they are: rows without overlap, and the preferred row of a priority overlap
+    kept = ~overlapping | ((rule == "priority") & starts)
+    merged = overlapping & (rule == "merge")
+
+    merged_df = merge_statistics(df[merged], keys)
+    # merge_statistics keeps the order of first appearance, so the merged rows
+    # are in the order of their groups
+    resolved_df = pd.concat([df[kept], merged_df], ignore_index=True)
+    resolved_order = np.argsort(np.concatenate([groups[kept], np.unique(groups[merged])]),
+                                kind="stable")
+    return resolved_df.iloc[resolved_order].reset_index(drop=True).astype(df.dtypes)
+
+
+def rollup(df: pd.DataFrame, resolution: str) -> pd.DataFrame:
+    """
+    Roll combined data up to a coarser resolution, by merging the rows of every time
+    bucket (see merge_statistics). Input rows without the STATISTIC_COLUMNS (files
+    written before they existed) count as a single value.
+
+    Arguments:
+    df (pd.DataFrame): combined data with "times", "parameter", "Units",
+        "value_mean" and "location" columns (e.g. daily_data.csv)
+    resolution (str): one of config_combine.RESOLUTIONS (e.g. "monthly")
+
+    Returns:
+    rollup_df (pd.DataFrame): one row per (location, parameter, Units, time bucket),
+        with the columns in ROLLUP_COLUMNS
+    """
+    rule = config_combine_mod.RESOLUTIONS[resolution]
+    df = df.dropna(subset=["value_mean"]).copy()
+    df["times"] = schema_mod.to_datetime(df["times"])
+    df["Units"] = df["Units"].astype(object).fillna("")
+    df = with_statistics(df)
+    df["times"] = bucket_times(df["times"], rule)
+    keys = ["location", "parameter", "Units", "times"]
+    df = df.sort_values(keys, kind="stable")[ROLLUP_COLUMNS]
+    return merge_statistics(df, keys)
+
+
+def choose_resolution(start_time, end_time, available: list,
+                      plot_points: int = config_combine_mod.PLOT_POINTS) -> str:
+    """
+    Choose the coarsest resolution that still gives plot_points points between
+    start_time and end_time. The finest available resolution is used for short ranges.
+
+    Arguments:
+    start_time, end_time: selected date range (anything pd.Timestamp accepts)
+    available (list): resolutions that have data files, e.g. ["daily", "weekly"]
+    plot_points (int): minimum number of points in the plot
+
+    Returns:
+    resolution (str): one of the available resolutions
+    """
+    ordered = [resolution for resolution in config_combine_mod.RESOLUTIONS
+               if resolution in available]
+    if len(ordered) == 0:
+        raise ValueError("No resolution is available.")
+
+    for resolution in reversed(ordered):
+        buckets = pd.date_range(start_time, end_time,
+                                freq=config_combine_mod.RESOLUTIONS[resolution])
+        if len(buckets) >= plot_points:
+            return resolution
+    return ordered[0]
+
+
+def available_resolutions(path_to_df: str, locations: list) -> list:
+    """
+    Resolutions that have a combined data file at every one of the locations.
+
+    Arguments:
+    path_to_df (str): path to the combined data folder (ending with "/")
+    locations (list): names of the location directories
+
+    Returns:
+    available (list): resolutions from finest to coarsest, e.g. ["daily", "weekly"]
+    """
+    return [resolution for resolution in config_combine_mod.RESOLUTIONS
+            if all(os.path.exists(f"{path_to_df}{loc}/{resolution}_data.csv")
+                   for loc in locations)]
@@ -0,0 +1,313 @@
+"""
+This file contains a native anomaly detection engine that can be used instead of
+pytimetk.anomalize. It follows the same steps (seasonal decomposition, then IQR bands on
+the remainder, then min/max cleaning) and returns the same columns, so its output can be
+plotted with the pytimetk plotting functions.
+
+The decomposition is the robust STL fit pytimetk runs through statsmodels: the same trend
+window, the same tricube LOESS smoothers, low-pass filter and bisquare robustness weights,
+and the same number of passes. On multi-year hourly data pytimetk takes close to a minute.
+Here the LOESS windows away from the ends of the series are computed together as
+convolutions, so the same fit takes a few seconds. pytimetk downcasts the values (down to
+float16) before the fit, so on some series its flags differ slightly from the flags here.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.signal import oaconvolve
+
+
+# Trend period used for each sampling interval (the median time between observations).
+# These are the time scales of pytimetk's get_trend_frequency: the trend window is the
+# median number of observations in one trend period.
+TREND_PERIODS = [
+    (pd.Timedelta(minutes=1), "12h"),
+    (pd.Timedelta(hours=1), "14D"),
+    (pd.Timedelta(days=1), "M"),
+    (pd.Timedelta(days=1, seconds=1), "Q"),
+    (pd.Timedelta(days=7), "5Y"),
+    (pd.Timedelta(days=28), "Y"),
+    (pd.Timedelta(days=90), "5Y"),
+    (pd.Timedelta(days=365), "10Y"),
+]
+LONGEST_TREND_PERIOD = "30Y"
+TREND_PERIOD_LENGTHS = {
+    "12h": pd.Timedelta(hours=12),
+    "14D": pd.Timedelta(days=14),
+    "M": pd.Timedelta(days=30.44),
+    "Q": pd.Timedelta(days=3 * 30.44),
+    "Y": pd.Timedelta(days=365.25),
+    "5Y": pd.Timedelta(days=5 * 365.25),
+    "10Y": pd.Timedelta(days=10 * 365.25),
+    "30Y": pd.Timedelta(days=30 * 365.25),
+}
+
+# statsmodels' STL defaults, used by pytimetk
+INNER_ITERATIONS = 2
+ROBUST_ITERATIONS = 15
+
+
+def make_odd(n: int) -> int:
+    """
+    Round up to the next odd number, so windows are centered.
+    """
+    return n + 1 if n % 2 == 0 else n
+
+
+def trend_period(step: pd.Timedelta) -> str:
+    """
+    Calendar period the trend is smoothed over, for a median sampling interval.
+    """
+    for max_step, period in TREND_PERIODS:
+        if step < max_step:
+            return period
+    return LONGEST_TREND_PERIOD
+
+
+def floor_times(times: pd.Series, period: str) -> pd.Series:
+    """
+    Start of the trend period each time falls in. A series shorter than one period is
+    a single period.
+    """
+    if times.iloc[-1] - times.iloc[0] < TREND_PERIOD_LENGTHS[period]:
+        return pd.Series(times.iloc[0], index=times.index)
+    if period in ("12h", "14D"):
+        return times.dt.floor(period)
+    if period in ("M", "Q"):
+        return times.dt.to_period(period).dt.start_time
+    years = int(period[:-1]) if len(period) > 1 else 1
+    return times.dt.year // years
+
+
+def trend_window(times: pd.Series, period: int) -> int:
+    """
+    Number of observations in the trend window: the median number of observations per
+    trend period, like pytimetk's get_trend_frequency. The window is odd and longer
+    than the seasonal period.
+
+    Arguments:
+    times (pd.Series): datetime column of the series, in time order
+    period (int): seasonal period in observations
+
+    Returns:
+    window (int)
+    """
+    times = pd.Series(pd.to_datetime(times)).dropna().reset_index(drop=True)
+    steps = times.diff().dropna()
+    if steps.empty:
+        return make_odd(period + 1)
+
+    floors = floor_times(times, trend_period(steps.median()))
+    window = int(floors.value_counts().median())
+    return make_odd(max(window, period + 1))
+
+
+def tricube(distance: np.ndarray, h: np.ndarray) -> np.ndarray:
+    """
+    LOESS neighbourhood weights, with STL's cutoffs near 0 and 1.
+    """
+    u = distance / h
+    return np.where(u <= 0.001, 1.0, np.where(u <= 0.999, (1 - u ** 3) ** 3, 0.0))
+
+
+def bisquare(residual: np.ndarray) -> np.ndarray:
+    """
+    STL's robustness weights for the absolute residuals of a fit.
+    """
+    h = 6 * np.median(residual)
+    if h == 0:
+        return np.where(residual <= 0, 1.0, 0.0)
+    u = residual / h
+    return np.where(u <= 0.001, 1.0, np.where(u <= 0.999, (1 - u ** 2) ** 2, 0.0))
+
+
+def solve_linear(s0, s1, s2, t0, t1, length: int) -> np.ndarray:
+    """
+    Value at x = 0 of the weighted least squares line, from the weighted sums of
+    1, x, x^2, y and x*y. Like STL, the slope is dropped (weighted mean) when the
+    spread of x in the window is small compared to the series length.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x = s1 / s0
+        spread = s2 / s0 - mean_x ** 2
+        slope = np.where(spread > (0.001 * (length - 1)) ** 2,
+                         (t1 / s0 - mean_x * t0 / s0) / spread, 0.0)
+        return t0 / s0 - slope * mean_x
+
+
+def loess_at(values: np.ndarray, weights: np.ndarray, window: int,
+             positions: np.ndarray) -> np.ndarray:
+    """
+    LOESS fit at the given positions (which may lie just outside the series), using
+    STL's neighbourhoods: the window is shifted inwards at the ends of the series.
+    Positions whose neighbours all have zero weight are NaN.
+    """
+    n = len(values)
+    q = min(window, n)
+    positions = np.asarray(positions)
+    start = np.clip(positions - window // 2, 0, n - q)
+    neighbours = start[:, None] + np.arange(q)[None, :]
+    h = np.maximum(positions - start, start + q - 1 - positions).astype(float)
+    if window > n:
+        h += (window - n) // 2
+
+    x = neighbours - positions[:, None]
+    w = tricube(np.abs(x), h[:, None]) * weights[neighbours]
+    y = values[neighbours]
+    return solve_linear(w.sum(axis=1), (w * x).sum(axis=1), (w * x * x).sum(axis=1),
+                        (w * y).sum(axis=1), (w * x * y).sum(axis=1), n)
+
+
+def correlate(values: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """
+    Centered moving weighted sum of the values.
+    """
+    return oaconvolve(values, kernel[::-1], mode="same")
+
+
+def loess(values: np.ndarray, weights: np.ndarray, window: int) -> np.ndarray:
+    """
+    Weighted local linear LOESS fit at every position of the series. Like STL, a position
+    whose neighbours all have zero weight keeps its value.
+    Away from the ends all windows have the same shape, so their sums are convolutions.
+    """
+    n = len(values)
+    half = window // 2
+    if n <= window or half < 1:
+        fit = loess_at(values, weights, window, np.arange(n))
+    else:
+        x = np.arange(-half, half + 1)
+        kernel = tricube(np.abs(x), half)
+        weighted = weights * values
+        # convolution round-off can leave tiny non-zero sums where all weights are zero
+        total_weight = np.where(correlate((weights > 0).astype(float), (kernel > 0).astype(float))
+                                > 0.5, correlate(weights, kernel), 0.0)
+        fit = solve_linear(total_weight, correlate(weights, kernel * x),
+                           correlate(weights, kernel * x * x), correlate(weighted, kernel),
+                           correlate(weighted, kernel * x), n)
+        ends = np.r_[0:half, n - half:n]
+        fit[ends] = loess_at(values, weights, window, ends)
+    return np.where(np.isfinite(fit), fit, values)
+
+
+def moving_average(values: np.ndarray, length: int) -> np.ndarray:
+    """
+    Moving average over complete windows, so the result is length - 1 values shorter.
+    """
+    cumsum = np.concatenate([[0.0], np.cumsum(values)])
+    return (cumsum[length:] - cumsum[:-length]) / length
+
+
+def seasonal_component(detrended: np.ndarray, weights: np.ndarray, period: int,
+                       seasonal: int, low_pass: int) -> np.ndarray:
+    """
+    STL's seasonal step: smooth each position of the period over the cycles (extended
+    by one cycle at both ends), then remove the low-pass filtered level.
+    """
+    n = len(detrended)
+    cycles = np.empty(n + 2 * period)
+    for phase in range(period):
+        values = detrended[phase::period]
+        phase_weights = weights[phase::period]
+        k = len(values)
+        cycles[phase + period:phase + period * (k + 1):period] = \
+            loess(values, phase_weights, seasonal)
+        before, after = loess_at(values, phase_weights, seasonal, np.array([-1, k]))
+        # STL repeats the end of the smoothed cycles when it cannot extrapolate
+        cycles[phase] = before if np.isfinite(before) else cycles[phase + period]
+        cycles[phase + period * (k + 1)] = after if np.isfinite(after) \
+            else cycles[phase + period * k]
+
+    level = moving_average(moving_average(moving_average(cycles, period), period), 3)
+    level = loess(level, np.ones(n), low_pass)
+    return cycles[period:period + n] - level
+
+
+def decompose(observed: np.ndarray, period: int, trend: int) -> tuple:
+    """
+    Robust STL decomposition of the observed values, with statsmodels' default seasonal
+    and low-pass windows and number of passes.
+
+    Returns:
+    seasonal, trend (np.ndarray)
+    """
+    seasonal_window = make_odd(period)
+    low_pass = make_odd(period + 1)
+    weights = np.ones_like(observed)
+    trend_values = np.zeros_like(observed)
+    for iteration in range(ROBUST_ITERATIONS + 1):
+        for _ in range(INNER_ITERATIONS):
+            seasonal = seasonal_component(observed - trend_values, weights, period,
+                                          seasonal_window, low_pass)
+            trend_values = loess(observed - seasonal, weights, trend)
+        if iteration < ROBUST_ITERATIONS:
+            weights = bisquare(np.abs(observed - seasonal - trend_values))
+    return seasonal, trend_values
+
+
+def iqr_limits(remainder: np.ndarray, alpha: float) -> tuple:
+    """
+    Lower and upper limits of the remainder. Same formula as pytimetk's iqr (0.2.1),
+    including its lower limit, so both engines draw the same kind of bands.
+    """
+    q1, q3 = np.percentile(remainder, [25, 75])
+    iq_range = q3 - q1
+    return -1 * (q1 + (0.15 / alpha) * iq_range), q3 + (0.15 / alpha) * iq_range
+
+
+def anomalize(data: pd.DataFrame,
+              date_column: str,
+              value_column: str,
+              period: int,
+              iqr_alpha: float = 0.05,
+              clean_alpha: float = 0.75,
+              trend: int = None) -> pd.DataFrame:
+    """
+    Detect anomalies in one time series. Alternative to
+    pytimetk.anomalize(..., method="stl", clean="min_max").
+
+    Arguments:
+    data (pd.DataFrame): data with a datetime column and a value column without missing values
+    date_column (str): name of the datetime column
+    value_column (str): name of the value column
+    period (int): seasonal period in observations
+    iqr_alpha (float): significance level of the IQR bands (lower means wider bands)
+    clean_alpha (float): how far inside the bands anomalies are moved when cleaned
+    trend (int): trend window in observations, chosen from the sampling interval if None
+
+    Returns:
+    pd.DataFrame with the date column and the same columns as pytimetk.anomalize:
+    observed, seasonal, seasadj, trend, remainder, anomaly, anomaly_score,
+    anomaly_direction, recomposed_l1, recomposed_l2, observed_clean
+    """
+    period = int(period)
+    if trend is None:
+        trend = trend_window(data[date_column], period)
+    observed = data[value_column].to_numpy(dtype=float)
+
+    seasonal, trend_values = decompose(observed, period, trend)
+    seasadj = observed - seasonal
+    remainder = seasadj - trend_values
+    lower, upper = iqr_limits(remainder, iqr_alpha)
+
+    direction = np.where(remainder > upper, 1, np.where(remainder < lower, -1, 0))
+    recomposed_l1 = seasonal + trend_values + lower
+    recomposed_l2 = seasonal + trend_values + upper
+    clean_margin = (1 - clean_alpha) * (recomposed_l2 - recomposed_l1) / 2
+    observed_clean = np.where(direction == -1, recomposed_l1 + clean_margin,
+                              np.where(direction == 1, recomposed_l2 - clean_margin, observed))
+
+    return pd.DataFrame({
+        date_column: data[date_column].to_numpy(),
+        "observed": observed,
+        "seasonal": seasonal,
+        "seasadj": seasadj,
+        "trend": trend_values,
+        "remainder": remainder,
+        "anomaly": np.where(direction != 0, "Yes", "No"),
+        "anomaly_score": np.abs(remainder - (lower + upper) / 2),
+        "anomaly_direction": direction,
+        "recomposed_l1": recomposed_l1,
+        "recomposed_l2": recomposed_l2,
+        "observed_clean": observed_clean,
+    }, index=data.index)
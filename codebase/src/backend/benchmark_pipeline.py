@@ -0,0 +1,480 @@
+"""
+End-to-end benchmark of the data pipeline, on synthetic data at the scale of the real
+datasets (by default 7 sites x 6 parameters x 10 years, one reading every 15 minutes).
+
+The raw data is generated in the layout written by run_data_loader.py
+(<raw>/new/<device>/<parameter>.csv, with "times", <parameter> and "Units" columns), then
+every stage is run and timed in the order of the pipeline:
+1) DataWrangler.downsample (run_data_transformer.py)
+2) the DataTransformer steps (data_transformer.py): device_aggregate, tidy_devices,
+   device_downsample_hour and device_downsample_day
+3) DataCombiner.combine_daily, combine_hourly and combine_rollups (data_combiner.py)
+4) the dashboard: df_creation, reading the hourly data of every site, and building the
+   all-time and annual comparison figures (frontend/df_manip_plotting.py)
+
+Every stage reports its time, its throughput (rows read per second, rows selected or
+plotted for the dashboard stages) and its peak memory (the resident memory of the process
+above its level at the start of the stage, see PeakMemory). The results can be saved as a baseline, and are
+compared to the baseline of the same configuration to find regressions.
+
+Run it with
+    python benchmark_pipeline.py --save-baseline
+    python benchmark_pipeline.py
+or, for a quick run, e.g.
+    python benchmark_pipeline.py --sites 2 --years 1 --interval-minutes 60
+"""
+import argparse
+import contextlib
+import glob
+import importlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='data_wrangler_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//run_data_transformer.py"  # full path to the script
+    )
+data_wrangler_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(data_wrangler_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='data_transformer_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//data_transformer.py"  # full path to the script
+    )
+data_transformer_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(data_transformer_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='data_combiner_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//data_combiner.py"  # full path to the script
+    )
+data_combiner_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(data_combiner_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='df_manip_plotting_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//frontend//df_manip_plotting.py"  # full path to the script
+    )
+df_manip_plotting_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(df_manip_plotting_mod)
+
+
+# baseline results, by configuration (see compare)
+BASELINE_PATH = str(pathlib.Path(__file__).with_name("benchmark_baseline.json"))
+# a stage regressed if it takes this much more time (or memory) than in the baseline
+TOLERANCE = 0.2
+# smaller differences are noise, not regressions
+NOISE = {"seconds": 0.1, "peak_mb": 5.0}
+START_DATE = "2013-01-01"
+UNITS = {
+    "Air_Temperature": "C",
+    "ODO": "mg/L",
+    "DO": "mg/L",
+    "Dissolved_Oxygen": "mg/L",
+    "Water_Temeperature": "C",
+    "Temperature": "C",
+}
+
+
+def benchmark_sites(sites: int) -> list:
+    """
+    The last sites of the site registry (config_combine.SITES), so the TREC tower,
+    which the dashboard selects by default, is always one of them.
+    """
+    return list(config_combine_mod.SITES.values())[-sites:]
+
+
+def generate_raw_data(raw_path: str,
+                      sites: int = 7,
+                      parameters: int = 6,
+                      years: int = 10,
+                      interval_minutes: int = 15,
+                      missing_rate: float = 0.01,
+                      seed: int = 0) -> int:
+    """
+    Write synthetic raw data for the new devices of the sites (see benchmark_sites),
+    in the layout of run_data_loader.py.
+    The values follow a yearly and a daily cycle plus noise, with missing readings.
+
+    Arguments:
+    raw_path (str): directory of the raw data, the files are written to <raw_path>/new
+    sites (int): number of sites
+    parameters (int): number of parameters per site (from config_combine.PARAMETERS)
+    years (int): years of data from START_DATE
+    interval_minutes (int): minutes between two readings
+    missing_rate (float): fraction of the readings that are missing
+    seed (int): seed of the noise
+
+    Returns:
+    rows (int): number of readings written
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(START_DATE, pd.Timestamp(START_DATE) + pd.DateOffset(years=years),
+                          freq=f"{interval_minutes}min", inclusive="left")
+    seconds = (times.asi8 // 10**9).astype(np.float64)
+    cycle = (-10 * np.cos(2 * np.pi * seconds / (365.25 * 86400))
+             - 2 * np.cos(2 * np.pi * seconds / 86400))
+
+    rows = 0
+    for site in benchmark_sites(sites):
+        device_path = os.path.join(raw_path, "new", site.devices[2])
+        os.makedirs(device_path, exist_ok=True)
+        for parameter in config_combine_mod.PARAMETERS[:parameters]:
+            values = 12 + cycle + rng.normal(0, 1, len(times))
+            values[rng.random(len(times)) < missing_rate] = np.nan
+            pd.DataFrame({"times": times, parameter: values.round(3),
+                          "Units": UNITS[parameter]}).to_csv(
+                os.path.join(device_path, f"{parameter}.csv"), index=False)
+            rows += len(times)
+    return rows
+
+
+def csv_rows(pattern: str) -> int:
+    """
+    Number of data rows (lines after the header) of the csv files matching pattern
+    """
+    rows = 0
+    for path in glob.glob(pattern):
+        with open(path, "rb") as f:
+            rows += sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1
+    return rows
+
+
+def rss_bytes() -> int:
+    """
+    Resident memory of this process in bytes, None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+class PeakMemory():
+    """
+    Context manager that samples the resident memory of the process in a thread,
+    every SAMPLE_SECONDS. The peak is approximate: the thread cannot sample while
+    a stage holds the GIL, but most memory stays allocated after the call that allocated it.
+    tracemalloc would be exact, but it slows the pandas stages down about ten times.
+    """
+    SAMPLE_SECONDS = 0.005
+
+    def __init__(self) -> None:
+        self.start = None
+        self.peak = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._done.wait(self.SAMPLE_SECONDS):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self) -> "PeakMemory":
+        self.start = self.peak = rss_bytes()
+        if self.start is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.start is not None:
+            self._done.set()
+            self._thread.join()
+            self.peak = max(self.peak, rss_bytes())
+
+    @property
+    def peak_mb(self) -> float:
+        """
+        Memory used above the start at the peak, in MB (None where it cannot be measured)
+        """
+        if self.start is None:
+            return None
+        return (self.peak - self.start) / 2**20
+
+
+def measure(stage, memory: bool = True) -> dict:
+    """
+    Run a stage, and measure its time and peak memory.
+
+    Arguments:
+    stage (callable): function of the stage, returning the number of rows it processed
+    memory (bool): measure the peak memory (see PeakMemory)
+
+    Returns:
+    result (dict): "seconds", "rows", "rows_per_second" and "peak_mb" (None without memory)
+    """
+    with PeakMemory() if memory else contextlib.nullcontext() as peak_memory:
+        start = time.perf_counter()
+        rows = stage()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds,
+            "rows": rows,
+            "rows_per_second": rows / seconds if seconds > 0 else None,
+            "peak_mb": peak_memory.peak_mb if memory else None}
+
+
+def pipeline_stages(workspace: str, devices: dict, backend: str = "pandas") -> dict:
+    """
+    Stages of the pipeline, in order, on the data of workspace.
+
+    Arguments:
+    workspace (str): directory with the raw data (<workspace>/raw, see generate_raw_data)
+    devices (dict): {site name: new device name} of the generated data
+    backend (str): execution backend of the parser and data_combiner (config_combine.BACKENDS)
+
+    Returns:
+    stages (dict): {stage name: function returning the number of rows it processed}
+    """
+    raw_path = os.path.join(workspace, "raw")
+    processed_path = os.path.join(workspace, "processed")
+    # DataTransformer writes files that DataWrangler.parser would also merge,
+    # so its output has a directory of its own
+    transformer_path = os.path.join(workspace, "transformer")
+    combined_path = os.path.join(processed_path, "combined")
+    for device in devices.values():
+        os.makedirs(os.path.join(processed_path, "new", device), exist_ok=True)
+    os.makedirs(combined_path, exist_ok=True)
+
+    data_wrangler = data_wrangler_mod.DataWrangler()
+    data_wrangler.set_project(["new"])
+    data_wrangler.set_path(raw_path, processed_path)
+    data_wrangler.set_backend(backend)
+
+    data_transformer = data_transformer_mod.DataTransformer()
+    data_transformer.set_path(raw_path, transformer_path)
+    data_transformer.set_devices(list(devices.values()))
+
+    data_combiner = data_combiner_mod.DataCombiner()
+    data_combiner.set_path(processed_path)
+    data_combiner.set_backend(backend)
+    data_combiner.set_map({name: [None, None, device] for name, device in devices.items()})
+
+    raw_files = os.path.join(raw_path, "new", "*", "*.csv")
+    dashboard = {}
+
+    def downsample():
+        data_wrangler.downsample()
+        return csv_rows(raw_files)
+
+    def transformer_aggregate():
+        data_transformer.device_aggregate("new")
+        return csv_rows(raw_files)
+
+    def transformer_tidy():
+        data_transformer.tidy_devices("new")
+        return csv_rows(os.path.join(transformer_path, "new", "*", "all_data.csv"))
+
+    def transformer_hourly():
+        data_transformer.device_downsample_hour("new")
+        return csv_rows(os.path.join(transformer_path, "new", "*", "tidy_all_data.csv"))
+
+    def transformer_daily():
+        data_transformer.device_downsample_day("new")
+        return csv_rows(os.path.join(transformer_path, "new", "*", "tidy_all_data.csv"))
+
+    def combine_daily():
+        data_combiner.combine_daily()
+        return csv_rows(os.path.join(processed_path, "new", "*", "tidy_daily_all_data.csv"))
+
+    def combine_hourly():
+        data_combiner.combine_hourly()
+        return csv_rows(os.path.join(processed_path, "new", "*", "tidy_hourly_all_data.csv"))
+
+    def combine_rollups():
+        data_combiner.combine_rollups()
+        return csv_rows(os.path.join(combined_path, "*", "daily_data.csv"))
+
+    def df_creation():
+        # without a streamlit runtime the widgets keep their defaults
+        dashboard["selection"] = df_manip_plotting_mod.df_creation(combined_path + "/")
+        return len(dashboard["selection"][0])
+
+    def read_hourly():
+        paths = [os.path.join(combined_path, name, "hourly_data.csv") for name in devices]
+        df = schema_mod.read_combined_files(paths)
+        selection = schema_mod.select_rows(df, list(devices), df["parameter"].iloc[0],
+                                           df["times"].min(), df["times"].max())
+        return len(selection)
+
+    def all_time_figure():
+        df, variable, locations, start_time, end_time = dashboard["selection"]
+        df_manip_plotting_mod.create_all_time_fig(df, "", variable, True,
+                                                  locations, start_time, end_time)
+        return len(df)
+
+    def annual_figure():
+        df, variable, locations, _, _ = dashboard["selection"]
+        df_manip_plotting_mod.create_annual_comparison_fig(df, "", variable, True, locations)
+        return len(df)
+
+    return {
+        "downsample": downsample,
+        "transformer_aggregate": transformer_aggregate,
+        "transformer_tidy": transformer_tidy,
+        "transformer_hourly": transformer_hourly,
+        "transformer_daily": transformer_daily,
+        "combine_daily": combine_daily,
+        "combine_hourly": combine_hourly,
+        "combine_rollups": combine_rollups,
+        "df_creation": df_creation,
+        "read_hourly": read_hourly,
+        "all_time_figure": all_time_figure,
+        "annual_figure": annual_figure,
+    }
+
+
+def run_benchmark(workspace: str,
+                  sites: int = 7,
+                  parameters: int = 6,
+                  years: int = 10,
+                  interval_minutes: int = 15,
+                  memory: bool = True,
+                  backend: str = "pandas") -> dict:
+    """
+    Generate the synthetic data in workspace and run every stage of the pipeline.
+
+    Arguments:
+    workspace (str): empty directory for the generated and processed data
+    sites, parameters, years, interval_minutes: size of the data (see generate_raw_data)
+    memory (bool): measure the peak memory of the stages
+    backend (str): execution backend of the parser and data_combiner (config_combine.BACKENDS)
+
+    Returns:
+    results (dict): "config" (the arguments) and "stages" ({stage name: measure result})
+    """
+    config = {"sites": sites, "parameters": parameters, "years": years,
+              "interval_minutes": interval_minutes, "memory": memory, "backend": backend}
+    generate_raw_data(os.path.join(workspace, "raw"), sites, parameters, years, interval_minutes)
+    devices = {site.name: site.devices[2] for site in benchmark_sites(sites)}
+
+    results = {}
+    for name, stage in pipeline_stages(workspace, devices, backend).items():
+        print(f"Running {name}", file=sys.stderr)
+        # the progress messages of the stages go to stderr, so stdout only has the report
+        with contextlib.redirect_stdout(sys.stderr):
+            results[name] = measure(stage, memory)
+    return {"config": config, "stages": results}
+
+
+def config_key(config: dict) -> str:
+    """
+    Key of a configuration in the baseline file
+    """
+    return json.dumps(config, sort_keys=True)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """
+    Stages that regressed compared to the baseline of the same configuration.
+
+    Arguments:
+    results (dict): output of run_benchmark
+    baseline (dict): content of the baseline file ({config key: results})
+    tolerance (float): relative increase of time or memory that is a regression
+
+    Returns:
+    regressions (list): one message per regressed stage and metric
+    """
+    reference = baseline.get(config_key(results["config"]))
+    if reference is None:
+        return []
+    regressions = []
+    for name, result in results["stages"].items():
+        if name not in reference["stages"]:
+            continue
+        for metric in ["seconds", "peak_mb"]:
+            before, after = reference["stages"][name][metric], result[metric]
+            if before is None or after is None or after - before < NOISE[metric]:
+                continue
+            if after > before * (1 + tolerance):
+                increase = f"+{100 * (after / before - 1):.0f}%" if before > 0 else "new"
+                regressions.append(f"{name}: {metric} {before:.2f} -> {after:.2f} ({increase})")
+    return regressions
+
+
+def report(results: dict) -> str:
+    """
+    Table of the results of run_benchmark
+    """
+    lines = [f"{'stage':<24}{'seconds':>10}{'rows':>12}{'rows/s':>14}{'peak MB':>10}"]
+    for name, result in results["stages"].items():
+        peak_mb = "" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+        rows_per_second = result["rows_per_second"] or 0
+        lines.append(f"{name:<24}{result['seconds']:>10.2f}{result['rows']:>12}"
+                     f"{rows_per_second:>14.0f}{peak_mb:>10}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data pipeline")
+    parser.add_argument("--sites", type=int, default=7)
+    parser.add_argument("--parameters", type=int, default=6)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--interval-minutes", type=int, default=15)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not measure the peak memory of the stages")
+    parser.add_argument("--backend", default="pandas", choices=["pandas", "polars"],
+                        help="execution backend of the parser and data_combiner")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--workspace", default=None,
+                        help="directory for the generated data, a temporary one by default")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        results = run_benchmark(arguments.workspace or temporary_directory,
+                                arguments.sites, arguments.parameters, arguments.years,
+                                arguments.interval_minutes, not arguments.no_memory,
+                                arguments.backend)
+    print(report(results))
+
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)
+    if arguments.save_baseline:
+        baseline[config_key(results["config"])] = results
+        with open(arguments.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Saved the baseline to {arguments.baseline}")
+    else:
+        regressions = compare(results, baseline, arguments.tolerance)
+        if config_key(results["config"]) not in baseline:
+            print("No baseline for this configuration (run with --save-baseline)")
+        elif regressions:
+            print("Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        else:
+            print("No regressions")
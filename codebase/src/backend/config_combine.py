@@ -1,3 +1,6 @@
+from typing import NamedTuple
+
+
 PARAMETERS = [
     "Air_Temperature",
     "ODO",
@@ -8,13 +11,139 @@ PARAMETERS = [
 ]
 
 
+class Site(NamedTuple):
+    """
+    A data collection site, as used by the pipeline (devices) and the dashboard
+    (display name, coordinates, parameters).
+    """
+    name: str  # name of the combined data directory and of the "location" column
+    display_name: str  # name of the site on the dashboard
+    coordinates: tuple  # (latitude, longitude)
+    devices: tuple  # device names of the (iChart, Old, New) sources, None without data
+    # parameters of the site in the combined data (names standardized by PARAMETER_NAMES),
+    # listed first by the parameter pickers of the dashboard
+    parameters: tuple
+
+
+# Registry of the sites, by name, in the order they are listed on the dashboard.
+# Every other list of sites (COMBINE_MAP, SITE_COORDINATES, DISPLAY_NAMES, SITE_PARAMETERS,
+# ICHART_DEVICES) is derived from it.
+SITES = {site.name: site for site in [
+    # (Temperature, Temp, Temperature) -> Water and (ODO, ODO, ODO)
+    Site("Beach2_Buoy", "Beach 2 Buoy", (42.15763, -80.14044),
+         ("Beach2_Buoy", "Beach2_SDL", "X2-CB-C-VZ4G-20213"),
+         ("ODO", "Temperature", "Water_Temperature")),
+    # (Air_Temperature, AirTemp, Air_Temperature)
+    Site("Beach2_Tower", "Beach 2 Tower", (42.15381, -80.13071),
+         ("Beach2_Tower", "Beach2_Tower_iSIC", "X2-C-VZ4G-01284"),
+         ("Air_Temperature",)),
+    # (Temperature, Temp, Temperature) -> Water and (ODO, ODO, ODO)
+    Site("Beach6_Buoy", "Beach 6 Buoy", (42.16363, -80.12830),
+         ("Beach6_Buoy", None, "X2-CB-C-VZ4G-20229"),
+         ("ODO", "Temperature", "Water_Temperature")),
+    # Old, New (Air_Temperature, Air_Temperature) and (DO, ODO) and (Temperature, Temperature)
+    Site("Near_Shore_Buoy", "Near Shore Buoy", (42.17890, -80.12679),
+         (None, "3100-iSIC", "X2-CB-C-AT4G-20205"),
+         ("Air_Temperature", "ODO", "Temperature")),
+    # New (Water Temperature and Dissolved_Oxygen)
+    Site("Surface_Data", "Surface Data", (42.116952, -80.149409),
+         (None, None, "Surface_Data"),
+         ("ODO",)),
+    # Old, New (Air_Temperature, Air_Temperature)
+    Site("Walnut_Creek", "Walnut Creek", (42.13970, -80.28418),
+         (None, "Walnut_Creek_iSIC", "X2-CB-C-AT4G-20200"),
+         ("Air_Temperature",)),
+    # iChart, NEW (AirTemp, Air_Temperature)
+    Site("Trec_Tower", "TREC Tower", (42.10992, -80.15459),
+         ("TREC_Tower", None, "TREC_Tower_iSIC"),
+         ("Air_Temperature",)),
+]}
+
+# Sources of the combined data, in the order of Site.devices
+SOURCES = ["ichart", "old", "new"]
+# Rows of several sources for the same parameter and time (e.g. while a site moved to new
+# dataloggers) are combined into one row by data_combiner, with the rule of their parameter
+# (or the "default" rule): "merge" adds up their statistics (mean and std of all the
+# readings), "priority" keeps the row of the source that comes first in SOURCE_PRIORITY.
+SOURCE_PRIORITY = ["new", "old", "ichart"]
+OVERLAP_RULES = {"default": "merge"}
+
+# Names of the parameters that data_combiner standardizes, the ones we are confident of.
+# Note: we do not know what the variable "Temperature" is, so we do not standardize it.
+# It could be water temperature, air temperature, battery temperature or something else.
+PARAMETER_NAMES = {"AirTemp": "Air_Temperature", "Dissolved_Oxygen": "ODO", "DO": "ODO"}
+# Gross outliers removed by data_combiner, by resolution: rows of a parameter with a
+# value_mean below the low bound or above the high bound (None for no bound)
+OUTLIER_BOUNDS = {
+    "daily": {
+        "Water_Temperature": (-50, 110),
+        "Air_Temperature": (-50, 110),
+        "Temperature": (-50, None),
+        "ODO": (0.001, 30),
+    },
+    "hourly": {
+        "Water_Temperature": (-50, 110),
+        "Air_Temperature": (-50, 110),
+        "Temperature": (-40, None),
+        "ODO": (0.001, 30),
+    },
+}
+
+# Execution backend of data_combiner and of the parser of run_data_transformer.
+# "pandas" reads all the files of a site into memory, "polars" streams through them with
+# Polars lazy queries, so the memory used does not grow with the data (see polars_backend.py).
+BACKENDS = ["pandas", "polars"]
+BACKEND = "pandas"
+
 # iCHART, OLD, NEW,
-COMBINE_MAP = {
-   "Trec_Tower": ["TREC_Tower", None, "TREC_Tower_iSIC"], # iChart, NEW (AirTemp, Air_Temperature)
-   "Beach2_Tower": ["Beach2_Tower", "Beach2_Tower_iSIC", "X2-C-VZ4G-01284"], # (Air_Temperature, AirTemp, Air_Temperature)
-   "Beach2_Buoy": ["Beach2_Buoy","Beach2_SDL","X2-CB-C-VZ4G-20213"], # (Temperature, Temp, Temperature) -> Water and (ODO, ODO, ODO)
-   "Beach6_Buoy": ["Beach6_Buoy", None,"X2-CB-C-VZ4G-20229"], # (Temperature, Temp, Temperature) -> Water and (ODO, ODO, ODO)
-   "Near_Shore_Buoy": [None, "3100-iSIC", "X2-CB-C-AT4G-20205"], # Old, New (Air_Temperature, Air_Temperature) and (DO, ODO) and (Temperature, Temperature)
-   "Walnut_Creek": [None, "Walnut_Creek_iSIC" ,"X2-CB-C-AT4G-20200"], # Old, New (Air_Temperature, Air_Temperature)
-   "Surface_Data": [None, None, "Surface_Data"], # New (Water Temperature and Dissolved_Oxygen)
-}
\ No newline at end of file
+COMBINE_MAP = {name: list(site.devices) for name, site in SITES.items()}
+
+# Coordinates (latitude, longitude) of the sites, shown on the dashboard maps
+SITE_COORDINATES = {name: site.coordinates for name, site in SITES.items()}
+# Center of the dashboard maps (the TREC tower)
+MAP_CENTER = SITES["Trec_Tower"].coordinates
+
+# Site names by display name, for the site pickers of the dashboard
+DISPLAY_NAMES = {site.display_name: name for name, site in SITES.items()}
+# Parameters of the sites, for the parameter pickers of the dashboard
+SITE_PARAMETERS = {name: site.parameters for name, site in SITES.items()}
+
+# Devices of the iChart data (preprocess_ichart_data.py)
+ICHART_DEVICES = [site.devices[0] for site in SITES.values() if site.devices[0] is not None]
+
+# Default anomalize settings. run_anomaly_detection precomputes anomalies with these
+# values, and the Advanced Statistics page reads them while the user keeps these defaults.
+ANOMALY_PARAMETERS = {
+    "period": 7,
+    "iqr_alpha": 0.05,
+    "clean_alpha": 0.75,
+}
+
+# Data frequencies of the combined csv files ("<frequency>_data.csv")
+FREQUENCIES = ["hourly", "daily"]
+
+# Settings of the online anomaly detector (online_anomaly.py), which scores new readings
+# as run_data_loader downloads them. window and min_history are numbers of readings,
+# smoothing is the weight of a new reading in the hour-of-day baseline.
+ONLINE_ANOMALY_PARAMETERS = {
+    "window": 720,
+    "iqr_alpha": 0.05,
+    "smoothing": 0.1,
+    "min_history": 48,
+}
+
+# Resolutions of the combined data, from finest to coarsest, with their pandas resample rules.
+# hourly and daily come from the transformers, the others are rollups built by data_combiner
+# ("<resolution>_data.csv" in every combined location directory).
+RESOLUTIONS = {
+    "hourly": "H",
+    "daily": "D",
+    "weekly": "W",
+    "monthly": "MS",
+    "annual": "YS",
+}
+ROLLUPS = ["weekly", "monthly", "annual"]
+
+# Number of points a plot should have at least when the resolution is chosen automatically.
+# The coarsest resolution with this many points in the selected date range is read.
+PLOT_POINTS = 500
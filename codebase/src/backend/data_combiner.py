@@ -1,11 +1,13 @@
 """
 This script runs after data_loader and data_transformer. 
 It combines the data from all 3 sources (iChart, Old, New) from data/processed 
-into a single combined dataset. Ideally, this script only needs to be run once 
-or any time we collect new data from the WQData API. 
+into a single combined dataset, with one row per parameter and time. 
+Ideally, this script only needs to be run once or any time we collect new data 
+from the WQData API. 
 """
 
 import os
+import numpy as np
 import pandas as pd
 import pathlib
 import importlib
@@ -23,6 +25,33 @@ spec = importlib.util.spec_from_file_location(
 config_combine_mod = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(config_combine_mod)
 
+spec = importlib.util.spec_from_file_location(
+    name='aggregation_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//aggregation.py"  # full path to the script
+    )
+
+aggregation_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aggregation_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='polars_backend_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//polars_backend.py"  # full path to the script
+    )
+
+polars_backend_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(polars_backend_mod)
+
 
 #from config_combine import COMBINE_MAP
 
@@ -39,7 +68,9 @@ class DataCombiner():
         """
         self.path = ""
         self.map = {}
-
+        self.priority = config_combine_mod.SOURCE_PRIORITY
+        self.rules = config_combine_mod.OVERLAP_RULES
+        self.backend = config_combine_mod.BACKEND
 
     def set_path(self, path: str = "../../data/processed"):
         """
@@ -59,125 +90,184 @@ class DataCombiner():
         """
         self.map = map
 
-    def combine_daily(self):
+    def set_overlap_rules(self,
+                          priority: list = config_combine_mod.SOURCE_PRIORITY,
+                          rules: dict = config_combine_mod.OVERLAP_RULES):
         """
-        Combine the data from all 3 sources (iChart, Old, New) into a single combined dataset.
-        It will combine all the daily data from the 3 sources into a single csv file.
+        Set how the rows of overlapping sources are combined (see config_combine.OVERLAP_RULES).
+
+        Parameters
+        priority : list (the sources, from the preferred one, e.g. ["new", "old", "ichart"]).
+        rules : dict ({parameter: "merge" or "priority"}, and the "default" rule).
+        """
+        self.priority = priority
+        self.rules = rules
+
+    def set_backend(self, backend: str = config_combine_mod.BACKEND):
+        """
+        Set the execution backend of combine_daily and combine_hourly (see config_combine.BACKEND).
+        "pandas" reads all the data of a location into memory, "polars" streams through it
+        (see polars_backend.py).
+
+        Parameters
+        backend : str ("pandas" or "polars").
+        """
+        if backend not in config_combine_mod.BACKENDS:
+            raise ValueError(f"Backend {backend} is not one of {config_combine_mod.BACKENDS}.")
+        self.backend = backend
+
+    def resolve_overlaps(self, combined_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Combine the rows of the sources for the same time, parameter and Units into one row,
+        by merging their statistics or keeping the row of the preferred source, following
+        self.rules and self.priority (see aggregation.resolve_overlaps).
+
+        Parameters
+        combined_df : pd.DataFrame (the data of all the sources, indexed by "times",
+            with the source of every row in a "source" column).
+
+        Returns
+        pd.DataFrame (one row per time, parameter and Units, sorted by them,
+            without the "source" column).
+        """
+        combined_df = combined_df.reset_index()
+        rank = combined_df["source"].map(
+            {source: rank for rank, source in enumerate(self.priority)}).to_numpy()
+        return aggregation_mod.resolve_overlaps(
+            combined_df.drop(columns="source"), ["times", "parameter", "Units"],
+            rank, self.rules).set_index("times")
+
+    def source_paths(self, all_device: list, resolution: str) -> dict:
+        """
+        Paths of the tidy data of the sources of a location.
+
+        Parameters
+        all_device : list (the devices of the location in each source, None if it has none).
+        resolution : str ("daily" or "hourly").
+
+        Returns
+        dict ({source: path}, for the sources of the location).
+        """
+        paths = {}
+        for proj, prod_device in zip(config_combine_mod.SOURCES, all_device):
+            # Skip the sources the location does not have
+            if prod_device is None:
+                continue
+            path = f"{self.dir}/{proj}/{prod_device}/tidy_{resolution}_all_data.csv"
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Path {path} does not exist.")
+            paths[proj] = path
+        return paths
+
+    def remove_outliers(self, combined_df: pd.DataFrame, resolution: str) -> pd.DataFrame:
+        """
+        Remove the gross outliers (see config_combine.OUTLIER_BOUNDS).
+
+        Parameters
+        combined_df : pd.DataFrame (the combined data).
+        resolution : str ("daily" or "hourly").
+
+        Returns
+        pd.DataFrame (the rows that are not outliers).
         """
+        outlier = np.zeros(len(combined_df), dtype=bool)
+        for parameter, (low, high) in config_combine_mod.OUTLIER_BOUNDS[resolution].items():
+            is_parameter = (combined_df['parameter'] == parameter).to_numpy()
+            if low is not None:
+                outlier |= is_parameter & (combined_df['value_mean'] < low).to_numpy()
+            if high is not None:
+                outlier |= is_parameter & (combined_df['value_mean'] > high).to_numpy()
+        return combined_df[~outlier]
 
-        # Run for daily data
+    def combine(self, resolution: str):
+        """
+        Combine the data from all 3 sources (iChart, Old, New) into a single combined dataset.
+        It will combine all the data of a resolution from the 3 sources into a single csv file
+        per location, with the pandas or the polars backend (see set_backend).
+
+        Parameters
+        resolution : str ("daily" or "hourly").
+        """
         for name, all_device in self.map.items():
-            combined_df = []
-            for proj, prod_device in zip(["ichart", "old", "new"], all_device):
-                # Skip in 
-                if prod_device is None:
-                    continue
-                if proj == "ichart":
-                    path = f"{self.dir}/{proj}/{prod_device}/tidy_daily_all_data.csv"
-                else:
-                    path = f"{self.dir}/{proj}/{prod_device}/tidy_daily_all_data.csv"
-                if not os.path.exists(path):
-                    raise FileNotFoundError(f"Path {path} does not exist.")
-
-                combined_df.append(
-                    pd.read_csv(path)
-                )
-
-            combined_df = pd.concat(combined_df, ignore_index=True).set_index("times")
+            paths = self.source_paths(all_device, resolution)
+            if not os.path.exists(f"{self.dir}/combined/{name}"):
+                os.mkdir(f"{self.dir}/combined/{name}")
+            path = f"{self.dir}/combined/{name}/{resolution}_data.csv"
+
+            if self.backend == "polars":
+                polars_backend_mod.combine(paths, name, resolution, path, self.resolve_overlaps)
+                continue
+
+            # the source of every row, for resolve_overlaps. The floats stay float64,
+            # so the csv file keeps the precision of the sources.
+            combined_df = pd.concat(
+                [schema_mod.read_csv(source_path, keep_floats=True).assign(source=proj)
+                 for proj, source_path in paths.items()],
+                ignore_index=True).set_index("times")
             combined_df["location"] = name
+            # the categories of the sources differ, so they are unified after the concat
+            combined_df = schema_mod.compact(combined_df, keep_floats=True)
 
             # Standardizing the variable names we are confident of.
-            # Note: we do not know what the variable "Temperature" is, so we do not standardize it.
-            # It could be water temperature, air temperature, battery temperature or something else.
-            combined_df['parameter'] = combined_df['parameter'].replace('AirTemp',
-                                                                        'Air_Temperature')
-            combined_df['parameter'] = combined_df['parameter'].replace('Dissolved_Oxygen',
-                                                                        'ODO')
-            combined_df['parameter'] = combined_df['parameter'].replace('DO',
-                                                                        'ODO')
+            combined_df['parameter'] = combined_df['parameter'].replace(
+                config_combine_mod.PARAMETER_NAMES)
 
             # removing gross outliers
-            combined_df = combined_df[~((combined_df['parameter'] == 'Water_Temperature') &
-                                        (combined_df['value_mean'] > 110))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Water_Temperature') &
-                                        (combined_df['value_mean'] <-50))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Air_Temperature') &
-                                        (combined_df['value_mean'] > 110))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Air_Temperature') &
-                                        (combined_df['value_mean'] <-50))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Temperature') &
-                                        (combined_df['value_mean'] <-50))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'ODO') &
-                                        (combined_df['value_mean'] < 0.001))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'ODO') &
-                                        (combined_df['value_mean'] > 30))]
+            combined_df = self.remove_outliers(combined_df, resolution)
 
-            if not os.path.exists(f"{self.dir}/combined/{name}"):
-                os.mkdir(f"{self.dir}/combined/{name}")
-            combined_df.to_csv(f"{self.dir}/combined/{name}/daily_data.csv")
+            # Sources can overlap in time. Their rows for the same parameter and time are
+            # combined into one row (see resolve_overlaps).
+            combined_df = self.resolve_overlaps(combined_df)
 
+            combined_df.to_csv(path)
+            # memory mapped copy read by the dashboard, sorted for select_rows
+            # and with the compact types of read_csv
+            schema_mod.write_arrow(
+                schema_mod.compact(schema_mod.sort_rows(combined_df.reset_index())),
+                schema_mod.arrow_path(path))
+
+    def combine_daily(self):
+        """
+        Combine the data from all 3 sources (iChart, Old, New) into a single combined dataset.
+        It will combine all the daily data from the 3 sources into a single csv file.
+        """
+        self.combine("daily")
 
     def combine_hourly(self):
         """
         Combine the data from all 3 sources (iChart, Old, New) into a single combined dataset.
         It will combine all the hourly data from the 3 sources into a single csv file.
         """
+        self.combine("hourly")
 
-        # Run for hourly data
-        for name, all_device in self.map.items():
-            combined_df = []
-            for proj, prod_device in zip(["ichart", "old", "new"], all_device):
-                # Skip in
-                if prod_device is None:
-                    continue
-                if proj == "ichart":
-                    path = f"{self.dir}/{proj}/{prod_device}/tidy_hourly_all_data.csv"
-                    #path = f"../../data/processed/{proj}/{prod_device}/tidy_hourly_all_data.csv"
-                else:
-                    path = f"{self.dir}/{proj}/{prod_device}/tidy_hourly_all_data.csv"
-                    #path = f"../../data/processed/{proj}/{prod_device}/tidy_hourly_all_data.csv"
-                if not os.path.exists(path):
-                    raise FileNotFoundError(f"Path {path} does not exist.")
-
-                combined_df.append(
-                    pd.read_csv(path)
-                )
-            combined_df = pd.concat(combined_df, ignore_index=True).set_index("times")
-            combined_df["location"] = name
-
-            # Standardizing the variable names we are confident of.
-            # Note: we do not know what the variable "Temperature" is, so we do not standardize it.
-            # It could be water temperature, air temperature, battery temperature or something else.
-            combined_df['parameter'] = combined_df['parameter'].replace('AirTemp',
-                                                                        'Air_Temperature')
-            combined_df['parameter'] = combined_df['parameter'].replace('Dissolved_Oxygen',
-                                                                        'ODO')
-            combined_df['parameter'] = combined_df['parameter'].replace('DO',
-                                                                        'ODO')
+    def combine_rollups(self):
+        """
+        Roll the combined daily data up to the coarser resolutions (weekly, monthly, annual).
+        To be run after combine_daily. It will write one csv file per resolution
+        (e.g. "monthly_data.csv") next to the daily data, with the count, mean, std,
+        min and max of the daily values in each time bucket.
+        Like the daily and hourly data, every file also gets an Arrow copy
+        (e.g. "monthly_data.arrow") that the dashboard memory maps (see schema.py).
+        """
 
-            # removing gross outliers
-            combined_df = combined_df[~((combined_df['parameter'] == 'Water_Temperature') &
-                                        (combined_df['value_mean'] > 110))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Water_Temperature') &
-                                        (combined_df['value_mean'] <-50))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Air_Temperature') &
-                                        (combined_df['value_mean'] > 110))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Air_Temperature') &
-                                        (combined_df['value_mean'] <-50))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'Temperature') &
-                                        (combined_df['value_mean'] <-40))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'ODO') &
-                                        (combined_df['value_mean'] < -10))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'ODO') &
-                                        (combined_df['value_mean'] < 0.001))]
-            combined_df = combined_df[~((combined_df['parameter'] == 'ODO') &
-                                        (combined_df['value_mean'] > 30))]
+        for name in self.map:
+            path = f"{self.dir}/combined/{name}/daily_data.csv"
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Path {path} does not exist.")
 
-            if not os.path.exists(f"{self.dir}/combined/{name}"):
-                os.mkdir(f"{self.dir}/combined/{name}")
-            combined_df.to_csv(f"{self.dir}/combined/{name}/hourly_data.csv")
+            daily_df = schema_mod.read_csv(path)
+            for resolution in config_combine_mod.ROLLUPS:
+                rollup_df = aggregation_mod.rollup(daily_df, resolution)
+                path = f"{self.dir}/combined/{name}/{resolution}_data.csv"
+                rollup_df.to_csv(path, index=False)
+                schema_mod.write_arrow(schema_mod.sort_rows(rollup_df),
+                                       schema_mod.arrow_path(path))
 
-dataCombiner = DataCombiner()
-dataCombiner.set_path()
-dataCombiner.combine_daily()
-dataCombiner.combine_hourly()
+# Only when run as a script, so the class can be imported (tests, benchmark_pipeline.py)
+# without combining the data in ../../data/processed
+if __name__ == "__main__":
+    dataCombiner = DataCombiner()
+    dataCombiner.set_path()
+    dataCombiner.combine_daily()
+    dataCombiner.combine_hourly()
+    dataCombiner.combine_rollups()
@@ -2,14 +2,215 @@
 This file is used to define a DataLoader class that can be used to interface with the WQdata API.
 It can be used to get a list of available devices, parameters, and data for a given project.
 """
+import contextlib
+import hashlib
 import http.client
-import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+import numpy as np
+import orjson
 import pandas as pd
 from collections import defaultdict
 
 from typing import Dict
 from config_combine import PARAMETERS
 
+try:
+    import fcntl
+except ImportError:
+    # Windows: the cache file is only locked between the threads of a process
+    fcntl = None
+
+
+# Retry policy of api_call: transient failures (timeouts, connection resets, 5xx responses)
+# are retried up to MAX_ATTEMPTS times in total, after a random delay of up to
+# BACKOFF_SECONDS * 2 ** (attempt - 1), capped at MAX_BACKOFF_SECONDS ("full jitter").
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+# The WQData API. Another base url (e.g. "http://127.0.0.1:8080" for wqdata_simulator.py)
+# can be given to DataLoader.
+BASE_URL = "https://www.wqdatalive.com"
+# seconds to wait for the WQData API to connect or answer
+TIMEOUT_SECONDS = 30
+# The device and parameter listings rarely change, so they are cached on disk (MetadataCache)
+# and only asked again once they are older than METADATA_TTL_SECONDS.
+METADATA_TTL_SECONDS = 7 * 24 * 3600
+# held while a MetadataCache is saved, by the loaders of both projects in this process
+METADATA_SAVE_LOCK = threading.Lock()
+# permissions of a file created by open(): read and write for everyone, less the umask.
+# The umask can only be read by setting it, so it is read once, when the module is loaded.
+UMASK = os.umask(0)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+
+
+class WQDataError(Exception):
+    """
+    Base class of the errors of the WQData API.
+    """
+
+
+class QuotaExceededError(WQDataError):
+    """
+    The hourly limit of API calls is reached. Not retried: the calls can resume next hour.
+    """
+
+
+class TransientError(WQDataError):
+    """
+    Timeout, network error (e.g. connection reset, DNS or TLS failure) or 5xx response.
+    Retried by api_call, raised once the attempts are used up.
+    """
+
+
+class APIError(WQDataError):
+    """
+    Any other failed call (e.g. a 4xx response or a response that is not json). Not retried.
+    """
+
+
+def backoff_delay(attempt: int,
+                  backoff: float = BACKOFF_SECONDS,
+                  max_backoff: float = MAX_BACKOFF_SECONDS) -> float:
+    """
+    Random delay before retrying after the attempt-th failed attempt (1 for the first).
+    The delays are spread over [0, backoff * 2 ** (attempt - 1)] so that the retries of
+    several clients do not hit the API at the same moments.
+    """
+    return random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
+
+
+def data_frame(records: list) -> pd.DataFrame:
+    """
+    Typed dataframe of the readings of a data response ({"timestamp": ..., "value": ...}
+    records). The times are parsed in one call, converted to UTC when they have an offset
+    (e.g. "Z" or "+01:00") and stored without time zone. The values go straight into
+    a preallocated NumPy array, without an intermediate list.
+
+    Arguments:
+    records (list): the "data" of the response
+
+    Returns:
+    data (pd.DataFrame): "times" (datetime64, UTC) and "values" (float64, NaN if missing)
+    columns
+    """
+    count = len(records)
+    timestamps = [record["timestamp"] for record in records]
+    try:
+        times = pd.to_datetime(timestamps, format="ISO8601", utc=True)
+    except ValueError:
+        # not ISO 8601 times
+        times = pd.to_datetime(timestamps, format="mixed", utc=True)
+    times = times.tz_localize(None)
+    try:
+        values = np.fromiter((record["value"] for record in records),
+                             dtype=np.float64, count=count)
+    except (ValueError, TypeError):
+        # values that are not numbers are missing
+        values = pd.to_numeric(pd.Series([record["value"] for record in records]),
+                               errors="coerce").to_numpy(dtype=np.float64)
+    return pd.DataFrame({"times": times, "values": values})
+
+
+class MetadataCache():
+    """
+    Device and parameter listings of the WQData API, saved to a json file so that a new
+    process does not spend API calls on them. One file can be shared by the loaders of
+    both projects: the entries are keyed by a hash of the API key and the path of the call.
+
+    An entry is used as it is for ttl seconds. After that the call is made again,
+    as a conditional request when the API gave an ETag: a 304 (Not Modified) response
+    keeps the entry for another ttl seconds.
+    """
+
+    def __init__(self, path: str, ttl: float = METADATA_TTL_SECONDS) -> None:
+        """
+        Arguments:
+        ----------
+        path (str): path to the json cache file, created on the first save
+        ttl (float): seconds an entry is used without asking the API again
+        """
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.entries = orjson.loads(f.read())
+
+    @staticmethod
+    def key(apiKey: str, url: str) -> str:
+        """
+        Key of the response of url: the path of the call (without the query string, which
+        holds the API key), prefixed with a hash of the API key so the key is not saved.
+        """
+        project = hashlib.sha256(str(apiKey).encode("utf-8")).hexdigest()[:16]
+        return f"{project}:{url.split('?')[0]}"
+
+    def get(self, key: str) -> Dict:
+        """
+        Entry of key ({"data": ..., "etag": ..., "fetched": ...}), or None
+        """
+        return self.entries.get(key)
+
+    def is_fresh(self, entry: Dict) -> bool:
+        """
+        True if entry was fetched (or validated) less than ttl seconds ago
+        """
+        return time.time() - entry["fetched"] < self.ttl
+
+    def put(self, key: str, data: Dict, etag: str = None) -> None:
+        """
+        Save the response of a call, and its ETag if the API gave one
+        """
+        self.save(key, {"data": data, "etag": etag, "fetched": time.time()})
+
+    def touch(self, key: str) -> None:
+        """
+        Keep the entry of key for another ttl seconds (the API said it did not change)
+        """
+        self.save(key, dict(self.entries[key], fetched=time.time()))
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Hold the lock of the cache file ("<path>.lock"), so the loaders of both projects,
+        in threads or in processes, save it one at a time.
+        """
+        with METADATA_SAVE_LOCK, open(f"{self.path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                # released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def save(self, key: str, entry: Dict) -> None:
+        """
+        Write the entry of key to the cache file. The file is read again under its lock,
+        so the entries written in the meantime by the loader of the other project are kept,
+        and it is replaced in one step (through a unique temporary file) so it is never
+        read half written. mkstemp creates the temporary file readable by its owner only,
+        so it gets the usual permissions (FILE_MODE) before the rename.
+        """
+        with self.locked():
+            entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    entries = orjson.loads(f.read())
+            entries[key] = entry
+            fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".",
+                                                  prefix=os.path.basename(self.path) + ".",
+                                                  suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps(entries))
+            os.chmod(temporary_path, FILE_MODE)
+            os.replace(temporary_path, self.path)
+        self.entries = entries
+
+
 class DataLoader():
     """
     This class can be used to load data from the wqdatalive API.
@@ -17,16 +218,27 @@ class DataLoader():
     2) Make a request to the API and handle errors
     3) Parse the reponse and return json (it will NOT clean or manipulate the data in any way - this will be done in the data cleaning class)
     """
-    def __init__(self, apiKey: str, project: str) -> None:
+    def __init__(self, apiKey: str, project: str, max_attempts: int = MAX_ATTEMPTS,
+                 metadata_cache: MetadataCache = None, base_url: str = BASE_URL) -> None:
         """
         Arguments: 
         ----------
-        variable (type): description
+        apiKey (str): WQData API key of the project
+        project (str): name of the project ("old" or "new")
+        max_attempts (int): attempts of every API call on transient errors (see api_call)
+        metadata_cache (MetadataCache): cache of the device and parameter listings,
+            if None they are asked to the API by every new DataLoader
+        base_url (str): scheme, host (and port) of the API, e.g. "http://127.0.0.1:8080"
         """
         self.devices = None
         self.device_parameters = defaultdict(list)
         self.apiKey = apiKey
         self.project = project
+        self.max_attempts = max_attempts
+        self.metadata_cache = metadata_cache
+        self.base_url = base_url
+        # ETag header of the last response, None if the API did not give one
+        self.etag = None
 
         # This is "state information" to keep track of processed data
         self.processed_device_parameters = defaultdict(list)
@@ -34,16 +246,81 @@ class DataLoader():
         self.current_start_time = None
 
 
-    def api_call(self, url: str) -> Dict:
+    def api_call(self, url: str, headers: Dict = None) -> Dict:
         """
         Call WQData API
+        Transient errors (timeouts, connection resets, 5xx responses) are retried with
+        exponential backoff and jitter (see backoff_delay), up to self.max_attempts attempts.
+
+        Returns:
+        ----------
+        data (dict): the json response, None if a conditional request (If-None-Match header)
+        was answered 304 Not Modified
+
+        Raises:
+        ----------
+        TransientError: if every attempt failed with a transient error
+        QuotaExceededError: on a 429 (Too Many Requests) response
+        APIError: if the response is an error that retrying would not fix
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self.request(url, headers)
+            except TransientError as error:
+                if attempt == self.max_attempts:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f"{error}, retrying in {delay:.1f} s")
+                time.sleep(delay)
+
+    def request(self, url: str, headers: Dict = None) -> Dict:
+        """
+        Make one request to the WQData API and parse its json response
+        (None on a 304 Not Modified response). The ETag header of the response is kept
+        in self.etag.
+
+        Raises:
+        ----------
+        TransientError: on a timeout, a network error or a 5xx response
+        QuotaExceededError: on a 429 (Too Many Requests) response
+        APIError: on a 4xx response, or a response that is not json
         """
-        conn = http.client.HTTPSConnection("www.wqdatalive.com")
-        conn.request("GET", url)
-        res = conn.getresponse()
-        data = res.read()
-        data = data.decode("utf-8")
-        data = json.loads(data)
+        base_url = urllib.parse.urlsplit(self.base_url)
+        if base_url.scheme == "http":
+            conn = http.client.HTTPConnection(base_url.netloc, timeout=TIMEOUT_SECONDS)
+        else:
+            conn = http.client.HTTPSConnection(base_url.netloc, timeout=TIMEOUT_SECONDS)
+        try:
+            conn.request("GET", base_url.path.rstrip("/") + url, headers=headers or {})
+            res = conn.getresponse()
+            data = res.read()
+            etag = res.getheader("ETag")
+        except (OSError, http.client.HTTPException) as error:
+            # OSError covers timeouts, connection errors, DNS (socket.gaierror)
+            # and TLS (ssl.SSLError) failures
+            raise TransientError(f"WQData request failed: {error!r}") from error
+        finally:
+            conn.close()
+
+        self.etag = etag if isinstance(etag, str) else None
+        if res.status == 304:
+            return None
+        if res.status >= 500:
+            raise TransientError(f"WQData responded {res.status} {res.reason}")
+        if res.status >= 400:
+            message = f"WQData responded {res.status} {res.reason}"
+            try:
+                message += f": {orjson.loads(data)['message']}"
+            except (ValueError, KeyError, TypeError):
+                pass
+            if res.status == 429:
+                raise QuotaExceededError(message)
+            raise APIError(message)
+        try:
+            # parsed from the bytes, without decoding them to a str first
+            data = orjson.loads(data)
+        except ValueError as error:
+            raise APIError(f"WQData responded {res.status} {res.reason}: {error}") from error
 
         return data
 
@@ -59,6 +336,68 @@ class DataLoader():
 
         return True
 
+    def check_errors(self, data: Dict) -> None:
+        """
+        Raise QuotaExceededError if the json response says the hourly limit is reached
+        (see find_errors)
+        """
+        if not self.find_errors(data):
+            raise QuotaExceededError(data["message"])
+
+    def check_listing(self, data: Dict, listing: str) -> None:
+        """
+        Raise QuotaExceededError if the json response says the hourly limit is reached
+        (see check_errors), or APIError if it is not the expected listing
+        (e.g. {"message": "Invalid API key"})
+        """
+        self.check_errors(data)
+        if listing not in data:
+            raise APIError(f"WQData responded without {listing}: {data.get('message', data)}")
+
+    def metadata_call(self, url: str, listing: str) -> Dict:
+        """
+        Call WQData API for a device or parameter listing, through self.metadata_cache:
+        a fresh cached response is used without calling the API, and a stale one is
+        validated with a conditional request when the API gave an ETag for it.
+        Only the responses that hold the listing are cached.
+
+        Arguments:
+        ----------
+        url (str): path and query of the call
+        listing (str): key of the listing in the response, "devices" or "parameters"
+
+        Raises:
+        ----------
+        QuotaExceededError: if the hourly limit is reached
+        APIError: if the response is not the listing
+        TransientError, APIError: if the call failed (see api_call)
+        """
+        if self.metadata_cache is None:
+            data = self.api_call(url=url)
+            self.check_listing(data, listing)
+            return data
+
+        key = MetadataCache.key(self.apiKey, url)
+        entry = self.metadata_cache.get(key)
+        if entry is not None and listing not in entry["data"]:
+            # an error response, cached before the listings were checked
+            entry = None
+        if entry is not None and self.metadata_cache.is_fresh(entry):
+            return entry["data"]
+
+        headers = None
+        if entry is not None and entry["etag"] is not None:
+            headers = {"If-None-Match": entry["etag"]}
+        data = self.api_call(url=url, headers=headers)
+        if data is None:
+            # 304 Not Modified
+            self.metadata_cache.touch(key)
+            return entry["data"]
+
+        self.check_listing(data, listing)
+        self.metadata_cache.put(key, data, self.etag)
+        return data
+
     def get_devices(self) -> Dict:
         """
         Get the list of devices for our project
@@ -66,14 +405,18 @@ class DataLoader():
         Returns:
         ----------
         devices (dict): {device_name: device_id}
+
+
+        Raises:
+        ----------
+        QuotaExceededError: if the hourly limit is reached
+        TransientError, APIError: if the call failed (see api_call)
         """
         if self.devices is None:
             devices = {}
-            data = self.api_call(url=f"/api/v1/devices?apiKey={self.apiKey}")
-            
-            # Check for errors
-            if not self.find_errors(data):
-                return None
+            # Checked for errors, and cached (see metadata_call)
+            data = self.metadata_call(url=f"/api/v1/devices?apiKey={self.apiKey}",
+                                      listing="devices")
 
             # If no errors, parse data
             for d in data["devices"]: 
@@ -81,7 +424,7 @@ class DataLoader():
                 device_name = d["name"].replace(" ", "_")
                 devices[device_name] = d["id"]
 
-        self.devices = devices
+            self.devices = devices
 
         return self.devices
 
@@ -90,6 +433,7 @@ class DataLoader():
         """
         Get valid parameters for device 
         Cache device parameters so we don't have to make this call again 
+        (in self.device_parameters, and on disk if there is a metadata_cache)
 
         Arguments:
         ----------
@@ -98,12 +442,17 @@ class DataLoader():
         Returns: 
         ----------
         parameters (dict): {parameter_name: (parameter_id, parameter_unit)}
+
+
+        Raises:
+        ----------
+        QuotaExceededError: if the hourly limit is reached
+        TransientError, APIError: if the call failed (see api_call)
         """
         parameters = {}
-        data = self.api_call(url=f"/api/v1/devices/{deviceId}/parameters?apiKey={self.apiKey}")
-        # Check for errors
-        if not self.find_errors(data):
-            return None
+        # Checked for errors, and cached (see metadata_call)
+        data = self.metadata_call(url=f"/api/v1/devices/{deviceId}/parameters?apiKey={self.apiKey}",
+                                  listing="parameters")
 
         # If no errors, parse data
         for d in data["parameters"]:
@@ -136,25 +485,20 @@ class DataLoader():
 
         Returns:
         ----------
-        data (pd.DataFrame): dataframe with columns "times" and "values" OR None if failed
+        data (pd.DataFrame): dataframe with columns "times" (datetime64) and "values" (float64),
+        see data_frame
 
+        Raises:
+        ----------
+        QuotaExceededError: if the hourly limit is reached
+        TransientError, APIError: if the call failed (see api_call)
+        APIError: if the response has no data (e.g. {"message": "Invalid API key"})
         """
-        try:
-            data = self.api_call(
-                url=f"/api/v1/devices/{deviceId}/parameters/{parameterId}/data?apiKey={self.apiKey}&from={start_date}%2000:00:01&to={end_date}%2000:00:00"
-            )
-            # Check for errors
-            if not self.find_errors(data):
-                return None
-
-            # If no errors, parse data
-            times, values = [], []
-            for d in data["data"]:
-                times.append(d["timestamp"])
-                values.append(d["value"])
-
-            return pd.DataFrame({"times": times, "values": values})
+        data = self.api_call(
+            url=f"/api/v1/devices/{deviceId}/parameters/{parameterId}/data?apiKey={self.apiKey}&from={start_date}%2000:00:01&to={end_date}%2000:00:00"
+        )
+        # Check for errors
+        self.check_listing(data, "data")
 
-        except Exception as e:
-            print(e)
-            return None
+        # If no errors, parse data
+        return data_frame(data["data"])
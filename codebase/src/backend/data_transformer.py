@@ -8,9 +8,31 @@ In an ideal world, this program gets run once per project. That way, all of the
 and can be stored on the users computer to run with the dashboard front end. 
 """
 import os
+import pathlib
+import importlib
+
 import pandas as pd
 
 
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='aggregation_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//aggregation.py"  # full path to the script
+    )
+aggregation_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aggregation_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+
 class DataTransformer():
     """
     This class can be used to aggregate and transform data from the user's computer. 
@@ -169,10 +191,12 @@ class DataTransformer():
 
         #cleaning functions:
         #changing the times to pandas datetime format
-        df["times"] = pd.to_datetime(df["times"])
+        df["times"] = schema_mod.to_datetime(df["times"])
         #changing the value column to numeric
         df["value"] = pd.to_numeric(df["value"], errors="coerce")
         df = df.dropna()
+        #the values are written as read (float64): they are converted to the schema
+        #types (schema.compact) when they are read back, not before they are written
         df = df.sort_values(by = "times")
         df.to_csv(f"{self.processed_path}/{project}/{device_name}/tidy_all_data.csv", index=False)
 
@@ -200,6 +224,7 @@ class DataTransformer():
     def downsample_hour(self, df: pd.DataFrame, device_name: str, project: str) -> None:
         """
         This function will downsample the data to 1 hour intervals.
+        Every hour gets the mean, std, count, quantiles and first/last timestamp of its values.
 
         Arguments:
         df (pd.DataFrame): the dataframe (tidy_all_data.csv) that you want to aggregate data for.
@@ -216,20 +241,11 @@ class DataTransformer():
         hourly_df = pd.DataFrame()
 
         ## is this doubled up in another function?
-        df["times"] = pd.to_datetime(df["times"])
-
-        #set the times column as the index
-        df.set_index("times", inplace=True)
+        df["times"] = schema_mod.to_datetime(df["times"])
 
         #groupby the parameter and units, then resample the data to 1 hour intervals
-        hourly_df = df.groupby(["parameter", "Units"]).resample("H").agg({"value": ["mean", "std"]})
-
-        #reset the index
-        hourly_df.reset_index(inplace=True)
-
-        #combine multiindex columns into one column
-        hourly_df.columns = [col[0] if col[1] == ''
-                             else f"{col[0]}_{col[1]}" for col in hourly_df.columns]
+        #(mean, std, count, quantiles and first/last timestamp, see aggregation.summarize)
+        hourly_df = aggregation_mod.summarize(df, "H", ["parameter", "Units"])
 
         #save the data to a csv file
         path = f"{self.processed_path}/{project}/{device_name}"
@@ -238,23 +254,15 @@ class DataTransformer():
     def downsample_day(self, df: pd.DataFrame, device_name: str, project: str) -> None:
         """
         This function will downsample the data to 1 day intervals.
+        Every day gets the mean, std, count, quantiles and first/last timestamp of its values.
         """
         daily_df = pd.DataFrame()
         #is this doubled up in another function?
-        df["times"] = pd.to_datetime(df["times"])
-
-        #set the times column as the index
-        df.set_index("times", inplace=True)
+        df["times"] = schema_mod.to_datetime(df["times"])
 
         #groupby the parameter and units, then resample the data to 1 day intervals
-        daily_df = df.groupby(["parameter", "Units"]).resample("D").agg({"value": ["mean", "std"]})
-
-        #reset the index
-        daily_df.reset_index(inplace=True)
-
-        #combine multiindex columns into one column
-        daily_df.columns = [col[0] if col[1] == ''
-                            else f"{col[0]}_{col[1]}" for col in daily_df.columns]
+        #(mean, std, count, quantiles and first/last timestamp, see aggregation.summarize)
+        daily_df = aggregation_mod.summarize(df, "D", ["parameter", "Units"])
 
         #save the data to a csv file
         path = f"{self.processed_path}/{project}/{device_name}"
@@ -269,7 +277,8 @@ class DataTransformer():
         # call tidy_data_transform
 
         for device in self.devices:
-            df = pd.read_csv(f"{self.processed_path}/{project}/{device}/tidy_all_data.csv")
+            df = schema_mod.read_csv(
+                f"{self.processed_path}/{project}/{device}/tidy_all_data.csv")
             self.downsample_hour(df, device, project)
 
     def device_downsample_day(self, project: str) -> None:
@@ -281,5 +290,6 @@ class DataTransformer():
 
         for device in self.devices:
             if device != "test_device":
-                df = pd.read_csv(f"{self.processed_path}/{project}/{device}/tidy_all_data.csv")
+                df = schema_mod.read_csv(
+                    f"{self.processed_path}/{project}/{device}/tidy_all_data.csv")
                 self.downsample_day(df, device, project)
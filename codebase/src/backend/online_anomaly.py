@@ -0,0 +1,202 @@
+"""
+This file defines an OnlineAnomalyDetector class, which scores new readings as the data
+loader downloads them, instead of recomputing anomalies over the whole history.
+
+For every (device, parameter) series it keeps:
+1) a seasonal baseline: an exponentially weighted mean of the readings for each hour of the day
+2) the residuals (reading - baseline) of the last `window` readings, for the IQR bands
+3) the time of the last reading it scored, so a chunk that is downloaded twice is only scored once
+
+A new reading is an anomaly when its residual is outside the IQR bands of the previous
+residuals: q1 - k * iqr and q3 + k * iqr, with k = 0.15 / iqr_alpha like the anomaly engines. Anomalies only move the baseline
+as far as the band edge, so a failed sensor does not become the new normal.
+The state is saved to a json file between runs of the loader.
+"""
+
+import json
+import os
+import pathlib
+import importlib
+import tempfile
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+
+# Number of phases of the seasonal baseline (hours of the day)
+PHASES = 24
+
+
+def iqr_limits(residuals: np.ndarray, alpha: float) -> tuple:
+    """
+    Lower and upper limits of the residuals: q1 - k * iqr and q3 + k * iqr,
+    with k = 0.15 / alpha (the band width of the anomaly engines).
+    """
+    q1, q3 = np.percentile(residuals, [25, 75])
+    margin = (0.15 / alpha) * (q3 - q1)
+    return q1 - margin, q3 + margin
+
+
+class OnlineAnomalyDetector():
+    """
+    This class is used to score new readings for anomalies one download at a time.
+    1) Load the saved state via load_state (no-op if there is none yet)
+    2) Call update with every new chunk of data, it returns the scored chunk
+    3) Save the state via save_state so the next run continues from it
+    """
+
+    def __init__(self,
+                 window: int = config_combine_mod.ONLINE_ANOMALY_PARAMETERS["window"],
+                 iqr_alpha: float = config_combine_mod.ONLINE_ANOMALY_PARAMETERS["iqr_alpha"],
+                 smoothing: float = config_combine_mod.ONLINE_ANOMALY_PARAMETERS["smoothing"],
+                 min_history: int = config_combine_mod.ONLINE_ANOMALY_PARAMETERS["min_history"]):
+        """
+        Arguments:
+        ----------
+        window (int): number of recent residuals the IQR bands are calculated from
+        iqr_alpha (float): significance level of the IQR bands (lower means wider bands)
+        smoothing (float): weight of a new reading in its hour-of-day baseline
+        min_history (int): readings needed before a series is scored
+        """
+        self.window = window
+        self.iqr_alpha = iqr_alpha
+        self.smoothing = smoothing
+        self.min_history = min_history
+        self.state = {}
+
+    def load_state(self, path: str) -> None:
+        """
+        Load the state saved by save_state. Nothing happens if the file does not exist yet.
+
+        Arguments:
+        ----------
+        path (str): path to the json state file
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            self.state = json.load(f)
+
+    def save_state(self, path: str) -> None:
+        """
+        Save the state of every series to a json file. The file is replaced in one step
+        (through a temporary file in the same directory), so a crash while saving leaves
+        the previous state intact. The temporary file gets the usual permissions
+        (schema.FILE_MODE) before the rename.
+
+        Arguments:
+        ----------
+        path (str): path to the json state file
+        """
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                              prefix=os.path.basename(path) + ".",
+                                              suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.state, f)
+            os.chmod(temporary_path, schema_mod.FILE_MODE)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def _series_state(self, device: str, parameter: str) -> dict:
+        """
+        State of one series, created empty the first time the series is seen.
+        """
+        key = f"{device}/{parameter}"
+        if key not in self.state:
+            self.state[key] = {
+                "baseline": [None] * PHASES,
+                "residuals": [],
+                "count": 0,
+                "last_time": None,
+            }
+        return self.state[key]
+
+    def update(self, device: str, parameter: str, data: pd.DataFrame,
+               value_column: str = "values") -> pd.DataFrame:
+        """
+        Score a new chunk of one series and update its state.
+
+        Arguments:
+        ----------
+        device (str): name of the device
+        parameter (str): name of the parameter
+        data (pd.DataFrame): new data with a "times" column and a value column
+        value_column (str): name of the value column, "values" for DataLoader.get_data output
+
+        Returns:
+        ----------
+        scored (pd.DataFrame): the readings that were not scored before, with "times",
+            "value", "baseline", "residual", "lower", "upper" and "anomaly" ("Yes"/"No") columns.
+            lower/upper/anomaly are missing while the series has fewer than min_history readings.
+        """
+        series_state = self._series_state(device, parameter)
+
+        times = schema_mod.to_datetime(data["times"])
+        values = pd.to_numeric(data[value_column], errors="coerce")
+        new = values.notna().to_numpy()
+        if series_state["last_time"] is not None:
+            new &= (times > pd.Timestamp(series_state["last_time"])).to_numpy()
+        times = times[new].to_numpy()
+        values = values[new].to_numpy(dtype=float)
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+
+        baseline = series_state["baseline"]
+        residuals = deque(series_state["residuals"], maxlen=self.window)
+        hours = pd.DatetimeIndex(times).hour.to_numpy()
+        n = len(values)
+        scored = {key: np.full(n, np.nan) for key in ["baseline", "residual", "lower", "upper"]}
+        anomaly = np.full(n, None, dtype=object)
+
+        for i in range(n):
+            hour, value = hours[i], values[i]
+            if baseline[hour] is None:
+                baseline[hour] = value
+            residual = value - baseline[hour]
+            update_value = value
+
+            if series_state["count"] >= self.min_history and len(residuals) > 0:
+                lower, upper = iqr_limits(np.asarray(residuals), self.iqr_alpha)
+                scored["lower"][i], scored["upper"][i] = lower, upper
+                is_anomaly = residual < lower or residual > upper
+                anomaly[i] = "Yes" if is_anomaly else "No"
+                if is_anomaly:
+                    # only move the baseline and bands as far as the band edge
+                    residual_clipped = min(max(residual, lower), upper)
+                    update_value = baseline[hour] + residual_clipped
+                    residual = residual_clipped
+
+            scored["baseline"][i] = baseline[hour]
+            scored["residual"][i] = value - baseline[hour]
+            residuals.append(float(residual))
+            baseline[hour] = float(baseline[hour] + self.smoothing * (update_value - baseline[hour]))
+            series_state["count"] += 1
+
+        series_state["residuals"] = list(residuals)
+        if n > 0:
+            series_state["last_time"] = str(pd.Timestamp(times[-1]))
+
+        return pd.DataFrame({"times": times, "value": values, **scored, "anomaly": anomaly})
@@ -0,0 +1,265 @@
+"""
+Out-of-core execution backend of data_combiner and of the parser of run_data_transformer,
+used when config_combine.BACKEND is "polars".
+
+The pandas backend reads all the files of a location into memory, concatenates them and
+sorts them. This backend builds Polars lazy queries instead, which the streaming engine runs
+in batches: the csv files are scanned, the gross outliers are filtered out as the rows are
+read, and the rows are written to Parquet files partitioned by year. Each year is then read
+on its own (a filter on the year only opens the files of that year), its overlapping rows
+are combined and its rows sorted, and it is appended to the combined csv file. The memory
+used depends on the size of a year of a location, not on the size of all the data.
+
+The overlapping rows (the same time, parameter and Units in several sources) are combined
+by DataCombiner.resolve_overlaps, so both backends combine them the same way, and write
+the same values to the same files, one per location and resolution, which is how the
+dashboard reads them. The Arrow copy of a combined csv file is not written here, since it
+would need all the data of the location in memory: the dashboard writes it the first time
+it reads the file (see schema.read_combined).
+"""
+
+import os
+import pathlib
+import importlib
+import tempfile
+
+import polars as pl
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+
+# Polars types of the schema types (see schema.DTYPES). The categoricals are read as
+# strings, since the categories of the sources differ.
+TYPES = {
+    "category": pl.String,
+    "float32": pl.Float32,
+    "float64": pl.Float64,
+    "int32": pl.Int32,
+}
+
+# schema.TIME_FORMATS in the format of Polars: ISO 8601 (WQData and the files written
+# by pandas), then iChart exports (m/d/y)
+TIME_FORMATS = ["%Y-%m-%d %H:%M:%S%.f", "%Y-%m-%dT%H:%M:%S%.f", "%Y-%m-%d",
+                "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y"]
+
+# Formats of the times in the combined csv files, as pandas writes them
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Columns that identify a row of the combined data of a location
+KEYS = ["times", "parameter", "Units"]
+
+# Rows per row group of the yearly Parquet partitions of combine. The writer of every year
+# holds a row group in memory until it is full, so this bounds the memory of the partitioning.
+ROW_GROUP_SIZE = 10_000
+
+
+def to_datetime(column: str) -> pl.Expr:
+    """
+    Parse a column of text times, in any of TIME_FORMATS (the first one that fits each time).
+
+    Arguments:
+    column (str): name of the column
+
+    Returns:
+    times (pl.Expr): the Datetime column
+    """
+    return pl.coalesce([pl.col(column).str.strptime(pl.Datetime("ns"), time_format, strict=False)
+                        for time_format in TIME_FORMATS])
+
+
+def scan_tidy(path: str, keep_floats: bool = False) -> pl.LazyFrame:
+    """
+    Scan a tidy csv file with the schema types (see schema.read_csv). Only the header
+    is read here, the rows are read by the query that uses the scan.
+
+    Arguments:
+    path (str): path to the csv file
+    keep_floats (bool): scan the float columns as Float64 rather than their schema types,
+        for data that is written back to csv
+
+    Returns:
+    lf (pl.LazyFrame)
+    """
+    # every column is read as text, then converted to its type
+    lf = pl.scan_csv(path, infer_schema=False)
+    columns = lf.collect_schema().names()
+    types = [pl.col(column).cast(pl.Float64 if keep_floats and dtype.startswith("float")
+                                 else TYPES[dtype])
+             for column, dtype in schema_mod.DTYPES.items() if column in columns]
+    times = [to_datetime(column) for column in schema_mod.TIME_COLUMNS if column in columns]
+    return lf.with_columns(types + times)
+
+
+def rename_parameters(names: dict) -> pl.Expr:
+    """
+    Standardize the parameter names (see config_combine.PARAMETER_NAMES).
+    A chain of when/then rather than Expr.replace, which holds all the data in memory
+    instead of streaming it.
+
+    Arguments:
+    names (dict): {name: standard name}
+
+    Returns:
+    parameter (pl.Expr): the "parameter" column
+    """
+    parameter = pl.col("parameter")
+    for name, standard_name in names.items():
+        parameter = pl.when(pl.col("parameter") == name).then(pl.lit(standard_name)) \
+            .otherwise(parameter)
+    return parameter
+
+
+def is_outlier(bounds: dict) -> pl.Expr:
+    """
+    Gross outliers: rows of a parameter with a value_mean out of its bounds
+    (see config_combine.OUTLIER_BOUNDS). Rows without a value_mean are not outliers.
+
+    Arguments:
+    bounds (dict): {parameter: (low, high)}, None for no bound
+
+    Returns:
+    outlier (pl.Expr): boolean column
+    """
+    outlier = pl.lit(False)
+    for parameter, (low, high) in bounds.items():
+        out_of_bounds = pl.lit(False)
+        if low is not None:
+            out_of_bounds = out_of_bounds | (pl.col("value_mean") < low)
+        if high is not None:
+            out_of_bounds = out_of_bounds | (pl.col("value_mean") > high)
+        outlier = outlier | ((pl.col("parameter") == parameter) & out_of_bounds.fill_null(False))
+    return outlier
+
+
+def partition_rows(df: pl.DataFrame, columns: list, resolve_overlaps) -> pl.DataFrame:
+    """
+    Combine the overlapping rows of a partition of the data (e.g. a year) and sort the rows.
+
+    Arguments:
+    df (pl.DataFrame): rows of the sources, with their "source", "position" and "row"
+    columns (list): columns of the output
+    resolve_overlaps: DataCombiner.resolve_overlaps
+
+    Returns:
+    rows (pl.DataFrame): one row per time, parameter and Units, sorted by them
+    """
+    overlapping = df.select(pl.len().over(KEYS) > 1).to_series()
+    rows = df.filter(~overlapping).select(columns)
+    if overlapping.any():
+        # in the order of the pandas backend (sources in order, then rows in order)
+        overlaps = df.filter(overlapping).sort(["position", "row"])
+        resolved = resolve_overlaps(overlaps.select(columns + ["source"]).to_pandas()
+                                    .set_index("times")).reset_index()
+        resolved = pl.from_pandas(resolved[columns]).cast(rows.schema)
+        rows = pl.concat([rows, resolved])
+    return rows.sort(KEYS)
+
+
+def combine(paths: dict, location: str, resolution: str, csv_path: str,
+            resolve_overlaps) -> None:
+    """
+    Combine the tidy data of the sources of a location into one csv file, like
+    DataCombiner.combine_daily and combine_hourly: the parameter names are standardized
+    (config_combine.PARAMETER_NAMES), the gross outliers are removed
+    (config_combine.OUTLIER_BOUNDS), the overlapping rows of the sources are combined,
+    and the rows are sorted by time, parameter and Units.
+
+    The sources are streamed once into Parquet files partitioned by year, in a temporary
+    directory next to the csv file. Then the years are read one at a time, combined
+    (partition_rows) and appended to the csv file, so at most one year of the location
+    is in memory.
+
+    Arguments:
+    paths (dict): {source: path of its tidy csv file}, in the order of config_combine.SOURCES
+    location (str): name of the location (the "location" column)
+    resolution (str): "daily" or "hourly"
+    csv_path (str): path of the combined csv file
+    resolve_overlaps: DataCombiner.resolve_overlaps, which combines the overlapping rows
+        (a pandas dataframe indexed by "times", with their "source")
+
+    Returns:
+    No returns, but writes the csv file (and removes its outdated Arrow copy).
+    """
+    sources = []
+    for position, (source, path) in enumerate(paths.items()):
+        # the position and row number keep the order of the pandas backend for the overlaps
+        sources.append(scan_tidy(path, keep_floats=True).with_row_index("row").with_columns(
+            source=pl.lit(source), position=pl.lit(position)))
+    lf = pl.concat(sources, how="diagonal_relaxed")
+    lf = lf.with_columns(
+        parameter=rename_parameters(config_combine_mod.PARAMETER_NAMES),
+        location=pl.lit(location),
+        year=pl.col("times").dt.year(),
+    ).filter(~is_outlier(config_combine_mod.OUTLIER_BOUNDS[resolution]))
+
+    # columns of the output: the times, the columns of the sources in order of appearance
+    # (as pd.concat gives them), and the location
+    columns = ["times"]
+    for source in sources:
+        columns += [column for column in source.collect_schema().names()
+                    if column not in columns + ["row", "source", "position"]]
+    columns.append("location")
+
+    time_format = DATE_FORMAT if resolution == "daily" else DATETIME_FORMAT
+    floats = [column for column, dtype in lf.collect_schema().items()
+              if column in columns and dtype.is_float()]
+    # pandas writes missing floats as empty fields, not NaN
+    formats = [pl.col(column).fill_nan(None) for column in floats] + \
+        [pl.col("times").dt.strftime(time_format)]
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(csv_path)) as directory:
+        lf.sink_parquet(pl.PartitionBy(directory, key="year"), mkdir=True,
+                        row_group_size=ROW_GROUP_SIZE)
+        partitions = pl.scan_parquet(directory, hive_partitioning=True)
+        # rows without a time (year null) first, as they are sorted
+        years = partitions.select("year").unique().sort("year").collect()["year"].to_list()
+        with open(csv_path, "w") as f:
+            for index, year in enumerate(years):
+                df = partitions.filter(pl.col("year").eq_missing(year)).collect()
+                rows = partition_rows(df, columns, resolve_overlaps).with_columns(formats)
+                rows.write_csv(f, include_header=index == 0, datetime_format=DATETIME_FORMAT)
+            if not years:
+                f.write(",".join(columns) + "\n")
+
+    if os.path.exists(schema_mod.arrow_path(csv_path)):
+        os.remove(schema_mod.arrow_path(csv_path))
+
+
+def concat_csv(paths: list, csv_path: str) -> None:
+    """
+    Concatenate csv files into one, streaming through them (see DataWrangler.parser).
+    The fields are copied as text, and the columns that are missing from some files
+    are left empty.
+
+    Arguments:
+    paths (list): paths of the csv files
+    csv_path (str): path of the concatenated csv file
+
+    Returns:
+    No returns, but writes the csv file.
+    """
+    if not paths:
+        pl.DataFrame().write_csv(csv_path)
+        return
+    lf = pl.concat([pl.scan_csv(path, infer_schema=False) for path in paths], how="diagonal")
+    lf.sink_csv(csv_path)
@@ -8,10 +8,176 @@ need to jump through a ton of hoops to get the data into a csv file that
 could be read.
 """
 
+import csv
+import itertools
 import os
+import pathlib
+import importlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
 
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+# Layout of the iChart exports: a line of device names, a line of statistics ("Avg"),
+# a line of parameter names and a line of units, then one line per time.
+ICHART_HEADER_LINES = 4
+# The iChart data program was so old and janky that it did not use N/A or NaN.
+ICHART_NA_VALUES = ["-Invalid-"]
+ICHART_TIME_FORMAT = "%m/%d/%Y %H:%M"
+
+
+def ichart_labels(names: list) -> list:
+    """
+    Unique labels of the columns of an iChart export, in the way pandas names repeated
+    columns: the second "Bat_V" is "Bat_V.1", and so on.
+
+    Arguments:
+    names (list): column names of the export
+
+    Returns:
+    labels (list)
+    """
+    counts = {}
+    labels = []
+    for name in names:
+        labels.append(f"{name}.{counts[name]}" if name in counts else name)
+        counts[name] = counts.get(name, 0) + 1
+    return labels
+
+
+def read_ichart(path: str) -> tuple:
+    """
+    Read an iChart export. The header is parsed once, into "<parameter>_<unit>" column names
+    (e.g. "AirTemp_F"), the times are parsed with ICHART_TIME_FORMAT, and "-Invalid-"
+    is NaN. The values are kept as their text, so they are written as they were exported
+    (e.g. "58", not "58.0"). A parameter that appears twice (e.g. the batteries of two
+    loggers, "Bat_V") keeps both its columns, labelled as pandas does ("Bat_V.1").
+
+    Arguments:
+    path (str): path to the csv file exported by iChart
+
+    Returns:
+    df (pd.DataFrame): "times" column (datetime) and one text column per parameter
+    names (dict): {label: column name}, the names of the columns in the export
+    """
+    with open(path, encoding="latin-1", newline="") as file:
+        header = list(itertools.islice(csv.reader(file), ICHART_HEADER_LINES))
+    names = ["times"] + [f"{name}_{unit}" for name, unit in zip(header[2], header[3])][1:]
+    labels = ichart_labels(names)
+
+    df = pd.read_csv(path, encoding="latin-1", skiprows=ICHART_HEADER_LINES, header=None,
+                     names=labels, dtype=str, na_values=ICHART_NA_VALUES)
+    df["times"] = schema_mod.to_datetime(df["times"], ICHART_TIME_FORMAT)
+    return df, dict(zip(labels, names))
+
+
+def pivot_parameter(df: pd.DataFrame) -> tuple:
+    """
+    Pivot the by-parameter data of one parameter ("times", "parameter" and "value" columns)
+    to one row per time, with the value column named after the parameter and its unit
+    in a "Units" column. The first row of a repeated time is kept.
+
+    Arguments:
+    df (pd.DataFrame): by-parameter data, with parameters named "<parameter>_<unit>"
+
+    Returns:
+    name (str): name of the parameter without its unit (e.g. "AirTemp")
+    pivot_df (pd.DataFrame): pivot data indexed by "times"
+    """
+    df = df.dropna(subset=["times"]).drop_duplicates("times")
+    # Assuming the format is "parameter_unit"
+    column_name_parts = df["parameter"].iloc[0].split("_")
+    name, unit = column_name_parts[0], column_name_parts[1]
+    # the text values of read_ichart are parsed as pd.read_csv would parse them
+    # (integers stay integers)
+    values = pd.to_numeric(df["value"], errors="coerce")
+    pivot_df = pd.DataFrame({name: values.to_numpy(), "Units": unit},
+                            index=pd.Index(df["times"].to_numpy(), name="times"))
+    if not pivot_df.index.is_monotonic_increasing:
+        pivot_df = pivot_df.sort_index(kind="stable")
+    return name, pivot_df
+
+
+def transform_device(raw_path: str, processed_path: str, device: str) -> None:
+    """
+    Transform the iChart exports of one device (see OldDataTransformer.transform).
+    Defined at module level so it can be sent to the worker processes.
+
+    Arguments:
+    raw_path (str): path to the raw iChart data
+    processed_path (str): path to the processed data
+    device (str): the device name that is being transformed.
+
+    Returns:
+    No returns, but writes the by-parameter and pivot csv files of every parameter
+    and the all_data csv file of the device.
+    """
+    dfs = []
+    names = {}
+    for filename in sorted(os.listdir(f"{raw_path}/{device}")):
+        if filename.endswith(".csv"):
+            df, file_names = read_ichart(os.path.join(raw_path, device, filename))
+            dfs.append(df)
+            names.update(file_names)
+
+    # The exports of a device are not in time order (nor always are their rows), so they
+    # are concatenated and sorted once, rather than streamed to the output files.
+    merged_df = pd.concat(dfs, ignore_index=True)
+    merged_df = merged_df.sort_values(by="times", kind="stable", ignore_index=True)
+
+    # The times are formatted once (as to_csv would), and every file written below
+    # reuses the text instead of formatting them again.
+    times = merged_df["times"].dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    os.makedirs(f"{raw_path}/by_parameter/{device}", exist_ok=True)
+    os.makedirs(f"{raw_path}/pivot/{device}", exist_ok=True)
+    # one by-parameter file and one pivot file per parameter (the first column of a
+    # repeated parameter). The pivot is made from the by-parameter data in memory,
+    # instead of reading the file back (format_pivot).
+    parameters = {}
+    for label in merged_df.columns[1:]:
+        parameters.setdefault(names[label], label)
+    for parameter, label in parameters.items():
+        df = pd.DataFrame({"times": times,
+                           "parameter": parameter,
+                           "value": merged_df[label]})
+
+        # changing the parameter name so we could use it in the filename.
+        file_parameter = parameter.replace("/", "%per%")
+        filepath = f"{raw_path}/by_parameter/{device}/{file_parameter}.csv"
+        try:
+            df.to_csv(filepath, index=False)
+            name, pivot_df = pivot_parameter(df)
+            pivot_df.to_csv(f"{raw_path}/pivot/{device}/{name}_pivot.csv")
+            print(f"File '{device}_{file_parameter}.csv' successfully saved.")
+        except Exception as e:
+            print(f"Error saving file '{device}_{file_parameter}.csv': {e}")
+
+    # every column of the exports, under its name in the exports
+    merged_df.assign(times=times).to_csv(f"{processed_path}/{device}_all_data.csv",
+                                         index=False,
+                                         header=[names[label] for label in merged_df.columns])
+
 
 class OldDataTransformer():
     """
@@ -25,8 +191,8 @@ class OldDataTransformer():
     """
 
     def __init__(self) -> None:
-        # hardcoded device names for the iChart data.
-        self.device_id = ["TREC_Tower", "Beach6_Buoy", "Beach2_Tower", "Beach2_Buoy"]
+        # device names of the iChart data, from the site registry (config_combine.SITES)
+        self.device_id = list(config_combine_mod.ICHART_DEVICES)
         self.raw_path = ""
         self.processed_path = ""
 
@@ -55,65 +221,42 @@ class OldDataTransformer():
         device(str) -- the device name that is being transformed.
         
         Returns:
-        no returns, but creates a csv file for each device
+        no returns, but creates a by-parameter and a pivot csv file for each parameter,
+        and a csv file for each device
         
         Raises:
         -------
         """
 
-        df = pd.DataFrame()
-        dfs = []
-
-        for filename in os.listdir(f"{self.raw_path}/{device}"):
-            if filename.endswith(".csv"):
-                
-                df = pd.read_csv(os.path.join(self.raw_path, device, filename), encoding='latin-1')
-
-                # standardizing column names for use
-                new_columns = df.iloc[1] + "_" + df.iloc[2].fillna("")
-                df.columns = new_columns
-                # hardcoded droping of extra headers and whitespace that came with downloading
-                # and using the iChart data.
-                df = df.drop([0,1,2])
-                df.reset_index(drop = True, inplace=True)
-
-                # The iChart data program was so old and janky that it did not use N/A or NaN.
-                df.replace("-Invalid-", pd.NA, inplace=True)
-                df = df.set_index(df.columns[0]).reset_index()
-                dfs.append(df)
-
-        merged_df = pd.concat(dfs, ignore_index=True)
-        # adjusting columns again.
-        merged_df = merged_df.rename(columns={"Date/Time_m/d/y": "times"})
-        merged_df["times"] = pd.to_datetime(merged_df["times"])
-        merged_df = merged_df.sort_values(by="times")
-
-
-        # adjusting column names again
-        for parameter in merged_df.columns[1:]:
-            df = merged_df[["times", parameter]]
-            df = df.rename(columns={parameter: "value"})
-            df["parameter"] = parameter
-            df = df[["times", "parameter", "value"]]
-
-            # changing the parameter name so we could use it in the filename.
-            parameter = parameter.replace("/", "%per%")
-            filepath = f"{self.raw_path}/by_parameter/{device}/{parameter}.csv"
-            try:
-                df.to_csv(filepath, index=False)
-                print(f"File '{device}_{parameter}.csv' successfully saved.")
-            except Exception as e:
-                print(f"Error saving file '{device}_{parameter}.csv': {e}")
-
-        merged_df.to_csv(f"{self.processed_path}/{device}_all_data.csv", index=False)
-
-
-    def device_transform(self) -> None:
+        transform_device(self.raw_path, self.processed_path, device)
+
+
+    def device_transform(self, max_workers: int = None) -> None:
         """
-        Iterating through all the devices.
+        Transform all the devices, in parallel (one worker process per device).
+
+        The worker processes find transform_device by the name of this module, so they
+        can only run it when the module is in sys.modules: run as a script, or imported
+        by name (with the "spawn" start method, it must also be importable by that name).
+        When it was loaded by path without being registered (spec_from_file_location),
+        the devices are transformed one after the other in this process.
+
+        Arguments:
+        max_workers (int): number of worker processes, defaults to the number of CPUs.
         """
-        for device in self.device_id:
-            self.transform(device)
+        if sys.modules.get(__name__) is None:
+            for device in self.device_id:
+                transform_device(self.raw_path, self.processed_path, device)
+                print("Transformed ", device)
+            return
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {device: executor.submit(transform_device,
+                                               self.raw_path, self.processed_path, device)
+                       for device in self.device_id}
+            for device, future in futures.items():
+                future.result()
+                print("Transformed ", device)
 
 
     def format_pivot(self,device: str, parameter_id: str) -> None:
@@ -124,24 +267,11 @@ class OldDataTransformer():
         """
         path = f"{self.raw_path}/by_parameter/{device}/{parameter_id}.csv"
         df = pd.read_csv(path , encoding='latin-1')
-        df['times'] = df['times'].drop_duplicates()
-        df.drop_duplicates("times", inplace=True)
-        df.dropna(subset=["times"], inplace=True)
-        df.reset_index(inplace=True)
 
         try:
-            df = df.pivot(index="times", columns="parameter", values="value")
-
-            column_name_parts = df.columns.str.split('_')
-            # Assuming the format is "parameter_unit"
-            unit = column_name_parts[0][1]
-            #Create a new column with the extracted unit in every cell
-            df['Units'] = unit
-            parameter_column = df.columns[0]
-            df = df.rename(columns={parameter_column: f"{column_name_parts[0][0]}"})
-
+            name, df = pivot_parameter(df)
             pivot_path = f"{self.raw_path}/pivot/{device}"
-            df.to_csv(os.path.join(pivot_path, f"{column_name_parts[0][0]}_pivot.csv"))
+            df.to_csv(os.path.join(pivot_path, f"{name}_pivot.csv"))
         except Exception as e:
             print(f"Error saving file '{device}_{parameter_id}.csv': {e}")
 
@@ -150,6 +280,8 @@ class OldDataTransformer():
     def pivot_devices(self) -> None:
         """
         Iterates through all the devices.
+        transform already writes the pivot files, so this is only needed for
+        by-parameter files written before it did.
         """
         for device in self.device_id:
             for filename in os.listdir(f"{self.raw_path}/by_parameter/{device}"):
@@ -158,5 +290,10 @@ class OldDataTransformer():
 
 
 OldDataTransformer = OldDataTransformer()
-# OldDataTransformer.device_transform()
-# OldDataTransformer.pivot_devices()
+
+# Only when run as a script, so the module can be imported (tests) without transforming
+# the data in ../../data/raw, and so the worker processes of device_transform can import
+# it without transforming the data again. device_transform also writes the pivot files.
+if __name__ == "__main__":
+    OldDataTransformer.set_path()
+    OldDataTransformer.device_transform()
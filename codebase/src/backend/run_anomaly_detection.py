@@ -0,0 +1,194 @@
+"""
+This script runs after data_combiner. It precomputes anomalies for every location,
+parameter and frequency in data/processed/combined, so the Advanced Statistics page
+can read them instead of running pytimetk.anomalize while the user waits.
+
+The anomalize settings are the same defaults used by the dashboard (ANOMALY_PARAMETERS
+in config_combine.py). Each (location, parameter, frequency) series is independent, so
+they are spread across worker processes. The results are written next to the combined
+data as "<frequency>_anomalies.csv".
+
+Ideally, this script is run (e.g. overnight) any time the combined data is rebuilt.
+"""
+
+import os
+import pathlib
+import importlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytimetk
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+
+# columns of the anomalize output that the dashboard plots need
+ANOMALY_COLUMNS = ["times", "observed", "seasonal", "seasadj", "trend", "remainder",
+                   "anomaly", "anomaly_score", "anomaly_direction",
+                   "recomposed_l1", "recomposed_l2", "observed_clean"]
+
+
+def anomalize_parameter(df: pd.DataFrame,
+                        parameter: str,
+                        period: int,
+                        iqr_alpha: float,
+                        clean_alpha: float) -> pd.DataFrame:
+    """
+    Run pytimetk.anomalize on the series of one parameter at one location.
+    This is the same calculation as anomaly.create_anomaly_graph in the frontend.
+    Defined at module level so it can be sent to the worker processes.
+
+    Arguments:
+    df (pd.DataFrame): combined data with "times" and "value_mean" columns for one parameter
+    parameter (str): name of the parameter, added to the output
+    period, iqr_alpha, clean_alpha: anomalize settings
+
+    Returns:
+    anomalize output with a "parameter" column, empty if the series is not longer than period
+
+    Raises:
+    Any error of pytimetk.anomalize, so the caller knows which series failed
+    """
+    df = df.dropna(subset=["value_mean"])
+    # overlapping sources can repeat a timestamp; anomalize needs one value per time
+    df = df.groupby("times", as_index=False)["value_mean"].mean()
+    if len(df) <= period:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS + ["parameter"])
+    anomalize_df = pytimetk.anomalize(
+        data=df,
+        date_column="times",
+        value_column="value_mean",
+        period=period,
+        iqr_alpha=iqr_alpha,
+        clean_alpha=clean_alpha,
+        clean="min_max"
+    )
+
+    anomalize_df = anomalize_df[ANOMALY_COLUMNS].copy()
+    anomalize_df["parameter"] = parameter
+    return anomalize_df
+
+
+class AnomalyDetector():
+    """
+    This class is used to precompute anomalies for all of the combined data.
+    1) Specify the path to the processed data via set_path
+    2) Optionally restrict the locations (set_map) or frequencies (set_frequencies)
+    3) Run run_all to write "<frequency>_anomalies.csv" for every location
+    """
+
+    def __init__(self):
+        """
+        Initialize the AnomalyDetector class.
+        """
+        self.dir = ""
+        self.map = {}
+        self.frequencies = []
+        self.parameters = dict(config_combine_mod.ANOMALY_PARAMETERS)
+
+    def set_path(self, path: str = "../../data/processed"):
+        """
+        Set the path to the processed data directory (which contains combined/).
+
+        Parameters
+        path : str (the path to the data directory).
+        """
+        self.dir = path
+
+    def set_map(self, map: dict = config_combine_mod.COMBINE_MAP):
+        """
+        Set the locations to run. Only the keys of the map are used.
+
+        Parameters
+        map : dict (the combine map, see config_combine.py).
+        """
+        self.map = map
+
+    def set_frequencies(self, frequencies: list = config_combine_mod.FREQUENCIES):
+        """
+        Set the data frequencies to run.
+
+        Parameters
+        frequencies : list (e.g. ["hourly", "daily"]).
+        """
+        self.frequencies = frequencies
+
+    def run_all(self, max_workers: int = None) -> None:
+        """
+        Detect anomalies for every location x parameter x frequency in parallel and
+        write the results next to the combined data.
+
+        Arguments:
+        max_workers (int): number of worker processes, defaults to the number of CPUs.
+
+        Returns:
+        No returns, but writes "<frequency>_anomalies.csv" to every combined location directory.
+
+        Raises:
+        RuntimeError: if some series failed. They are logged, and the anomalies of the
+            other series are still written.
+        """
+        failed = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for name in self.map:
+                for frequency in self.frequencies:
+                    path = f"{self.dir}/combined/{name}/{frequency}_data.csv"
+                    if not os.path.exists(path):
+                        continue
+                    df = pd.read_csv(path, usecols=["times", "parameter", "value_mean"])
+                    df["times"] = schema_mod.to_datetime(df["times"])
+                    futures[(name, frequency)] = {
+                        parameter: executor.submit(anomalize_parameter,
+                                                   df_parameter,
+                                                   parameter,
+                                                   **self.parameters)
+                        for parameter, df_parameter in df.groupby("parameter")
+                    }
+
+            for (name, frequency), parameter_futures in futures.items():
+                results = []
+                for parameter, future in parameter_futures.items():
+                    try:
+                        results.append(future.result())
+                    except Exception:
+                        logging.exception("Anomaly detection failed for %s %s %s",
+                                          name, frequency, parameter)
+                        failed.append((name, frequency, parameter))
+                anomalies_df = pd.concat(results, ignore_index=True) if results else \
+                    pd.DataFrame(columns=ANOMALY_COLUMNS + ["parameter"])
+                anomalies_df["location"] = name
+                anomalies_df.to_csv(f"{self.dir}/combined/{name}/{frequency}_anomalies.csv",
+                                    index=False)
+                print("Detected anomalies for ", name, frequency)
+
+        if failed:
+            raise RuntimeError(f"Anomaly detection failed for {failed}")
+
+
+if __name__ == "__main__":
+    anomalyDetector = AnomalyDetector()
+    anomalyDetector.set_path()
+    anomalyDetector.set_map()
+    anomalyDetector.set_frequencies()
+    anomalyDetector.run_all()
@@ -13,6 +13,10 @@ To do this we run aggregate_data() twice:
 Ideally this script only needs to be run once to get all of the data.
 
 Refer to the aggregate_data() docstring for an explanation of how this function works. 
+
+With detect_anomalies=True, every downloaded chunk is also scored by the OnlineAnomalyDetector
+(online_anomaly.py). Flagged readings are appended to ONLINE_ANOMALIES_PATH, and the detector
+state is saved to ONLINE_ANOMALY_STATE_PATH after every call so the next run continues from it.
 """
 import time
 import os
@@ -23,12 +27,24 @@ import numpy as np
 
 # from config import OLD_API_KEY, NEW_API_KEY
 OLD_API_KEY, NEW_API_KEY = 100, 200
-from data_loader import DataLoader
+from data_loader import BASE_URL, DataLoader, MetadataCache, QuotaExceededError, TransientError
+from online_anomaly import OnlineAnomalyDetector
 
 # CREATE GLOBAL TIME CONSTANTS
 START_YEAR = 2014
 CURRENT_YEAR = datetime.date.today().year
 
+# Seconds to wait before the next call: a full hour once the hourly API limit is reached,
+# a minute after a network failure that DataLoader could not recover from by retrying
+QUOTA_WAIT_SECONDS = 3600
+TRANSIENT_WAIT_SECONDS = 60
+
+# Online anomaly detection output
+ONLINE_ANOMALY_STATE_PATH = "../../data/processed/online_anomaly_state.json"
+ONLINE_ANOMALIES_PATH = "../../data/processed/online_anomalies.csv"
+# device and parameter listings of both projects (see data_loader.MetadataCache)
+METADATA_CACHE_PATH = "../../data/raw/metadata_cache.json"
+
 def get_times() -> list:
     """
     Create list of strings for each 1 month segment between START_YEAR and CURRENT_YEAR starting in 2014-05-01
@@ -48,13 +64,22 @@ def get_times() -> list:
     return times
 
 
-def aggregate_data(test: bool = False, old: bool = False, project: str = "new") -> None:
+def aggregate_data(test: bool = False, old: bool = False, project: str = "new",
+                   detect_anomalies: bool = False, base_url: str = BASE_URL,
+                   metadata_cache_path: str = METADATA_CACHE_PATH) -> None:
     """
     This function will: 
     1. Create a DataLoader object with the correct API key and project
     2. Call ping_api() until all data has been collected for that project
         - if we run out of API calls for that hour before download all the data, 
         we will sleep for 1 hour and then resume
+        - if the API cannot be reached (DataLoader already retried), we will sleep
+        for a minute and then resume
+    3. If detect_anomalies, score new data with the OnlineAnomalyDetector and save its state
+    after every call
+
+    base_url and metadata_cache_path point the DataLoader to another API, e.g. a local
+    wqdata_simulator.py, with its own metadata cache.
     """
     if old:
         apiKey = OLD_API_KEY
@@ -62,17 +87,61 @@ def aggregate_data(test: bool = False, old: bool = False, project: str = "new")
         apiKey = NEW_API_KEY
 
     # Create Dataloader
-    dataLoader = DataLoader(apiKey=apiKey, project=project)
+    dataLoader = DataLoader(apiKey=apiKey, project=project,
+                            metadata_cache=MetadataCache(metadata_cache_path),
+                            base_url=base_url)
     done = False
 
+    anomaly_detector = None
+    if detect_anomalies:
+        anomaly_detector = OnlineAnomalyDetector()
+        anomaly_detector.load_state(ONLINE_ANOMALY_STATE_PATH)
+
     while not done:
         print("Starting new call")
-        done = ping_api(dataLoader, test=test)
-        print("Sleeping for 1 hour")
-        time.sleep(3600)
-
+        wait_seconds = QUOTA_WAIT_SECONDS
+        try:
+            done = ping_api(dataLoader, test=test, anomaly_detector=anomaly_detector)
+        except TransientError as error:
+            print(error)
+            wait_seconds = TRANSIENT_WAIT_SECONDS
+        if anomaly_detector is not None:
+            anomaly_detector.save_state(ONLINE_ANOMALY_STATE_PATH)
+        print(f"Sleeping for {wait_seconds} seconds")
+        time.sleep(wait_seconds)
+
+
+def save_online_anomalies(anomaly_detector: OnlineAnomalyDetector,
+                          device_name: str,
+                          parameter_name: str,
+                          data: pd.DataFrame) -> None:
+    """
+    Score a newly downloaded chunk and append the flagged readings to ONLINE_ANOMALIES_PATH.
 
-def ping_api(dataLoader, test: bool = False) -> bool:
+    Arguments:
+    ----------
+    anomaly_detector (OnlineAnomalyDetector): detector holding the state of every series
+    device_name (str): name of the device
+    parameter_name (str): name of the parameter
+    data (pd.DataFrame): output of DataLoader.get_data, with columns "times" and "values"
+    """
+    scored = anomaly_detector.update(device_name, parameter_name, data)
+    anomalies = scored[scored["anomaly"] == "Yes"].copy()
+    if anomalies.empty:
+        return
+
+    print(f"- {len(anomalies)} anomalies in {parameter_name}")
+    anomalies.insert(0, "device", device_name)
+    anomalies.insert(1, "parameter", parameter_name)
+    anomalies.to_csv(
+        ONLINE_ANOMALIES_PATH,
+        mode="a",
+        index=False,
+        header=(not os.path.exists(ONLINE_ANOMALIES_PATH))
+    )
+
+
+def ping_api(dataLoader, test: bool = False, anomaly_detector: OnlineAnomalyDetector = None) -> bool:
     """
     This function will:
     1. Get all devices for the project
@@ -90,16 +159,25 @@ def ping_api(dataLoader, test: bool = False) -> bool:
     ----------
     dataLoader (DataLoader): DataLoader object
     test (bool): default False
+    anomaly_detector (OnlineAnomalyDetector): scores every downloaded chunk if given, default None
 
     Returns:
     ----------
     status (bool): True if successfully downloaded all data, False if we haven't finished downloading all data
+    (the hourly API limit was reached)
+
+    Raises:
+    ----------
+    TransientError: if the API could not be reached, even after the retries of DataLoader.
+    The state of dataLoader is kept, so the next call resumes where this one stopped.
+    APIError: if the API returned an error that waiting will not fix
     """
 
     # Get Devices for our project
     if dataLoader.devices is None:
-        devices = dataLoader.get_devices()
-        if devices is None:
+        try:
+            devices = dataLoader.get_devices()
+        except QuotaExceededError:
             return False
     else: 
         devices = dataLoader.devices
@@ -124,8 +202,9 @@ def ping_api(dataLoader, test: bool = False) -> bool:
         # Get parameters for one device
         if len(dataLoader.device_parameters[device_id]) == 0:
             # If we haven't already gotten parameters for this device, get them
-            parameters = dataLoader.get_device_parameters(deviceId=device_id)
-            if parameters is None:
+            try:
+                parameters = dataLoader.get_device_parameters(deviceId=device_id)
+            except QuotaExceededError:
                 return False
         else: 
             # Otherwise, grab the parameters for this device
@@ -151,18 +230,21 @@ def ping_api(dataLoader, test: bool = False) -> bool:
                         continue
 
                 # Request data from that device
-                cur_data = dataLoader.get_data(
-                    deviceId=device_id,
-                    parameterId=parameter_id,
-                    start_date=times[i],
-                    end_date=times[i+1]
-                )
-
-                if cur_data is None:
-                    dataLoader.current_start_time = times[i]
+                # (the next call resumes from this time range if this one fails)
+                dataLoader.current_start_time = times[i]
+                try:
+                    cur_data = dataLoader.get_data(
+                        deviceId=device_id,
+                        parameterId=parameter_id,
+                        start_date=times[i],
+                        end_date=times[i+1]
+                    )
+                except QuotaExceededError:
                     return False
-                else:
-                    dataLoader.current_start_time = times[i+1]
+                dataLoader.current_start_time = times[i+1]
+
+                if anomaly_detector is not None:
+                    save_online_anomalies(anomaly_detector, device_name, parameter_name, cur_data)
 
                 cur_data.rename(columns={"values": parameter_name}, inplace=True)
 
@@ -211,3 +293,7 @@ if __name__ == "__main__":
 
     # Collect New Data
     # aggregate_data(test=TEST, old=False, project="new")
+
+    # Collect from a local simulator of the API instead (python wqdata_simulator.py)
+    # aggregate_data(test=TEST, old=False, project="new", base_url="http://127.0.0.1:8080",
+    #                metadata_cache_path="../../data/raw/simulator_metadata_cache.json")
@@ -29,6 +29,42 @@ spec = importlib.util.spec_from_file_location(
 data_transformer_mod = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(data_transformer_mod)
 
+spec = importlib.util.spec_from_file_location(
+    name='aggregation_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//aggregation.py"  # full path to the script
+    )
+
+aggregation_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aggregation_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='polars_backend_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//polars_backend.py"  # full path to the script
+    )
+
+polars_backend_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(polars_backend_mod)
+
 #from data_transformer import DataTransformer
 
 
@@ -52,8 +88,8 @@ class DataWrangler:
     as those project files were too large for the data_transformer file. They would crash the 
     computer. 
 
-    The class downsamples the raw data to hourly and daily formats,
-    making it much easier to work with. It then tidies the data and saves it to a csv file in
+    The class downsamples the raw data to hourly and daily formats (mean, std, count,
+    quantiles and first/last timestamp of every period), making it much easier to work with. It then tidies the data and saves it to a csv file in
     the processed data directory. 
 
     
@@ -63,6 +99,7 @@ class DataWrangler:
         self.project = []
         self.processed_path = ""
         self.raw_path = ""
+        self.backend = config_combine_mod.BACKEND
 
     def set_project(self, project: list = ["new", "old"]) -> None:
         """
@@ -82,6 +119,15 @@ class DataWrangler:
         self.raw_path = raw_path
         self.processed_path = processed_path
 
+    def set_backend(self, backend: str = config_combine_mod.BACKEND) -> None:
+        """
+        This function sets the execution backend of the parser (see config_combine.BACKEND):
+        "pandas" reads all the files of a device into memory, "polars" streams through them.
+        """
+        if backend not in config_combine_mod.BACKENDS:
+            raise ValueError(f"Backend {backend} is not one of {config_combine_mod.BACKENDS}.")
+        self.backend = backend
+
     def downsample(self) -> None:
         """
         This function downsamples the data and puts it into tidy form. 
@@ -119,7 +165,7 @@ class DataWrangler:
                         df.dropna(subset=['times'], inplace=True)
                         df.reset_index(inplace=True)
 
-                        df["times"] = pd.to_datetime(df["times"])
+                        df["times"] = schema_mod.to_datetime(df["times"])
                         df.drop(columns=["index"], inplace=True)
 
                         # hard coded because of how data_loader is structured.
@@ -131,27 +177,18 @@ class DataWrangler:
 
                         # saving the parameter variable name for later and standardizing to "value"
                         df.rename(columns={parameter: 'value'}, inplace=True)
-                        df.set_index("times", inplace=True)
                         df["value"] = df["value"].astype(float)
 
                         # downsampling by hour and by day
-                        hourly_df = df.groupby(["Units"]).resample('H').agg(
-                            {"value": ["mean", "std"]})
-                        daily_df = df.groupby(["Units"]).resample('D').agg(
-                            {"value": ["mean", "std"]})
-                        hourly_df.reset_index(inplace=True)
-                        daily_df.reset_index(inplace=True)
+                        # (mean, std, count, quantiles and first/last timestamp,
+                        # see aggregation.summarize)
+                        hourly_df = aggregation_mod.summarize(df, "H", ["Units"])
+                        daily_df = aggregation_mod.summarize(df, "D", ["Units"])
                         hourly_df.set_index("times", inplace=True)
                         daily_df.set_index("times", inplace=True)
                         hourly_df.reset_index(inplace=True)
                         daily_df.reset_index(inplace=True)
 
-                        # concatonating double headers to one single header.
-
-                        hourly_df.columns = [col[0] if col[1] == ''
-                                             else f"{col[0]}_{col[1]}" for col in hourly_df.columns]
-                        daily_df.columns = [col[0] if col[1] == ''
-                                            else f"{col[0]}_{col[1]}" for col in daily_df.columns]
                         hourly_df["parameter"] = parameter
                         daily_df["parameter"] = parameter
 
@@ -170,25 +207,25 @@ class DataWrangler:
         we created from the function "downsample" above. This function's
         output is one csv for all of the hourly data and one csv for all 
         of the daily data for a given project and device.
+        With the polars backend (see set_backend), the files are streamed into the output
+        instead of being read into memory.
         """
-        df_merged = pd.DataFrame()
-        for filename in os.listdir(directory):
-            if filename.endswith(".csv"):
-                if filename.startswith("hourly"):
-                    df = pd.read_csv(f"{directory}/{filename}")
-                    df_merged = pd.concat([df_merged, df], ignore_index=True)
-        df_merged.to_csv(f"{directory}/tidy_hourly_all_data.csv", index = False)
-
-        df_merged = pd.DataFrame()
-        for filename in os.listdir(directory):
-            if filename.endswith(".csv"):
-                if filename.startswith("daily"):
-                    df = pd.read_csv(f"{directory}/{filename}")
-                    df_merged = pd.concat([df_merged, df], ignore_index=True)
-        df_merged.to_csv(f"{directory}/tidy_daily_all_data.csv", index = False)
+        for frequency in ["hourly", "daily"]:
+            paths = [f"{directory}/{filename}" for filename in os.listdir(directory)
+                     if filename.endswith(".csv") and filename.startswith(frequency)]
+            path = f"{directory}/tidy_{frequency}_all_data.csv"
+            if self.backend == "polars":
+                polars_backend_mod.concat_csv(paths, path)
+                continue
+            # one concat of all the files, rather than one per file into a growing dataframe
+            df_merged = pd.concat([pd.read_csv(file_path) for file_path in paths], ignore_index=True) \
+                if paths else pd.DataFrame()
+            df_merged.to_csv(path, index = False)
         print("tidied the data for ", directory)
 
 
-datawrangler = DataWrangler()
-datawrangler.set_path()
-datawrangler.downsample()
+# Only when run as a script, so the class can be imported (tests, benchmark_pipeline.py)
+if __name__ == "__main__":
+    datawrangler = DataWrangler()
+    datawrangler.set_path()
+    datawrangler.downsample()
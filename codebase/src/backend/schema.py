@@ -0,0 +1,367 @@
+"""
+This file declares the column types of the tidy and combined data, in one place.
+The csv files are text, so without it every load gives repeated Python strings for the
+parameter, Units and location of every row, float64 values and text times.
+
+- parameter, Units, location: categoricals (a few distinct values repeated on every row)
+- values, means, stds and quantiles: float32, enough for the sensor readings, which have
+  far fewer than 7 significant digits
+- sums and sums of squares: float64, so the std merged from them stays exact
+- counts: int32
+- times: datetime64
+
+Use read_csv to load a file with these types, or compact to convert a dataframe.
+Calculations (e.g. aggregation.py) work in float64 and only their inputs and outputs
+are compact. Data that is written back to csv (e.g. by DataCombiner.combine) is read
+with keep_floats=True instead, so the floats of the files are not rounded to float32.
+
+The rows of the loaded combined data are sorted by SORT_COLUMNS (location, parameter,
+time), so select_rows finds a selection with binary searches and returns slices of it.
+
+Every combined csv file also gets a copy in the Arrow IPC (Feather v2) format next to it
+("<resolution>_data.arrow", written uncompressed by write_arrow). The dashboard reads the
+combined data with read_combined, which memory maps that copy: the columns are views of the
+file, so nothing is parsed, and all the sessions of the dashboard share the same pages of
+the OS page cache instead of each holding its own parsed copy.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+
+DTYPES = {
+    "parameter": "category",
+    "Units": "category",
+    "location": "category",
+    "value": "float32",
+    "value_mean": "float32",
+    "value_std": "float32",
+    "value_count": "int32",
+    "value_sum": "float64",
+    "value_sumsq": "float64",
+    "value_min": "float32",
+    "value_q10": "float32",
+    "value_q25": "float32",
+    "value_median": "float32",
+    "value_q75": "float32",
+    "value_q90": "float32",
+    "value_max": "float32",
+}
+
+TIME_COLUMNS = ["times", "time_first", "time_last"]
+
+# Formats of the text times of the sources, tried in order by detect_time_format:
+# WQData and the files written by pandas (ISO 8601), then iChart exports (m/d/y)
+TIME_FORMATS = ["ISO8601", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y"]
+
+# order of the rows of the loaded combined data (see sort_rows and select_rows)
+SORT_COLUMNS = ["location", "parameter", "times"]
+
+# layout of the Arrow copies, stored in their metadata. Copies with another layout
+# (e.g. unsorted copies written before SORT_COLUMNS) are rewritten when read.
+ARROW_LAYOUT = "sorted:" + ",".join(SORT_COLUMNS)
+
+# permissions of a file created by open(): read and write for everyone, less the umask.
+# The umask can only be read by setting it, so it is read once, when the module is loaded.
+UMASK = os.umask(0)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+
+
+def detect_time_format(times: pd.Series) -> str:
+    """
+    Format of the text times of a source, detected once from its first time.
+
+    Arguments:
+    times (pd.Series): text times (e.g. the "times" column of a file)
+
+    Returns:
+    time_format (str): one of TIME_FORMATS, or "mixed" if none of them fits
+    """
+    # the first time is almost always in the first rows, so the whole column is not scanned
+    sample = times.iloc[:100].dropna()
+    if sample.empty:
+        sample = times.dropna()
+    if sample.empty:
+        return TIME_FORMATS[0]
+    sample = sample.iloc[:1]
+    for time_format in TIME_FORMATS:
+        try:
+            pd.to_datetime(sample, format=time_format)
+        except (ValueError, TypeError):
+            continue
+        return time_format
+    return "mixed"
+
+
+def to_datetime(times: pd.Series, time_format: str = None) -> pd.Series:
+    """
+    Parse text times with an explicit format. This is the time parser of every stage of
+    the pipeline and of the dashboard.
+
+    - Columns that are already datetimes are returned as they are.
+    - The format is detected once from the first time (detect_time_format), unless the
+      caller knows it (e.g. ICHART_TIME_FORMAT), and every time is parsed with it.
+    - Repeated strings (e.g. tidy data, where every time has one row per parameter)
+      are parsed once, by the cache of pd.to_datetime.
+    - If some times do not fit the format (e.g. a file that was appended to with another
+      format), the format of every time is inferred instead.
+
+    Arguments:
+    times (pd.Series): text times
+    time_format (str): format of the times (see pd.to_datetime), detected if None
+
+    Returns:
+    times (pd.Series): datetime64 times
+    """
+    if pd.api.types.is_datetime64_any_dtype(times):
+        return times
+    if time_format is None:
+        time_format = detect_time_format(times)
+    try:
+        return pd.to_datetime(times, format=time_format, cache=True)
+    except ValueError:
+        return pd.to_datetime(times, format="mixed", cache=True)
+
+
+def compact(df: pd.DataFrame, keep_floats: bool = False) -> pd.DataFrame:
+    """
+    Convert the columns of df that are in the schema to their types.
+    Columns that are not in the schema are left as they are, and so are integer
+    columns with missing values (e.g. counts of rows from files without counts).
+
+    Arguments:
+    df (pd.DataFrame): tidy or combined data
+    keep_floats (bool): leave the float columns as they are (e.g. float64)
+
+    Returns:
+    df (pd.DataFrame): the same dataframe, converted in place
+    """
+    for column, dtype in DTYPES.items():
+        if column not in df.columns or (keep_floats and dtype.startswith("float")):
+            continue
+        if df[column].dtype != dtype:
+            if dtype.startswith("int") and df[column].isna().any():
+                continue
+            df[column] = df[column].astype(dtype)
+        if dtype == "category" and not df[column].cat.categories.is_monotonic_increasing:
+            # categories in alphabetical order, so the codes sort like the strings
+            df[column] = df[column].cat.reorder_categories(
+                df[column].cat.categories.sort_values())
+    for column in TIME_COLUMNS:
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = to_datetime(df[column])
+    return df
+
+
+def read_csv(path: str, keep_floats: bool = False, **kwargs) -> pd.DataFrame:
+    """
+    Read a tidy or combined csv file with the schema types.
+    The strings and floats are parsed straight into their types.
+
+    Arguments:
+    path (str): path to the csv file
+    keep_floats (bool): read the float columns as float64 rather than their schema types,
+        for data that is written back to csv
+    kwargs: passed on to pd.read_csv (e.g. usecols)
+
+    Returns:
+    df (pd.DataFrame)
+    """
+    dtype = {column: "float64" if keep_floats and dtype.startswith("float") else dtype
+             for column, dtype in DTYPES.items() if not dtype.startswith("int")}
+    return compact(pd.read_csv(path, dtype=dtype, **kwargs), keep_floats=keep_floats)
+
+
+def arrow_path(csv_path: str) -> str:
+    """
+    Path of the Arrow copy of a csv file (same name, ".arrow" extension).
+    """
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert a dataframe to an Arrow table. Missing floats are kept as NaN values rather
+    than Arrow nulls, so the float columns can be read back without a copy.
+    """
+    arrays = {}
+    for column in df.columns:
+        if pd.api.types.is_float_dtype(df[column]):
+            arrays[column] = pa.array(df[column].to_numpy(), from_pandas=False)
+        else:
+            arrays[column] = pa.array(df[column], from_pandas=True)
+    return pa.table(arrays)
+
+
+def write_arrow(df: pd.DataFrame, path: str) -> None:
+    """
+    Write a dataframe to an uncompressed Arrow IPC (Feather v2) file, which can be
+    memory mapped. The file is written under a unique temporary name (the sessions of
+    the dashboard are threads of one process, which may write the same file at once)
+    and then renamed, so readers never open a partly written file. mkstemp creates the
+    temporary file readable by its owner only, so it gets the usual permissions
+    (FILE_MODE) before the rename.
+
+    Arguments:
+    df (pd.DataFrame): data with the schema types (see compact), sorted by sort_rows
+    path (str): path of the ".arrow" file
+
+    Returns:
+    No returns, but writes the file.
+    """
+    table = to_arrow(df).replace_schema_metadata({"layout": ARROW_LAYOUT})
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                          prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        feather.write_feather(table, temporary_path, compression="uncompressed")
+        os.chmod(temporary_path, FILE_MODE)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def read_arrow(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Memory map an Arrow file written by write_arrow. The columns of the dataframe are
+    read-only views of the mapped file.
+
+    Arguments:
+    path (str): path of the ".arrow" file
+    columns (list): columns to read, all of them if None
+
+    Returns:
+    df (pd.DataFrame), or None if the file does not have the current ARROW_LAYOUT
+    """
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"layout") != ARROW_LAYOUT.encode():
+        return None
+    return table.to_pandas(split_blocks=True)
+
+
+def read_combined(csv_path: str) -> pd.DataFrame:
+    """
+    Read a combined data file from its Arrow copy, if the copy is at least as recent as
+    the csv file, has the current layout and can be read. Otherwise the csv file is read
+    and sorted (see sort_rows), and the copy is (re)written for the next reads.
+
+    Arguments:
+    csv_path (str): path of the combined csv file, e.g. ".../Beach2_Buoy/daily_data.csv"
+
+    Returns:
+    df (pd.DataFrame): data with the schema types, sorted by SORT_COLUMNS
+    """
+    path = arrow_path(csv_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(csv_path):
+        try:
+            df = read_arrow(path)
+        except OSError:
+            # e.g. a copy the dashboard is not allowed to read: the csv file is read instead
+            df = None
+        if df is not None:
+            return df
+
+    df = sort_rows(read_csv(csv_path))
+    try:
+        write_arrow(df, path)
+    except OSError:
+        # e.g. a read-only deployment: the csv file is read every time
+        pass
+    return df
+
+
+def read_combined_files(csv_paths: list) -> pd.DataFrame:
+    """
+    Read several combined data files (see read_combined) into one dataframe.
+    A single file is returned as it is, so its columns stay views of the mapped file.
+
+    Arguments:
+    csv_paths (list): paths of the combined csv files, one location per file
+
+    Returns:
+    df (pd.DataFrame): data with the schema types, sorted by SORT_COLUMNS
+    """
+    frames = [read_combined(path) for path in csv_paths]
+    if len(frames) == 1:
+        return frames[0]
+    # every file is sorted, so the files only need to be in the order of their locations
+    frames.sort(key=lambda df: "" if df.empty else df["location"].iloc[0])
+    # the categories of the files differ, so they are unified after the concat
+    return compact(pd.concat(frames, ignore_index=True))
+
+
+def sort_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sort the rows by SORT_COLUMNS (the columns df has). Categorical columns are sorted
+    by their codes, which sort like the strings (see compact).
+
+    Arguments:
+    df (pd.DataFrame): data with the schema types
+
+    Returns:
+    df (pd.DataFrame): sorted copy with a new range index
+    """
+    columns = [column for column in SORT_COLUMNS if column in df.columns]
+    return df.sort_values(columns, kind="stable", ignore_index=True)
+
+
+def _sorted_range(values: np.ndarray, start: int, stop: int, low, high,
+                  side: str = "left") -> tuple:
+    """
+    Bounds of the rows in [start, stop) of a sorted array with low <= value <= high
+    (low < value if side is "right").
+    """
+    return (start + np.searchsorted(values[start:stop], low, side=side),
+            start + np.searchsorted(values[start:stop], high, side="right"))
+
+
+def select_rows(df: pd.DataFrame, locations, parameter: str,
+                start_time, end_time) -> pd.DataFrame:
+    """
+    Rows of the locations and the parameter with start_time < time <= end_time.
+    df must be sorted by SORT_COLUMNS with categorical location and parameter columns
+    (e.g. from read_combined_files). Every (location, parameter) is a block of rows
+    sorted by time, so each bound is a binary search and the cost of a selection
+    depends on its size, not on the size of df.
+
+    Arguments:
+    df (pd.DataFrame): combined data sorted by SORT_COLUMNS
+    locations (str or list): location(s) to select
+    parameter (str): parameter to select
+    start_time, end_time: date range (anything np.datetime64 accepts)
+
+    Returns:
+    selection (pd.DataFrame): slices of df, by location then time
+    """
+    if isinstance(locations, str):
+        locations = [locations]
+    location_codes = df["location"].cat.codes.to_numpy()
+    parameter_codes = df["parameter"].cat.codes.to_numpy()
+    times = df["times"].to_numpy()
+    start_time, end_time = np.datetime64(start_time), np.datetime64(end_time)
+
+    slices = []
+    for location in locations:
+        if location not in df["location"].cat.categories or \
+                parameter not in df["parameter"].cat.categories:
+            continue
+        code = df["location"].cat.categories.get_loc(location)
+        start, stop = _sorted_range(location_codes, 0, len(df), code, code)
+        code = df["parameter"].cat.categories.get_loc(parameter)
+        start, stop = _sorted_range(parameter_codes, start, stop, code, code)
+        start, stop = _sorted_range(times, start, stop, start_time, end_time, side="right")
+        slices.append(df.iloc[start:stop])
+
+    if len(slices) == 0:
+        return df.iloc[0:0]
+    if len(slices) == 1:
+        return slices[0]
+    return pd.concat(slices)
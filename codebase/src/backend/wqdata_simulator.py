@@ -0,0 +1,306 @@
+"""
+Local stand-in for the WQData API, to exercise DataLoader and run_data_loader without
+calling www.wqdatalive.com (e.g. to compare concurrency and rate limiting strategies
+before a real backfill).
+
+WQDataSimulator serves the three endpoints used by DataLoader:
+- /api/v1/devices
+- /api/v1/devices/<device_id>/parameters
+- /api/v1/devices/<device_id>/parameters/<parameter_id>/data?from=...&to=...
+with the limits of the real API: HOURLY_QUOTA calls per API key and per clock hour
+(answered like the real API, {"message": "Request exceeds hourly limit"}) and MAX_POINTS
+readings per call. The devices are those of the site registry (config_combine.SITES),
+with the parameters of SIMULATED_PARAMETERS. The readings are synthetic but the same on
+every call.
+The density of the data, the latency of the responses and a rate of 503 errors
+can be configured.
+
+Run it with
+    python wqdata_simulator.py --port 8080 --latency 0.2 --error-rate 0.05
+and give DataLoader (or run_data_loader.aggregate_data) base_url="http://127.0.0.1:8080".
+"""
+import argparse
+import collections
+import datetime
+import http.server
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import orjson
+
+from config_combine import SITES
+
+
+# Limits of the WQData API (see run_data_loader.py)
+HOURLY_QUOTA = 140
+MAX_POINTS = 5000
+# API keys of run_data_loader.py, by project
+API_KEYS = {"100": "old", "200": "new"}
+# Parameters of the simulated devices of each site, as the WQData API names them.
+# Every device also has a "Battery" parameter (see UNITS).
+SIMULATED_PARAMETERS = {
+    "Beach2_Buoy": ("ODO", "Temperature", "Water Temperature"),
+    "Beach2_Tower": ("Air Temperature",),
+    "Beach6_Buoy": ("ODO", "Temperature", "Water Temperature"),
+    "Near_Shore_Buoy": ("Air Temperature", "ODO", "Temperature"),
+    "Surface_Data": ("ODO",),
+    "Walnut_Creek": ("Air Temperature",),
+    "Trec_Tower": ("Air Temperature",),
+}
+# units of the simulated parameters. "Battery" is not one of config_combine.PARAMETERS,
+# so DataLoader has a parameter to leave out, as with the real devices.
+UNITS = {
+    "Air Temperature": "C",
+    "Temperature": "C",
+    "Water Temperature": "C",
+    "ODO": "mg/L",
+    "Battery": "V",
+}
+
+DEVICES_PATH = re.compile(r"^/api/v1/devices$")
+PARAMETERS_PATH = re.compile(r"^/api/v1/devices/([^/]+)/parameters$")
+DATA_PATH = re.compile(r"^/api/v1/devices/([^/]+)/parameters/([^/]+)/data$")
+
+
+def simulated_devices() -> dict:
+    """
+    Devices of the old and new projects in the site registry, with their parameters.
+
+    Returns:
+    ----------
+    devices (dict): {project: {device_id: (device_name, {parameter_id: (name, unit)})}}
+    """
+    devices = {"old": {}, "new": {}}
+    device_id = 1000
+    for site in SITES.values():
+        for project, device_name in zip(["old", "new"], site.devices[1:]):
+            if device_name is None:
+                continue
+            device_id += 1
+            names = sorted(SIMULATED_PARAMETERS[site.name]) + ["Battery"]
+            parameters = {f"{device_id}{index:02d}": (name, UNITS[name])
+                          for index, name in enumerate(names)}
+            devices[project][str(device_id)] = (device_name, parameters)
+    return devices
+
+
+def simulated_readings(parameter_id: str,
+                       start: datetime.datetime,
+                       end: datetime.datetime,
+                       interval_minutes: int,
+                       missing_rate: float,
+                       max_points: int) -> list:
+    """
+    Readings of a parameter between start and end (both included), one every
+    interval_minutes on the hour grid. The values follow a yearly and a daily cycle
+    plus noise, and a fraction missing_rate of them are missing (None). They only depend
+    on the parameter and the time, so overlapping calls return the same readings.
+
+    Returns:
+    ----------
+    data (list): at most max_points {"timestamp": ..., "value": ...} records
+    """
+    step = np.timedelta64(interval_minutes * 60, "s")
+    # first time of the grid at or after start
+    first = np.datetime64(start, "s")
+    first = first + (-first.astype(np.int64)) % (interval_minutes * 60) * np.timedelta64(1, "s")
+    times = np.arange(first, np.datetime64(end, "s") + np.timedelta64(1, "s"), step)[:max_points]
+
+    seconds = times.astype(np.int64).astype(np.float64)
+    # deterministic noise in [0, 1), different for every parameter
+    noise = np.sin(seconds * 12.9898 + int(parameter_id) * 78.233) * 43758.5453 % 1
+    year_phase = 2 * np.pi * seconds / (365.25 * 86400)
+    day_phase = 2 * np.pi * seconds / 86400
+    values = 12 - 10 * np.cos(year_phase) - 2 * np.cos(day_phase) + 2 * (noise - 0.5)
+    values = values.round(2).astype(object)
+    values[(noise * 7919) % 1 < missing_rate] = None
+
+    timestamps = np.datetime_as_string(times)
+    return [{"timestamp": str(timestamp).replace("T", " "), "value": value}
+            for timestamp, value in zip(timestamps, values)]
+
+
+class WQDataSimulator():
+    """
+    Local WQData API, served by a thread of this process (see the module docstring).
+    Counts of what was served are kept in self.stats ("requests", "quota_exceeded",
+    "errors", "points").
+    """
+
+    def __init__(self,
+                 port: int = 0,
+                 interval_minutes: int = 10,
+                 missing_rate: float = 0.0,
+                 hourly_quota: int = HOURLY_QUOTA,
+                 max_points: int = MAX_POINTS,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 seed: int = 0) -> None:
+        """
+        Arguments:
+        ----------
+        port (int): port to listen on (127.0.0.1), 0 for any free port
+        interval_minutes (int): minutes between two readings (the density of the data)
+        missing_rate (float): fraction of the readings that are missing
+        hourly_quota (int): calls allowed per API key and per clock hour
+        max_points (int): readings returned per call at most
+        latency (float): seconds to wait before answering every call
+        error_rate (float): fraction of the calls answered 503 Service Unavailable
+        seed (int): seed of the error injection
+        """
+        self.port = port
+        self.interval_minutes = interval_minutes
+        self.missing_rate = missing_rate
+        self.hourly_quota = hourly_quota
+        self.max_points = max_points
+        self.latency = latency
+        self.error_rate = error_rate
+        self.devices = simulated_devices()
+        self.stats = collections.Counter()
+        # calls by (API key, clock hour)
+        self.calls = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base url to give to DataLoader
+        """
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "WQDataSimulator":
+        """
+        Start serving in a background thread
+        """
+        handler = type("Handler", (SimulatorHandler,), {"simulator": self})
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "WQDataSimulator":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def respond(self, url: str) -> tuple:
+        """
+        Answer a GET request.
+
+        Arguments:
+        ----------
+        url (str): path and query string of the request
+
+        Returns:
+        ----------
+        status (int), payload (dict)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        url = urllib.parse.urlsplit(url)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        api_key = query.get("apiKey")
+
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 503, {"message": "Service Unavailable"}
+            if api_key not in API_KEYS:
+                return 401, {"message": "Invalid API key"}
+            hour = (api_key, int(time.time() // 3600))
+            if self.calls[hour] >= self.hourly_quota:
+                self.stats["quota_exceeded"] += 1
+                return 429, {"message": "Request exceeds hourly limit"}
+            self.calls[hour] += 1
+
+        devices = self.devices[API_KEYS[api_key]]
+        if DEVICES_PATH.match(url.path):
+            return 200, {"devices": [{"id": device_id, "name": name}
+                                     for device_id, (name, _) in devices.items()]}
+
+        match = PARAMETERS_PATH.match(url.path) or DATA_PATH.match(url.path)
+        if match is None:
+            return 404, {"message": "Not Found"}
+        if match.group(1) not in devices:
+            return 404, {"message": "Device not found"}
+        parameters = devices[match.group(1)][1]
+        if match.re is PARAMETERS_PATH:
+            return 200, {"parameters": [{"id": parameter_id, "name": name, "unit": unit}
+                                        for parameter_id, (name, unit) in parameters.items()]}
+
+        parameter_id = match.group(2)
+        if parameter_id not in parameters:
+            return 404, {"message": "Parameter not found"}
+        try:
+            start = datetime.datetime.fromisoformat(query["from"])
+            end = datetime.datetime.fromisoformat(query["to"])
+        except (KeyError, ValueError):
+            return 400, {"message": "Invalid from or to date"}
+        data = simulated_readings(parameter_id, start, end,
+                                  self.interval_minutes, self.missing_rate, self.max_points)
+        with self._lock:
+            self.stats["points"] += len(data)
+        return 200, {"data": data}
+
+
+class SimulatorHandler(http.server.BaseHTTPRequestHandler):
+    """
+    HTTP handler of WQDataSimulator (WQDataSimulator.start sets the simulator)
+    """
+    simulator = None
+
+    def do_GET(self) -> None:
+        status, payload = self.simulator.respond(self.path)
+        body = orjson.dumps(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # one line per call would flood the output of a load test
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local WQData API simulator")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--interval-minutes", type=int, default=10)
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    parser.add_argument("--hourly-quota", type=int, default=HOURLY_QUOTA)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    arguments = parser.parse_args()
+
+    simulator = WQDataSimulator(port=arguments.port,
+                                interval_minutes=arguments.interval_minutes,
+                                missing_rate=arguments.missing_rate,
+                                hourly_quota=arguments.hourly_quota,
+                                latency=arguments.latency,
+                                error_rate=arguments.error_rate).start()
+    print(f"WQData simulator serving on {simulator.base_url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(dict(simulator.stats))
+    except KeyboardInterrupt:
+        simulator.stop()
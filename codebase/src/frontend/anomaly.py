@@ -1,10 +1,66 @@
 "Defines functions to run advanced time series statistics on selected values"
-import pytimetk
 import datetime
+import hashlib
+import importlib
+import os
+import pathlib
+import sys
 
 import pandas as pd
 import streamlit as st
 import numpy as np
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='aggregation_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//aggregation.py"  # full path to the script
+    )
+aggregation_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aggregation_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='anomaly_engine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//anomaly_engine.py"  # full path to the script
+    )
+anomaly_engine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(anomaly_engine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='lazy_imports_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//frontend//lazy_imports.py"  # full path to the script
+    )
+# one copy per process, shared with the pages, which report the import times it records
+if spec.name not in sys.modules:
+    sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules[spec.name])
+lazy_imports_mod = sys.modules[spec.name]
+
+# pytimetk takes several seconds to import, so it is only imported when it is first used
+pytimetk = lazy_imports_mod.lazy_import("pytimetk")
+
+# "pytimetk" runs pytimetk.anomalize, "native" runs backend/anomaly_engine.py,
+# which is much faster on long hourly series
+ANOMALY_ENGINES = ["pytimetk", "native"]
 ####
 
 def df_creation2(path_to_df: str) -> [pd.DataFrame(), str, list, str, str]:
@@ -27,94 +83,84 @@ def df_creation2(path_to_df: str) -> [pd.DataFrame(), str, list, str, str]:
 
     """
 
+    # Auto picks the coarsest resolution that still fills the plot - default is auto
     frequency_selected = st.radio(
         "Select data interval",
-        ["Hourly", "Daily"],
-        index=1
+        ["Auto", "Hourly", "Daily", "Weekly", "Monthly", "Annual"],
+        index=0,
+        horizontal=True
     )
-    # Set location to correct frequency csv
-    if frequency_selected == "Daily":
-        data_frequency = "/daily_data.csv"
-    else:
-        data_frequency = "/hourly_data.csv"
-    # Hourly or daily choice - default is daily
     st.subheader("Select data locations")
-    # Static list of data collection sites
-    # Names of the csv files
-    sites_csv_name = ["Beach2_Buoy",
-                      "Beach2_Tower",
-                      "Beach6_Buoy",
-                      "Near_Shore_Buoy",
-                      "Surface_Data",
-                      "Walnut_Creek",
-                      "Trec_Tower"]
-    # Names of locations user can pick from
-    sites_display_name = ["Beach 2 Buoy",
-                          "Beach 2 Tower",
-                          "Beach 6 Buoy",
-                          "Near Shore Buoy",
-                          "Surface Data",
-                          "Walnut Creek",
-                          "TREC Tower"]
+    # Names of locations user can pick from (the display names of the site registry)
+    sites_display_name = list(config_combine_mod.DISPLAY_NAMES)
     # Checkboxes for user to select collection sites
     locations_selected_display = st.selectbox(
         "Data collection sites",
         sites_display_name
     )
-    # Create a new list of 1's and 0's
-    # 1's index the desired location of the formatted location string
-    # in sites_display_name
-    indices = [x in locations_selected_display for x in sites_display_name]
-    # Index the array containing all  of the available csv names using
-    # the previously generated index array such that the correct csv names are
-    # selected.
-    locations_selected_call = np.asarray(
-        sites_csv_name)[np.asarray(indices).astype(bool)]
+    # Name of the csv directory of the selected site
+    locations_selected_call = [config_combine_mod.DISPLAY_NAMES[locations_selected_display]]
     # If the user has not chosen any locations,
     # return a blank df
     if len(locations_selected_call) == 0:
         df_chosen_locs = pd.DataFrame()
         return df_chosen_locs
     else:
+        # The date range is chosen first, so the resolution can be picked before reading
+        with st.sidebar:
+            st.subheader("Configure data selection")
+            start_time = st.date_input("Choose start-date",
+                                       min_value=datetime.date(2000, 1, 1),
+                                       max_value=datetime.date(2023, 9, 1),
+                                       value=datetime.date(2000, 1, 1))
+            end_time = st.date_input("Choose end-date",
+                                     value=datetime.date(2023, 9, 1))
+        if frequency_selected == "Auto":
+            resolution = aggregation_mod.choose_resolution(
+                start_time, end_time,
+                aggregation_mod.available_resolutions(path_to_df, locations_selected_call))
+        else:
+            resolution = frequency_selected.lower()
+        # The page reads the precomputed anomalies of the same resolution
+        st.session_state["resolution"] = resolution
+        # Set location to correct frequency csv
+        data_frequency = f"/{resolution}_data.csv"
         # List comprehension to create list of paths to needed dataframes
         df_dirs = [(path_to_df + loc
                     + data_frequency) for loc in locations_selected_call]
         # Concatenate all of the dfs into one
-        df_chosen_locs = pd.concat(map(pd.read_csv, df_dirs))
+        # Read with the compact types of schema.py (categorical strings, float32 values,
+        # datetime times), from the memory mapped Arrow copies of the csv files
+        df_chosen_locs = schema_mod.read_combined_files(df_dirs)
         # When user has not made a selection, display error message
     if df_chosen_locs.empty:
         st.write(
             ":red[Please select a data collection site from the drop-down above]")
     else:
-        # Convert time column to datetime
-        df_chosen_locs['times'] = pd.to_datetime(df_chosen_locs['times'])
         # List of all weather station locations
         locations_in_df = list(df_chosen_locs['location'].unique())
-        # List of all variable types
+        # List of all variable types: the parameters of the selected sites in the site
+        # registry first (config_combine.SITE_PARAMETERS), then the other parameters of
+        # the data (e.g. the extra sensors of the iChart exports)
         variables_in_df = list(df_chosen_locs['parameter'].unique())
+        site_variables = [variable for location in locations_in_df
+                          for variable in config_combine_mod.SITE_PARAMETERS.get(location, ())
+                          if variable in variables_in_df]
+        variables_in_df = list(dict.fromkeys(site_variables + variables_in_df))
         # Sidebar hides the drop-down
         with st.sidebar:
-            st.subheader("Configure data selection")
-            start_time = st.date_input("Choose start-date",
-                                       min_value=datetime.date(2000, 1, 1),
-                                       max_value=datetime.date(2023, 9, 1),
-                                       value=datetime.date(2000, 1, 1))
-            end_time = st.date_input("Choose end-date",
-                                     value=datetime.date(2023, 9, 1))
             locations_to_graph = st.selectbox('Choose desired location',
                                               locations_in_df)
             variable_to_plot = st.selectbox(label="Choose a variable",
                                             options=variables_in_df,
                                             index=0)
-            # Create temporary dataframe based on date range
-            # The mask creates a boolean vector to include only values within date range
-            time_mask = (df_chosen_locs['times'] > np.datetime64(start_time)) & \
-                        (df_chosen_locs['times'] <= np.datetime64(end_time))
-            df_intime = df_chosen_locs.loc[time_mask]
-            # Configure visualization dataframe (df_viz) to queried values
-            df_loc_time_selection = df_intime.query(
-                "location == @locations_to_graph").query(
-                    f"parameter=='{variable_to_plot}'")
+            # Configure visualization dataframe (df_viz) to the chosen location, variable
+            # and date range. The data is sorted by location, parameter and time,
+            # so the selection is found with binary searches (see schema.select_rows)
+            df_loc_time_selection = schema_mod.select_rows(df_chosen_locs,
+                                                           locations_to_graph,
+                                                           variable_to_plot,
+                                                           start_time, end_time)
             return df_loc_time_selection, variable_to_plot, locations_to_graph, start_time, end_time
 
 
@@ -153,7 +199,142 @@ def create_trendline(data):
 
     return fig
 
-def create_anomaly_graph(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
+def data_fingerprint(data: pd.DataFrame) -> str:
+    """
+    Fingerprint the 'times' and 'value_mean' columns of the selected data.
+    Two selections with the same fingerprint give the same anomalize result.
+
+    Parameters:
+    - data: pandas DataFrame
+        Input data containing a 'times' column and a 'value_mean' column.
+
+    Returns:
+    - fingerprint: str
+        Hex digest of the row hashes of the two columns.
+    """
+    row_hashes = pd.util.hash_pandas_object(data[['times', 'value_mean']], index=False)
+    return hashlib.sha1(row_hashes.values.tobytes()).hexdigest()
+
+
+# Anomalize is the slow step of this page, so its output is memoized.
+# Entries are keyed by the data fingerprint, the three anomaly parameters and the engine;
+# the data itself is not hashed by streamlit (leading underscore).
+# The least recently used entries are evicted past max_entries, and all entries expire after ttl.
+@st.cache_data(max_entries=16, ttl=3600, show_spinner="Calculating anomalies...")
+def _cached_anomalize(fingerprint, _data, period, iqr_alpha, clean_alpha, engine="pytimetk"):
+    """
+    Run the anomaly engine, memoized on (fingerprint, period, iqr_alpha, clean_alpha, engine).
+    """
+    if engine == "native":
+        return anomaly_engine_mod.anomalize(
+            data=_data,
+            date_column='times',
+            value_column='value_mean',
+            period=period,
+            iqr_alpha=iqr_alpha,
+            clean_alpha=clean_alpha
+        )
+    return pytimetk.anomalize(
+        data=_data,
+        date_column='times',
+        value_column='value_mean',
+        period=period,
+        iqr_alpha=iqr_alpha,
+        clean_alpha=clean_alpha,
+        clean="min_max"
+    )
+
+
+def run_anomalize(data, period=7, iqr_alpha=0.05, clean_alpha=0.75, engine="pytimetk"):
+    """
+    Drop missing values and run the anomaly engine on the selected data. Values with the
+    same time (e.g. the same parameter in two Units) are averaged, like the anomalies
+    precomputed by backend/run_anomaly_detection.py.
+    The result is shared by create_anomaly_graph and anomaly_decomp, so the
+    decomposition reuses the calculation behind the anomaly plot.
+
+    Parameters:
+    - data: pandas DataFrame
+        Input data containing a 'times' column and a 'value_mean' column.
+    - period: int, optional
+        The time period for analysis. Default is 7.
+    - iqr_alpha: float, optional
+        The alpha level for the IQR-based anomaly detection. Default is 0.05.
+    - clean_alpha: float, optional
+        The alpha level for data cleaning. Default is 0.75.
+    - engine: str, optional
+        "pytimetk" or "native" (see ANOMALY_ENGINES). Default is "pytimetk".
+
+    Returns:
+    - anomalize_df: pandas DataFrame
+        Output of pytimetk.anomalize, or the same columns from the native engine.
+
+    Raises:
+    - ValueError: If 'engine' is not one of ANOMALY_ENGINES.
+    """
+    if engine not in ANOMALY_ENGINES:
+        raise ValueError(f"engine must be one of {ANOMALY_ENGINES}.")
+    data_cleaned = data.dropna(subset=['value_mean'])
+    if data_cleaned['times'].duplicated().any():
+        data_cleaned = data_cleaned.groupby('times', as_index=False)['value_mean'].mean()
+    return _cached_anomalize(data_fingerprint(data_cleaned), data_cleaned,
+                             period, iqr_alpha, clean_alpha, engine)
+
+@st.cache_data(show_spinner=False)
+def _read_anomalies(path: str) -> pd.DataFrame:
+    """
+    Read a precomputed "<frequency>_anomalies.csv" file (cached per file).
+    """
+    return schema_mod.read_csv(path)
+
+
+def load_anomalies(path_to_df, location, parameter, frequency, start_time, end_time,
+                   period=7, iqr_alpha=0.05, clean_alpha=0.75):
+    """
+    Read the anomalies precomputed by backend/run_anomaly_detection.py for the selection.
+    Precomputed anomalies only exist for the default settings (ANOMALY_PARAMETERS),
+    and are calculated over the full history of the parameter at the location. The
+    anomalies of a shorter selection differ from them (the decomposition depends on the
+    whole series), so they are only used when the selection covers the full history.
+
+    Parameters:
+    - path_to_df: str
+        Path to ../data/processed/combined/ folder within github
+    - location: str
+        Location of the selected data
+    - parameter: str
+        Parameter of the selected data
+    - frequency: str
+        Resolution of the selected data, e.g. "daily"
+    - start_time, end_time: datetime
+        Selected date range
+    - period, iqr_alpha, clean_alpha: optional
+        Anomaly settings chosen by the user.
+
+    Returns:
+    - anomalize_df: pandas DataFrame or None
+        Precomputed anomalize output, or None if the settings are not the defaults, nothing
+        was precomputed or the date range does not cover the full history (then the
+        anomalies must be calculated).
+    """
+    chosen_parameters = {"period": period, "iqr_alpha": iqr_alpha, "clean_alpha": clean_alpha}
+    if chosen_parameters != config_combine_mod.ANOMALY_PARAMETERS:
+        return None
+
+    path = f"{path_to_df}{location}/{frequency.lower()}_anomalies.csv"
+    if not os.path.exists(path):
+        return None
+
+    anomalies_df = _read_anomalies(path)
+    anomalize_df = anomalies_df.loc[anomalies_df['parameter'] == parameter]
+    time_mask = (anomalize_df['times'] > np.datetime64(start_time)) & \
+                (anomalize_df['times'] <= np.datetime64(end_time))
+    if anomalize_df.empty or not time_mask.all():
+        return None
+    return anomalize_df.drop(columns=['parameter', 'location']).reset_index(drop=True)
+
+def create_anomaly_graph(data, period=7, iqr_alpha=0.05, clean_alpha=0.75, anomalize_df=None,
+                         engine="pytimetk"):
     """
     Use pytimetk to plot a chosen variable over a selected time period, with statistical
     analysis to produce anomaly bars and display values considered as anomalies.
@@ -167,6 +348,10 @@ def create_anomaly_graph(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
         The alpha level for the IQR-based anomaly detection. Default is 0.05.
     - clean_alpha: float, optional
         The alpha level for data cleaning. Default is 0.75.
+    - anomalize_df: pandas DataFrame, optional
+        Precomputed anomalize output (see load_anomalies). Calculated from data if None.
+    - engine: str, optional
+        Anomaly engine used when anomalize_df is None, "pytimetk" or "native". Default is "pytimetk".
 
     Returns:
     - anom_plot: Plotly plot 
@@ -200,17 +385,8 @@ def create_anomaly_graph(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
     if not isinstance(clean_alpha, (int, float)) or clean_alpha <= 0:
         raise ValueError("clean_alpha must be a non-zero numeric value.")
 
-    data_cleaned = data.dropna(subset=['value_mean'])
-
-    anomalize_df = pytimetk.anomalize(
-        data=data_cleaned,
-        date_column='times',
-        value_column='value_mean',
-        period=period,
-        iqr_alpha=iqr_alpha,
-        clean_alpha=clean_alpha,
-        clean="min_max"
-    )
+    if anomalize_df is None:
+        anomalize_df = run_anomalize(data, period, iqr_alpha, clean_alpha, engine)
 
     anom_plot = pytimetk.plot_anomalies(
         data=anomalize_df,
@@ -221,7 +397,8 @@ def create_anomaly_graph(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
 
     return anom_plot
 
-def anomaly_decomp(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
+def anomaly_decomp(data, period=7, iqr_alpha=0.05, clean_alpha=0.75, anomalize_df=None,
+                   engine="pytimetk"):
     """
     Use pytimetk to plot statistical decomposition of anomaly calculation.
 
@@ -234,6 +411,10 @@ def anomaly_decomp(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
         The alpha level for the IQR-based anomaly detection. Default is 0.05.
     - clean_alpha: float, optional
         The alpha level for data cleaning. Default is 0.75.
+    - anomalize_df: pandas DataFrame, optional
+        Precomputed anomalize output (see load_anomalies). Calculated from data if None.
+    - engine: str, optional
+        Anomaly engine used when anomalize_df is None, "pytimetk" or "native". Default is "pytimetk".
 
     Returns:
     - decomp: figure with statistical decomposition of anomaly calculation
@@ -269,15 +450,8 @@ def anomaly_decomp(data, period=7, iqr_alpha=0.05, clean_alpha=0.75):
     if data_cleaned.empty:
         raise ValueError("Data after cleaning is empty.")
 
-    anomalize_df = pytimetk.anomalize(
-        data=data_cleaned,
-        date_column='times',
-        value_column='value_mean',
-        period=period,
-        iqr_alpha=iqr_alpha,
-        clean_alpha=clean_alpha,
-        clean="min_max"
-    )
+    if anomalize_df is None:
+        anomalize_df = run_anomalize(data_cleaned, period, iqr_alpha, clean_alpha, engine)
 
     # Check if 'anomalize_df' is not empty after anomaly detection
     if anomalize_df.empty:
@@ -1,18 +1,46 @@
 """Manipulate and plot data from dataframes.
 
-Module contains 4 functions: 1 for dataframe manipulation, 3 for plotting.
+Module contains 5 functions: 2 for dataframe manipulation, 3 for plotting.
 Dataframe manipulation is all encompassing should not need to be used with
-any other manipulation tools. Two of the plotting functions generate different figures,
+any other manipulation tools. The second manipulation function prepares (and caches)
+the annual comparison data. Two of the plotting functions generate different figures,
 while the third is able to plot any scatter plot figure.
 
 """
 
 import datetime
+import importlib
+import pathlib
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 from plotly import graph_objects
-import numpy as np
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='aggregation_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//aggregation.py"  # full path to the script
+    )
+aggregation_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aggregation_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
 
 def df_creation(path_to_df: str) -> [pd.DataFrame(), str, list, str, str]:
     """
@@ -34,94 +62,84 @@ def df_creation(path_to_df: str) -> [pd.DataFrame(), str, list, str, str]:
 
     """
 
+    # Auto picks the coarsest resolution that still fills the plot - default is auto
     frequency_selected = st.radio(
         "Select data interval",
-        ["Hourly", "Daily"],
-        index=1
+        ["Auto", "Hourly", "Daily", "Weekly", "Monthly", "Annual"],
+        index=0,
+        horizontal=True
     )
-    # Set location to correct frequency csv
-    if frequency_selected == "Daily":
-        data_frequency = "/daily_data.csv"
-    else:
-        data_frequency = "/hourly_data.csv"
-    #Hourly or daily choice - default is daily
     st.subheader("Select data locations")
-    # Static list of data collection sites
-    # Names of the csv files
-    sites_csv_name = ["Beach2_Buoy",
-                             "Beach2_Tower",
-                             "Beach6_Buoy",
-                             "Near_Shore_Buoy",
-                             "Surface_Data",
-                             "Walnut_Creek",
-                             "Trec_Tower"]
-    # Names of locations user can pick from
-    sites_display_name = ["Beach 2 Buoy",
-                         "Beach 2 Tower",
-                         "Beach 6 Buoy",
-                         "Near Shore Buoy",
-                         "Surface Data",
-                         "Walnut Creek",
-                         "TREC Tower"]
+    # Names of locations user can pick from (the display names of the site registry)
+    sites_display_name = list(config_combine_mod.DISPLAY_NAMES)
     # Checkboxes for user to select collection sites
     locations_selected_display = st.multiselect(
         "Data collection sites",
         sites_display_name,
         default=sites_display_name[-1],
     )
-    # Create a new list of 1's and 0's
-    # 1's index the desired location of the formatted location string
-    # in sites_display_name
-    indices = [x in locations_selected_display for x in sites_display_name]
-    # Index the array containing all  of the available csv names using
-    # the previously generated index array such that the correct csv names are
-    # selected.
-    locations_selected_call = np.asarray(sites_csv_name)[np.asarray(indices).astype(bool)]
+    # Names of the csv directories of the selected sites
+    locations_selected_call = [config_combine_mod.DISPLAY_NAMES[x]
+                               for x in locations_selected_display]
     # If the user has not chosen any locations,
     # return a blank df
     if len(locations_selected_call) == 0:
         df_chosen_locs = pd.DataFrame()
         return df_chosen_locs
     else:
+        # The date range is chosen first, so the resolution can be picked before reading
+        with st.sidebar:
+            st.subheader("Configure data selection")
+            start_time = st.date_input("Choose start-date",
+                                    min_value=datetime.date(2000, 1, 1),
+                                    max_value=datetime.date(2023, 9, 1),
+                                    value = datetime.date(2000, 1, 1))
+            end_time = st.date_input("Choose end-date",
+                                    value = datetime.date(2023, 9, 1))
+        if frequency_selected == "Auto":
+            resolution = aggregation_mod.choose_resolution(
+                start_time, end_time,
+                aggregation_mod.available_resolutions(path_to_df, locations_selected_call))
+        else:
+            resolution = frequency_selected.lower()
+        # Set location to correct frequency csv
+        data_frequency = f"/{resolution}_data.csv"
         # List comprehension to create list of paths to needed dataframes
         df_dirs = [(path_to_df + loc
                         + data_frequency) for loc in locations_selected_call]
         # Concatenate all of the dfs into one
-        df_chosen_locs = pd.concat(map(pd.read_csv, df_dirs))
+        # Read with the compact types of schema.py (categorical strings, float32 values,
+        # datetime times), from the memory mapped Arrow copies of the csv files
+        df_chosen_locs = schema_mod.read_combined_files(df_dirs)
         # When user has not made a selection, display error message
     if df_chosen_locs.empty:
         st.write(":red[Please select a data collection site from the drop-down above]" )
     else:
-        #Convert time column to datetime
-        df_chosen_locs['times'] = pd.to_datetime(df_chosen_locs['times'])
         # List of all weather station locations
         locations_in_df = list(df_chosen_locs['location'].unique())
-        # List of all variable types
+        # List of all variable types: the parameters of the selected sites in the site
+        # registry first (config_combine.SITE_PARAMETERS), then the other parameters of
+        # the data (e.g. the extra sensors of the iChart exports)
         variables_in_df = list(df_chosen_locs['parameter'].unique())
+        site_variables = [variable for location in locations_in_df
+                          for variable in config_combine_mod.SITE_PARAMETERS.get(location, ())
+                          if variable in variables_in_df]
+        variables_in_df = list(dict.fromkeys(site_variables + variables_in_df))
         # Sidebar hides the drop-down
         with st.sidebar:
-            st.subheader("Configure data selection")
-            start_time = st.date_input("Choose start-date",
-                                    min_value=datetime.date(2000, 1, 1),
-                                    max_value=datetime.date(2023, 9, 1),
-                                    value = datetime.date(2000, 1, 1))
-            end_time = st.date_input("Choose end-date",
-                                    value = datetime.date(2023, 9, 1))
             locations_to_graph = st.multiselect('Choose desired locations',
                                                 locations_in_df,
                                                 default=locations_in_df[0])
             variable_to_plot = st.selectbox(label = "Choose a variable",
                                     options = variables_in_df,
                                     index=0)
-            # Create temporary dataframe based on date range
-            # The mask creates a boolean vector to include only values within date range
-            time_mask = (df_chosen_locs['times'] > np.datetime64(start_time)) & \
-                        (df_chosen_locs['times'] <= np.datetime64(end_time))
-            df_intime = df_chosen_locs.loc[time_mask]
-            # Configure visualization dataframe (df_viz) to queried values
-            df_loc_time_selection = df_intime.query(
-                "location == @locations_to_graph").query(
-                    f"parameter=='{variable_to_plot}'")
+            # Configure visualization dataframe (df_viz) to the chosen locations, variable
+            # and date range. The data is sorted by location, parameter and time,
+            # so the selection is found with binary searches (see schema.select_rows)
+            df_loc_time_selection = schema_mod.select_rows(df_chosen_locs,
+                                                           locations_to_graph,
+                                                           variable_to_plot,
+                                                           start_time, end_time)
             return df_loc_time_selection, variable_to_plot, locations_to_graph, start_time, end_time
 
 def create_all_time_fig(df_alltime: pd.DataFrame(),
@@ -136,7 +154,8 @@ def create_all_time_fig(df_alltime: pd.DataFrame(),
 
     Arguments:
     ----------
-    df_alltime (pd.DataFrame): df containing variables within selected date range
+    df_alltime (pd.DataFrame): df containing the selected locations and variable
+        within selected date range (from df_creation)
     graph_title (str): Title for the figure
     alltime_var (str): Variable that will be evaluated
     error_bars (bool): Boolean indicating whether or not error bars will be applied in the figure
@@ -146,15 +165,9 @@ def create_all_time_fig(df_alltime: pd.DataFrame(),
     all_time_fig (graph_objects.Figure): Final formatted figure for the chronological data
 
     """
-    # Title of plot
-    graph_title = f"{alltime_var} over Time for {locations_to_graph}"
-    mask = (df_alltime['times'] > np.datetime64(start_date)) & \
-           (df_alltime['times'] <= np.datetime64(end_date))
-    df_inrange = df_alltime.loc[mask]
-    # Configure temporary dataframe to queried values
-    df_figure_data = df_inrange.query(
-        "location == @locations_to_graph").query(
-            f"parameter=='{alltime_var}'")
+    # df_alltime is the selection of df_creation, already restricted to the locations,
+    # variable and date range, so it is plotted as it is
+    df_figure_data = df_alltime
     # Title of plot
     graph_title = f"{alltime_var} over Time for {locations_to_graph}"
     # Create plot figure
@@ -181,6 +194,40 @@ def create_all_time_fig(df_alltime: pd.DataFrame(),
                                   labels={"value_mean": f"{alltime_var}" })
     return all_time_fig
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def annual_comparison_data(df_annual: pd.DataFrame(),
+                           comparison_variable: str) -> pd.DataFrame():
+    """
+    Prepare the data for the annual comparison figure.
+    Streamlit caches the result, so each (location, parameter, frequency) selection
+    is only prepared once no matter how many times the years are re-chosen.
+
+    Arguments:
+    ----------
+    df_annual (pd.DataFrame): df containing variables within selected date range
+    comparison_variable (str): Variable that will be evaluated
+
+    Returns:
+    ----------
+    df_spec_var (pd.DataFrame): copy of the rows for comparison_variable with a categorical
+        'year' column and a numeric 'timepoint' column (fractional day of year)
+
+    """
+    # Filter df to only contain comparison variable, working on a copy
+    # so the caller's dataframe is left untouched
+    df_spec_var = df_annual.loc[df_annual['parameter'] == comparison_variable].copy()
+    # Confirm time column is in pd datetime timestamp format
+    times = schema_mod.to_datetime(df_spec_var['times'])
+    df_spec_var['times'] = times
+    # Years as categories: one string per unique year instead of one per row
+    df_spec_var['year'] = pd.Categorical(times.dt.year).rename_categories(str)
+    # Day of year plus the fraction of the day, so hourly data overlays hour by hour
+    # and daily data lands on whole days. Leap years are shifted back a day after
+    # February so the same calendar date lines up across years.
+    day_of_year = times.dt.dayofyear - (times.dt.is_leap_year & (times.dt.month > 2))
+    df_spec_var['timepoint'] = day_of_year + times.dt.hour / 24
+    return df_spec_var
+
 def create_annual_comparison_fig(df_annual:pd.DataFrame(),
                                 graph_title: str,
                                 comparison_variable:str,
@@ -201,34 +248,20 @@ def create_annual_comparison_fig(df_annual:pd.DataFrame(),
     annual_fig (graph_objects.Figure): Final formatted figure for annual comparisons
 
     """
-    # Confirm time column is in pd datetime timestamp format
-    df_annual['times'] = pd.to_datetime(df_annual['times'])
-    # Sort out the years into separate column
-    # Clearly DateTime does have a year, month, and day member, so these warnings are disabled below
-    df_annual['year'] = pd.DatetimeIndex(df_annual['times']).year.astype(str) # pylint: disable=E1101
+    # Year labels and the day-of-year axis are computed once per selection and cached
+    df_spec_var = annual_comparison_data(df_annual, comparison_variable)
     # Determine what years dataset encompasses
-    unique_years = df_annual['year'].unique()
+    unique_years = df_spec_var['year'].cat.categories
     # Prompt user for years to have in graph comparison
     comparison_years = st.multiselect(
     'Choose years to compare',
     unique_years
     )
-    # Filter df to only contain comparison variable
-    var_mask = df_annual['parameter']==comparison_variable
-    df_spec_var = df_annual.loc[var_mask]
     # Filter df to only contain dates chosen from previous user prompt
     df_yearly_comp = df_spec_var[df_spec_var['year'].isin(comparison_years)]
-    df_yearly_comp['month'] = pd.DatetimeIndex(df_yearly_comp['times']).month # pylint: disable=E1101
-    df_yearly_comp['day'] = pd.DatetimeIndex(df_yearly_comp['times']).day # pylint: disable=E1101
-    try:
-        df_yearly_comp['hour'] = df_yearly_comp['times'].datetime.hour
-        df_yearly_comp['timepoint'] = df_yearly_comp['month'].astype(str) + '/' \
-                                    + df_yearly_comp['day'].astype(str) + " " \
-                                    + df_yearly_comp['hour']
-    # Since the goal is to capture all exceptions, this warning is disabled.
-    except: # pylint: disable=bare-except
-        df_yearly_comp['timepoint'] = df_yearly_comp['month'].astype(str) + '/' \
-                                    + df_yearly_comp['day'].astype(str)
+    # Drop the years that were not chosen so they do not show up in the legend
+    df_yearly_comp = df_yearly_comp.assign(
+        year=df_yearly_comp['year'].cat.remove_unused_categories())
     graph_title = f"{comparison_variable} annual data for {locations_to_graph}"
     if error_bars:
         annual_fig = px.scatter(df_yearly_comp, x = "timepoint",
@@ -236,11 +269,11 @@ def create_annual_comparison_fig(df_annual:pd.DataFrame(),
                                 title = graph_title,
                                 color = "year",
                                 symbol = "year",
-                                hover_data = ["year", "timepoint", "location", "value_std"],
+                                hover_data = ["year", "times", "location", "value_std"],
                                 error_y = "value_std",
                                 labels={"value_mean": \
                                         f"{comparison_variable}",
-                                        "timepoint" : "Month/Day",
+                                        "timepoint" : "Day of year",
                                         "location" : "Location",
                                         "value_std" : "Std Deviation"
                                         })
@@ -250,10 +283,10 @@ def create_annual_comparison_fig(df_annual:pd.DataFrame(),
                         title = graph_title,
                         color = "year",
                         symbol = "year",
-                        hover_data = ["year", "timepoint", "location", "value_std"],
+                        hover_data = ["year", "times", "location", "value_std"],
                         labels={"value_mean": \
                                 f"{comparison_variable}",
-                                "timepoint" : "Month/Day",
+                                "timepoint" : "Day of year",
                                 "location" : "Location",
                                 "value_std" : "Std Deviation"
                                 })
@@ -0,0 +1,103 @@
+"""Import heavy libraries on first use and time the imports of the pages.
+
+Most of the cold start of the dashboard is spent importing libraries (pytimetk alone takes
+several seconds). lazy_import returns a stand-in module that imports the real one the first
+time one of its attributes is used, so a page only pays for the libraries it actually
+uses, and only once its widgets are drawn. Every import done this way is timed
+(IMPORT_TIMES), and report_import_time logs how long the imports of a page took
+the first time it ran in this process.
+
+The frontend modules and the pages all load this module by path as "lazy_imports_mod" and
+register it in sys.modules (or reuse it once it is there), so there is one copy per process
+and the pages can report the imports done by the frontend modules.
+"""
+
+import importlib
+import logging
+import sys
+import time
+
+
+# seconds taken by every library imported by lazy_import
+IMPORT_TIMES = {}
+# pages whose import time was already reported in this process
+_REPORTED_PAGES = set()
+
+
+def import_timed(name: str):
+    """
+    Import a module and record how long the import took in IMPORT_TIMES.
+
+    Arguments:
+    name (str): name of the module, e.g. "pytimetk"
+
+    Returns:
+    the imported module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    logging.info("Imported %s in %.2f s", name, IMPORT_TIMES[name])
+    return module
+
+
+class LazyModule():
+    """
+    Stand-in for a module that is imported the first time one of its attributes is used.
+    """
+
+    def __init__(self, name: str):
+        """
+        Arguments:
+        name (str): name of the module, e.g. "pytimetk"
+        """
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str):
+        """
+        Import the module if needed and return its attribute.
+        """
+        if self._module is None:
+            self._module = import_timed(self._name)
+        return getattr(self._module, attribute)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Module that is only imported when it is first used.
+
+    Arguments:
+    name (str): name of the module, e.g. "pytimetk"
+
+    Returns:
+    LazyModule that can be used like the module
+    """
+    return LazyModule(name)
+
+
+def report_import_time(page: str, page_imports: float) -> str:
+    """
+    Log the cold-start import time of a page, the first time the page runs in this
+    process (streamlit reruns the page script on every interaction, but the modules
+    stay imported, so later runs do not import anything).
+    To be called at the end of the page, so the libraries imported on first use are included.
+
+    Arguments:
+    page (str): name of the page
+    page_imports (float): seconds taken by the import statements at the top of the page
+
+    Returns:
+    report (str), or "" if the page was already reported
+    """
+    if page in _REPORTED_PAGES:
+        return ""
+    _REPORTED_PAGES.add(page)
+    report = f"Cold start of the {page} page: page imports {page_imports:.2f} s"
+    if IMPORT_TIMES:
+        first_use = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in IMPORT_TIMES.items())
+        report += f", imported on first use: {first_use}"
+    logging.info(report)
+    return report
@@ -1,4 +1,44 @@
-import folium
+"""Folium map of the buoy locations, with the selected location in red.
+
+The map of every selected location is rendered to HTML once and cached (map_html), so a
+rerun of the page only sends the cached HTML (show_map) instead of building the map,
+its markers and tile layers and serializing them again.
+"""
+
+import importlib
+import pathlib
+import sys
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+spec = importlib.util.spec_from_file_location(
+    name='lazy_imports_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//frontend//lazy_imports.py"  # full path to the script
+    )
+# one copy per process, shared with the pages, which report the import times it records
+if spec.name not in sys.modules:
+    sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules[spec.name])
+lazy_imports_mod = sys.modules[spec.name]
+
+# folium is imported when the first map is made
+folium = lazy_imports_mod.lazy_import("folium")
+
+# size of the map on the page in pixels (the defaults of streamlit_folium.folium_static)
+MAP_WIDTH = 700
+MAP_HEIGHT = 500
 
 
 def map_main(selected_buoy):
@@ -13,23 +53,15 @@ def map_main(selected_buoy):
 
     """
 
-    # Define the center of the map (for example, using the coordinates of Buoy 3)
-    center_latitude, center_longitude = 42.10992, -80.15459
-
-    # Define the buoy locations
+    # Center of the map and the buoy locations (from the site registry, config_combine.SITES)
+    center_latitude, center_longitude = config_combine_mod.MAP_CENTER
     buoy_locations = [
-        {"name": "Beach2_Buoy", "latitude": 42.15763, "longitude": -80.14044},
-        {"name": "Beach2_Tower", "latitude": 42.15381, "longitude": -80.13071},
-        {"name": "Beach6_Buoy", "latitude": 42.16363, "longitude": -80.12830},
-        {"name": "Near_Shore_Buoy", "latitude": 42.17890, "longitude": -80.12679},
-        {"name": "Walnut_Creek", "latitude": 42.13970, "longitude": -80.28418},
-        {"name": "Trec_Tower", "latitude": 42.10992, "longitude": -80.15459},
-        {"name": "Surface_Data", "latitude": 42.116952, "longitude": -80.149409},
+        {"name": name, "latitude": latitude, "longitude": longitude}
+        for name, (latitude, longitude) in config_combine_mod.SITE_COORDINATES.items()
     ]
 
-    # Check if the selected buoy is in the predefined list
-    buoy_names = [buoy["name"] for buoy in buoy_locations]
-    if selected_buoy not in buoy_names:
+    # Check if the selected buoy is in the registry
+    if selected_buoy not in config_combine_mod.SITES:
         raise ValueError(f"Invalid selected buoy '{selected_buoy}'. "
                          f"Please select a valid buoy from the list.")
 
@@ -46,3 +78,30 @@ def map_main(selected_buoy):
     folium.TileLayer('cartodbdark_matter').add_to(buoy_map)
 
     return buoy_map
+
+
+@st.cache_data(show_spinner=False, max_entries=len(config_combine_mod.SITES))
+def map_html(selected_buoy: str) -> str:
+    """
+    HTML of the map of map_main, rendered once per selected buoy and shared by all sessions.
+
+    Arguments:
+    selected_buoy (str): The name of the selected buoy.
+
+    Returns:
+    str: standalone HTML page of the map.
+
+    """
+    return folium.Figure().add_child(map_main(selected_buoy)).render()
+
+
+def show_map(selected_buoy: str) -> None:
+    """
+    Display the map of the selected buoy on the page (like streamlit_folium.folium_static,
+    but from the cached HTML).
+
+    Arguments:
+    selected_buoy (str): The name of the selected buoy.
+
+    """
+    components.html(map_html(selected_buoy), width=MAP_WIDTH, height=MAP_HEIGHT + 10)
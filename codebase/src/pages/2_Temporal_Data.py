@@ -2,7 +2,12 @@
 
 Users will be prompted to choose location(s), variable, start time, and end time."""
 
+import time
+PAGE_START = time.perf_counter()
+# pylint: disable=wrong-import-position
+import importlib
 import pathlib
+import sys
 import logging
 import streamlit as st
 
@@ -10,12 +15,25 @@ import streamlit as st
 # the 2_Temporal_Data.py module needs to be run from a file within the src folder
 from frontend import df_manip_plotting
 
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='lazy_imports_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//frontend//lazy_imports.py"  # full path to the script
+    )
+# one copy per process, shared with the frontend modules, whose import times it records
+if spec.name not in sys.modules:
+    sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules[spec.name])
+lazy_imports = sys.modules[spec.name]
+PAGE_IMPORTS = time.perf_counter() - PAGE_START
+
 # Initial Streamlit page setup
 # Page configuration must be first Streamlit command called
 st.set_page_config(layout="wide")
 st.title("Historical Buoy Data")
 # Relative path to /pages
-codebase_path = pathlib.Path(__file__).parents[2]
 DATA_PATH = str(codebase_path) + "/data/processed/combined/"
 try:
     (df_viz,
@@ -59,3 +77,5 @@ except: # pylint: disable=bare-except
     st.write(":red[Unable to plot data]")
     st.write("Please confirm data selections have been made.\
              If all fields have been selected, data may not be available for these criteria.")
+
+lazy_imports.report_import_time("Temporal Data", PAGE_IMPORTS)
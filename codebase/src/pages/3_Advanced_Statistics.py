@@ -4,28 +4,47 @@ This page displays time series data with long term time series trends.
 It also displays anomalies in the data based on user defined parameters.
 And allows users to explore the underlying statistics of the anomaly calculation"""
 
+import time
+PAGE_START = time.perf_counter()
+# pylint: disable=wrong-import-position
+import importlib
 import pathlib
+import sys
 
 import streamlit as st
 
-from streamlit_folium import folium_static
-from frontend import df_manip_plotting
 from frontend import leaflet_map
 from frontend import anomaly
 
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='lazy_imports_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//frontend//lazy_imports.py"  # full path to the script
+    )
+# one copy per process, shared with the frontend modules, whose import times it records
+if spec.name not in sys.modules:
+    sys.modules[spec.name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules[spec.name])
+lazy_imports = sys.modules[spec.name]
+
+# Heavy libraries (folium and pytimetk) are imported on first use by the frontend modules,
+# see frontend/lazy_imports.py
+PAGE_IMPORTS = time.perf_counter() - PAGE_START
+
 # Configure the page
 st.set_page_config(page_title="Advanced Statistics", layout="wide")
 st.title("Advanced Statistics")  # Title for the streamlit app
 
 # Bring in and filter the data frame based on user defined preferences
 # Relative path to /pages
-codebase_path = pathlib.Path(__file__).parents[2]
 data_path = str(codebase_path) + "/data/processed/combined/"
 df, var_plot, loc_to_plot, start_date_to_plot, end_date_to_plot = anomaly.df_creation2(
     data_path)
 
-folium_map = leaflet_map.map_main(loc_to_plot)
-folium_static(folium_map)
+# The map of every location is rendered once and cached
+leaflet_map.show_map(loc_to_plot)
 
 # Create time series trendline plot
 st.title("Time series visualization with long term trend line")
@@ -66,8 +85,28 @@ IQR_alpha = st.number_input("Enter IQR alpha value", value=0.05, step=0.01)
 
 Clean_alpha = st.number_input("Enter Clean alpha value", value=0.75, step=0.1)
 
+st.markdown(''':blue[Engine: pytimetk runs a robust STL decomposition. 
+                The native engine runs a faster approximation of it, 
+                which is recommended for long hourly selections. ]''')
+anomaly_engine = st.radio("Select anomaly engine", anomaly.ANOMALY_ENGINES, horizontal=True)
+
+# Anomalies precomputed by backend/run_anomaly_detection.py (with pytimetk)
+# are used with the default settings, when the dates cover the full history
+precomputed_anomalies = None
+if anomaly_engine == "pytimetk":
+    precomputed_anomalies = anomaly.load_anomalies(data_path,
+                                                   loc_to_plot,
+                                                   var_plot,
+                                                   st.session_state["resolution"],
+                                                   start_date_to_plot,
+                                                   end_date_to_plot,
+                                                   period,
+                                                   IQR_alpha,
+                                                   Clean_alpha)
+
 # Create figure 2 , the anomaly detection.
-fig2 = anomaly.create_anomaly_graph(df, period, IQR_alpha, Clean_alpha)
+fig2 = anomaly.create_anomaly_graph(df, period, IQR_alpha, Clean_alpha, precomputed_anomalies,
+                                    anomaly_engine)
 st.plotly_chart(fig2)
 
 if st.button("Show Statistical Decomposition"):
@@ -83,5 +122,8 @@ if st.button("Show Statistical Decomposition"):
     st.markdown(''':blue[*Residual*: Residual represents what
                     patterns are left unexplained in the data after trend 
                 and seasonal components have been removed from observed]''')
-    fig3 = anomaly.anomaly_decomp(df, period, IQR_alpha, Clean_alpha)
+    fig3 = anomaly.anomaly_decomp(df, period, IQR_alpha, Clean_alpha, precomputed_anomalies,
+                                  anomaly_engine)
     st.plotly_chart(fig3)
+
+lazy_imports.report_import_time("Advanced Statistics", PAGE_IMPORTS)
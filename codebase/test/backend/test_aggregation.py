@@ -0,0 +1,232 @@
+"""
+This file is used to test the aggregation.py file, which builds the rollups of the
+combined data and picks the resolution the dashboard reads.
+"""
+
+import os
+import unittest
+import pathlib
+import importlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='aggregation_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//aggregation.py"  # full path to the script
+    )
+
+aggregation_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aggregation_mod)
+
+
+class TestAggregation(unittest.TestCase):
+    """
+    This testing class tests rollup, merge_statistics, resolve_overlaps, choose_resolution
+    and available_resolutions.
+    """
+
+    def setUp(self) -> None:
+        """
+        Create 60 days of daily combined data for one parameter.
+        """
+        self.daily_df = pd.DataFrame({
+            "times": pd.date_range("2020-01-01", periods=60, freq="D").strftime("%Y-%m-%d"),
+            "parameter": "ODO",
+            "Units": "mg/L",
+            "value_mean": np.arange(60, dtype=float),
+            "value_std": 0.1,
+            "location": "TREC_Tower",
+        })
+
+    def test_rollup_monthly(self):
+        """
+        January and February are rolled up into one row each.
+        """
+        rollup_df = aggregation_mod.rollup(self.daily_df, "monthly")
+        self.assertEqual(list(rollup_df.columns), aggregation_mod.ROLLUP_COLUMNS)
+        self.assertEqual(list(rollup_df["times"]),
+                         [pd.Timestamp("2020-01-01"), pd.Timestamp("2020-02-01")])
+        self.assertEqual(list(rollup_df["value_count"]), [31, 29])
+        self.assertEqual(list(rollup_df["value_min"]), [0, 31])
+        self.assertEqual(list(rollup_df["value_max"]), [30, 59])
+        np.testing.assert_allclose(rollup_df["value_mean"], [15, 45])
+        np.testing.assert_allclose(rollup_df["value_std"],
+                                   [np.arange(31).std(ddof=1), np.arange(31, 60).std(ddof=1)])
+        np.testing.assert_allclose(rollup_df["value_median"], [15, 45])
+        self.assertEqual(list(rollup_df["time_last"]),
+                         [pd.Timestamp("2020-01-31"), pd.Timestamp("2020-02-29")])
+
+    def test_summarize(self):
+        """
+        The statistics of every hour match pandas, and empty hours are kept.
+        """
+        rng = np.random.default_rng(0)
+        readings = pd.DataFrame({
+            "times": pd.date_range("2020-01-01", periods=300, freq="7min"),
+            "value": rng.normal(size=300),
+            "parameter": "ODO",
+            "Units": "mg/L",
+        })
+        readings = readings.drop(index=range(100, 150))
+        summary_df = aggregation_mod.summarize(readings, "H", ["parameter", "Units"])
+        expected = readings.set_index("times").groupby(["parameter", "Units"])["value"] \
+            .resample("H").agg(["mean", "std", "count", "min", "median", "max"]).reset_index()
+
+        self.assertEqual(len(summary_df), len(expected))
+        self.assertEqual(list(summary_df["value_count"]), list(expected["count"]))
+        for column, statistic in [("value_mean", "mean"), ("value_std", "std"),
+                                  ("value_min", "min"), ("value_median", "median"),
+                                  ("value_max", "max")]:
+            np.testing.assert_allclose(summary_df[column], expected[statistic])
+        self.assertEqual(summary_df.loc[0, "time_last"], pd.Timestamp("2020-01-01 00:56"))
+        self.assertTrue(summary_df.loc[summary_df["value_count"] == 0, "time_first"].isna().all())
+
+    def test_merge_quantiles(self):
+        """
+        Merged sketches are close to the quantiles of all values, min and max are exact.
+        """
+        rng = np.random.default_rng(0)
+        values = rng.gamma(2, size=(30, 200))
+        probabilities = list(aggregation_mod.QUANTILES.values())
+        quantiles = np.quantile(values, probabilities, axis=1).T
+        merged = aggregation_mod.merge_quantiles(quantiles, np.full(30, 200))
+        expected = np.quantile(values, probabilities)
+        self.assertEqual(merged[0], expected[0])
+        self.assertEqual(merged[-1], expected[-1])
+        np.testing.assert_allclose(merged, expected, rtol=0.05)
+
+    def test_merge_statistics(self):
+        """
+        Merging the hours summarized from two halves of the readings gives the same
+        mean, std, count and extremes as summarizing all of them at once.
+        """
+        rng = np.random.default_rng(0)
+        readings = pd.DataFrame({
+            "times": pd.date_range("2020-01-01", periods=48, freq="H"),
+            "value": rng.normal(size=48),
+            "parameter": "ODO",
+            "Units": "mg/L",
+        })
+        expected = aggregation_mod.summarize(readings, "D", ["parameter", "Units"])
+        halves = pd.concat([
+            aggregation_mod.summarize(readings.iloc[::2], "D", ["parameter", "Units"]),
+            aggregation_mod.summarize(readings.iloc[1::2], "D", ["parameter", "Units"]),
+        ])
+        merged_df = aggregation_mod.merge_statistics(halves, ["times", "parameter", "Units"])
+
+        self.assertEqual(list(merged_df.columns), list(halves.columns))
+        self.assertEqual(list(merged_df["value_count"]), [24, 24])
+        for column in ["value_mean", "value_std", "value_sum", "value_sumsq",
+                       "value_min", "value_max"]:
+            np.testing.assert_allclose(merged_df[column], expected[column])
+        self.assertEqual(list(merged_df["time_last"]), list(expected["time_last"]))
+
+    def test_merge_statistics_legacy_rows(self):
+        """
+        Rows without statistics count as a single value, and rows that are not merged
+        are unchanged.
+        """
+        df = pd.DataFrame({
+            "times": ["2020-01-01", "2020-01-01", "2020-01-02"],
+            "parameter": "ODO",
+            "Units": "mg/L",
+            "value_mean": [1.0, 3.0, 5.0],
+            "value_std": [np.nan, np.nan, 0.5],
+        })
+        merged_df = aggregation_mod.merge_statistics(df, ["times", "parameter", "Units"])
+        self.assertEqual(list(merged_df.columns), list(df.columns))
+        self.assertEqual(list(merged_df["times"]), ["2020-01-01", "2020-01-02"])
+        np.testing.assert_allclose(merged_df["value_mean"], [2.0, 5.0])
+        np.testing.assert_allclose(merged_df["value_std"], [np.sqrt(2), 0.5])
+
+    def test_resolve_overlaps(self):
+        """
+        Overlapping rows are merged, or the row of the preferred source is kept,
+        following the rule of their parameter. The other rows are kept, sorted by time.
+        """
+        df = pd.DataFrame({
+            "times": ["2020-01-02", "2020-01-01", "2020-01-01", "2020-01-01", "2020-01-01"],
+            "parameter": ["ODO", "ODO", "Temperature", "ODO", "Temperature"],
+            "Units": ["mg/L", "mg/L", "F", "mg/L", "F"],
+            "value_mean": [5.0, 1.0, 60.0, 3.0, 70.0],
+            "value_std": [0.5, np.nan, np.nan, np.nan, np.nan],
+        })
+        # the last two rows come from the preferred source
+        rank = np.array([1, 1, 1, 0, 0])
+        resolved_df = aggregation_mod.resolve_overlaps(
+            df, ["times", "parameter", "Units"], rank, {"Temperature": "priority"})
+
+        self.assertEqual(list(resolved_df.columns), list(df.columns))
+        self.assertEqual(list(resolved_df["times"]), ["2020-01-01", "2020-01-01", "2020-01-02"])
+        self.assertEqual(list(resolved_df["parameter"]), ["ODO", "Temperature", "ODO"])
+        # ODO is merged (like merge_statistics), Temperature comes from the preferred source
+        np.testing.assert_allclose(resolved_df["value_mean"], [2.0, 70.0, 5.0])
+        np.testing.assert_allclose(resolved_df["value_std"], [np.sqrt(2), np.nan, 0.5])
+
+        # everything from the preferred source
+        resolved_df = aggregation_mod.resolve_overlaps(
+            df, ["times", "parameter", "Units"], rank, {"default": "priority"})
+        np.testing.assert_allclose(resolved_df["value_mean"], [3.0, 70.0, 5.0])
+
+    def test_rollup_weekly(self):
+        """
+        Weeks are labelled with their Monday, so no label is after the days of its week.
+        2020-01-01 is a Wednesday: the first week has 5 days.
+        """
+        rollup_df = aggregation_mod.rollup(self.daily_df, "weekly")
+        self.assertEqual(list(rollup_df["times"][:2]),
+                         [pd.Timestamp("2019-12-30"), pd.Timestamp("2020-01-06")])
+        self.assertEqual(list(rollup_df["value_count"][:2]), [5, 7])
+        self.assertTrue((rollup_df["times"].dt.dayofweek == 0).all())
+        self.assertTrue((rollup_df["times"] <= rollup_df["time_first"]).all())
+        self.assertTrue((rollup_df["time_last"] - rollup_df["times"] < pd.Timedelta("7D")).all())
+
+    def test_rollup_skips_missing(self):
+        """
+        Missing values are not counted, and buckets without values are dropped.
+        """
+        self.daily_df.loc[:30, "value_mean"] = np.nan
+        rollup_df = aggregation_mod.rollup(self.daily_df, "monthly")
+        self.assertEqual(len(rollup_df), 1)
+        self.assertEqual(rollup_df.loc[0, "value_count"], 29)
+
+    def test_choose_resolution(self):
+        """
+        The coarsest resolution with at least plot_points buckets is chosen.
+        """
+        all_resolutions = ["hourly", "daily", "weekly", "monthly", "annual"]
+        # 23 years: ~1200 weeks but only ~280 months
+        self.assertEqual(aggregation_mod.choose_resolution("2000-01-01", "2023-01-01",
+                                                           all_resolutions, 500), "weekly")
+        # 3 years: ~1100 days but only ~160 weeks
+        self.assertEqual(aggregation_mod.choose_resolution("2020-01-01", "2023-01-01",
+                                                           all_resolutions, 500), "daily")
+        # too short for every resolution: the finest available one
+        self.assertEqual(aggregation_mod.choose_resolution("2022-12-01", "2023-01-01",
+                                                           ["daily", "weekly"], 500), "daily")
+        with self.assertRaises(ValueError):
+            aggregation_mod.choose_resolution("2020-01-01", "2023-01-01", [], 500)
+
+    def test_available_resolutions(self):
+        """
+        Only resolutions with a file at every location are available.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for loc, resolutions in [("A", ["daily", "weekly"]), ("B", ["daily"])]:
+                os.makedirs(f"{temp_dir}/{loc}")
+                for resolution in resolutions:
+                    self.daily_df.to_csv(f"{temp_dir}/{loc}/{resolution}_data.csv")
+            self.assertEqual(aggregation_mod.available_resolutions(f"{temp_dir}/", ["A"]),
+                             ["daily", "weekly"])
+            self.assertEqual(aggregation_mod.available_resolutions(f"{temp_dir}/", ["A", "B"]),
+                             ["daily"])
+
+
+if __name__ == '__main__':
+    unittest.main()
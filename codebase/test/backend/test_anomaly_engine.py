@@ -0,0 +1,142 @@
+"""
+This file is used to test the anomaly_engine.py file.
+The native engine is validated against pytimetk.anomalize on the same series:
+the output columns must match, and on the project's combined data the two engines
+must flag the same points.
+"""
+
+import unittest
+import pathlib
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytimetk
+from statsmodels.tsa.seasonal import STL
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='anomaly_engine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//anomaly_engine.py"  # full path to the script
+    )
+
+anomaly_engine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(anomaly_engine_mod)
+
+
+class TestAnomalyEngine(unittest.TestCase):
+    """
+    This testing class compares anomaly_engine.anomalize with pytimetk.anomalize.
+    """
+
+    def setUp(self) -> None:
+        """
+        Create two years of daily data with a yearly and weekly cycle, noise and five spikes.
+        """
+        rng = np.random.default_rng(0)
+        n = 730
+        day = np.arange(n)
+        values = 10 * np.sin(2 * np.pi * day / 365) + 2 * np.sin(2 * np.pi * day / 7) \
+            + rng.normal(0, 0.5, n)
+        self.spikes = [100, 250, 400, 550, 700]
+        values[self.spikes] += [8, -8, 8, -8, 8]
+        self.df = pd.DataFrame({
+            "times": pd.date_range("2020-01-01", periods=n, freq="D"),
+            "value_mean": values,
+        })
+
+    def anomalize_both(self):
+        """
+        Run both engines with the dashboard defaults.
+        """
+        pytimetk_df = pytimetk.anomalize(self.df, "times", "value_mean", period=7,
+                                         iqr_alpha=0.05, clean_alpha=0.75, clean="min_max")
+        native_df = anomaly_engine_mod.anomalize(self.df, "times", "value_mean", period=7,
+                                                 iqr_alpha=0.05, clean_alpha=0.75)
+        return pytimetk_df, native_df
+
+    def test_same_columns(self):
+        """
+        The native output has the columns of pytimetk.anomalize, in the same order.
+        """
+        pytimetk_df, native_df = self.anomalize_both()
+        self.assertEqual(list(native_df.columns), list(pytimetk_df.columns))
+        self.assertEqual(len(native_df), len(self.df))
+
+    def combined_series(self, location: str, parameter: str) -> pd.DataFrame:
+        """
+        Daily means of one parameter from the combined data in the repository.
+        """
+        df = pd.read_csv(codebase_path / "data" / "processed" / "combined" / location /
+                         "daily_data.csv", usecols=["times", "parameter", "value_mean"])
+        df = df[df["parameter"] == parameter][["times", "value_mean"]].dropna()
+        df["times"] = pd.to_datetime(df["times"])
+        return df.sort_values("times").reset_index(drop=True)
+
+    def test_flags_agree(self):
+        """
+        On the combined project data both engines flag (almost) the same points.
+        """
+        for location, parameter in [("Trec_Tower", "Air_Temperature"),
+                                    ("Beach2_Tower", "Air_Temperature"),
+                                    ("Walnut_Creek", "Air_Temperature"),
+                                    ("Near_Shore_Buoy", "ODO")]:
+            with self.subTest(location=location, parameter=parameter):
+                self.df = self.combined_series(location, parameter)
+                pytimetk_df, native_df = self.anomalize_both()
+                pytimetk_flags = pytimetk_df["anomaly"].values == "Yes"
+                native_flags = native_df["anomaly"].values == "Yes"
+                both = (pytimetk_flags & native_flags).sum()
+                self.assertGreater(pytimetk_flags.sum(), 0)
+                self.assertGreaterEqual(both / pytimetk_flags.sum(), 0.95)
+                self.assertGreaterEqual(both / (pytimetk_flags | native_flags).sum(), 0.9)
+
+    def test_spikes_flagged(self):
+        """
+        Both engines flag the spikes of the synthetic series.
+        """
+        pytimetk_df, native_df = self.anomalize_both()
+        self.assertTrue((pytimetk_df.loc[self.spikes, "anomaly"] == "Yes").all())
+        self.assertTrue((native_df.loc[self.spikes, "anomaly"] == "Yes").all())
+
+    def test_same_decomposition_as_stl(self):
+        """
+        The decomposition is the robust STL fit of statsmodels, which pytimetk runs.
+        """
+        self.df = self.combined_series("Trec_Tower", "Air_Temperature")
+        trend = anomaly_engine_mod.trend_window(self.df["times"], 7)
+        self.assertEqual(trend, anomaly_engine_mod.make_odd(
+            int(pytimetk.get_trend_frequency(self.df["times"], numeric=True))))
+        observed = self.df["value_mean"].to_numpy()
+        stl = STL(observed, period=7, seasonal=7, trend=trend, robust=True).fit()
+        seasonal, trend_values = anomaly_engine_mod.decompose(observed, 7, trend)
+        np.testing.assert_allclose(seasonal, stl.seasonal, atol=1e-8)
+        np.testing.assert_allclose(trend_values, stl.trend, atol=1e-8)
+
+    def test_decomposition_adds_up(self):
+        """
+        observed = seasonal + trend + remainder, and cleaning only changes anomalies.
+        """
+        _, native_df = self.anomalize_both()
+        np.testing.assert_allclose(native_df["seasonal"] + native_df["trend"]
+                                   + native_df["remainder"], native_df["observed"])
+        normal = native_df["anomaly"] == "No"
+        np.testing.assert_allclose(native_df.loc[normal, "observed_clean"],
+                                   native_df.loc[normal, "observed"])
+
+    def test_trend_window(self):
+        """
+        The trend window is odd and longer than the period.
+        """
+        window = anomaly_engine_mod.trend_window(self.df["times"], 7)
+        self.assertEqual(window % 2, 1)
+        self.assertGreater(window, 7)
+        short_times = pd.Series(pd.date_range("2020-01-01", periods=3, freq="D"))
+        self.assertGreater(anomaly_engine_mod.trend_window(short_times, 7), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+This is the testing script for the benchmark_pipeline.py file, which times the stages
+of the pipeline on synthetic data.
+"""
+import os
+import tempfile
+import unittest
+import pathlib
+import importlib
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='benchmark_pipeline_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//benchmark_pipeline.py"  # full path to the script
+    )
+
+benchmark_pipeline_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(benchmark_pipeline_mod)
+
+
+class TestBenchmarkPipeline(unittest.TestCase):
+    """
+    Test Class for the benchmark: a small run of every stage, and the comparison
+    to a baseline.
+    """
+
+    def test_run_benchmark(self):
+        """
+        Every stage of the pipeline runs on the synthetic data and reports its results.
+        """
+        with tempfile.TemporaryDirectory() as workspace:
+            results = benchmark_pipeline_mod.run_benchmark(
+                workspace, sites=1, parameters=2, years=1, interval_minutes=60)
+            self.assertTrue(os.path.exists(
+                os.path.join(workspace, "processed", "combined", "Trec_Tower", "monthly_data.csv")))
+
+        self.assertEqual(list(results["stages"])[0], "downsample")
+        self.assertIn("annual_figure", results["stages"])
+        # 2 parameters, hourly for a year
+        self.assertEqual(results["stages"]["downsample"]["rows"], 2 * 8760)
+        for result in results["stages"].values():
+            self.assertGreater(result["rows"], 0)
+            self.assertGreaterEqual(result["seconds"], 0)
+
+    def test_compare(self):
+        """
+        Stages slower than the baseline (beyond the tolerance and the noise) are regressions.
+        """
+        config = {"sites": 1}
+        baseline = {benchmark_pipeline_mod.config_key(config): {"config": config, "stages": {
+            "downsample": {"seconds": 10.0, "peak_mb": 100.0},
+            "combine_daily": {"seconds": 1.0, "peak_mb": 10.0},
+        }}}
+        results = {"config": config, "stages": {
+            "downsample": {"seconds": 15.0, "peak_mb": 101.0},
+            "combine_daily": {"seconds": 1.05, "peak_mb": 12.0},
+        }}
+        regressions = benchmark_pipeline_mod.compare(results, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("downsample: seconds"))
+        # no baseline for another configuration
+        self.assertEqual(benchmark_pipeline_mod.compare({"config": {"sites": 2}, "stages": {}},
+                                                        baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+This file is used to test the site registry of config_combine.py (SITES)
+and the lists of sites derived from it.
+"""
+
+import os
+import unittest
+import pathlib
+import importlib
+
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='config_combine_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//config_combine.py"  # full path to the script
+    )
+
+config_combine_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(config_combine_mod)
+
+
+class TestSites(unittest.TestCase):
+    """
+    This testing class tests that every site of the registry is complete
+    and that the derived lookups agree with it.
+    """
+
+    def test_sites(self):
+        """
+        Every site is registered under its name, with coordinates, three sources
+        and at least one device and parameter.
+        """
+        for name, site in config_combine_mod.SITES.items():
+            self.assertEqual(site.name, name)
+            self.assertEqual(len(site.coordinates), 2)
+            self.assertEqual(len(site.devices), 3)
+            self.assertTrue(any(device is not None for device in site.devices))
+            self.assertGreater(len(site.parameters), 0)
+
+    def test_site_parameters(self):
+        """
+        The parameters of every site have their standardized names, and are in the
+        combined data of the site when it is in the repository.
+        """
+        renamed = set(config_combine_mod.PARAMETER_NAMES)
+        for name, site in config_combine_mod.SITES.items():
+            self.assertFalse(renamed & set(site.parameters))
+            self.assertEqual(config_combine_mod.SITE_PARAMETERS[name], site.parameters)
+            path = codebase_path / "data" / "processed" / "combined" / name / "daily_data.csv"
+            if os.path.exists(path):
+                parameters = set(pd.read_csv(path, usecols=["parameter"])["parameter"])
+                self.assertLessEqual(set(site.parameters), parameters)
+
+    def test_derived_lookups(self):
+        """
+        The lookups of the pipeline and the dashboard are derived from the registry.
+        """
+        sites = config_combine_mod.SITES
+        self.assertEqual(set(config_combine_mod.COMBINE_MAP), set(sites))
+        self.assertEqual(config_combine_mod.COMBINE_MAP["Trec_Tower"],
+                         ["TREC_Tower", None, "TREC_Tower_iSIC"])
+        self.assertEqual(config_combine_mod.SITE_COORDINATES["Walnut_Creek"],
+                         sites["Walnut_Creek"].coordinates)
+        # display names are unique, so every one maps back to its site
+        self.assertEqual(len(config_combine_mod.DISPLAY_NAMES), len(sites))
+        self.assertEqual(config_combine_mod.DISPLAY_NAMES["TREC Tower"], "Trec_Tower")
+        self.assertEqual(sorted(config_combine_mod.ICHART_DEVICES),
+                         ["Beach2_Buoy", "Beach2_Tower", "Beach6_Buoy", "TREC_Tower"])
+
+
+if __name__ == '__main__':
+    unittest.main()
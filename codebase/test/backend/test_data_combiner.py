@@ -85,10 +85,11 @@ class TestDataCombiner(unittest.TestCase):
                     os.remove(f"{path}/{project}/{device}/tidy_daily_all_data.csv")
                 if os.path.exists(f"{path}/{project}/{device}/tidy_hourly_all_data.csv"):
                     os.remove(f"{path}/{project}/{device}/tidy_hourly_all_data.csv")
-                if os.path.exists(f"{path}/combined/{device}/daily_data.csv"):
-                    os.remove(f"{path}/combined/{device}/daily_data.csv")
-                if os.path.exists(f"{path}/combined/{device}/hourly_data.csv"):
-                    os.remove(f"{path}/combined/{device}/hourly_data.csv")
+                for resolution in ["hourly", "daily", "weekly", "monthly", "annual"]:
+                    for extension in ["csv", "arrow"]:
+                        file = f"{path}/combined/{device}/{resolution}_data.{extension}"
+                        if os.path.exists(file):
+                            os.remove(file)
                 if os.path.exists(f"{path}/{project}/{device}"):
                     os.rmdir(f"{path}/{project}/{device}")
                 if os.path.exists(f"{path}/combined/{device}"):
@@ -170,6 +171,13 @@ class TestDataCombiner(unittest.TestCase):
         self.data_combiner.combine_daily()
         path = f"{self.processed_path}/combined/TREC_Tower"
         self.assertTrue(os.path.exists(os.path.join(path, "daily_data.csv")))
+        # the Arrow copy holds the same data as the csv file, sorted by location,
+        # parameter and time
+        schema_mod = data_combiner_mod.schema_mod
+        pd.testing.assert_frame_equal(
+            schema_mod.read_arrow(os.path.join(path, "daily_data.arrow")),
+            schema_mod.sort_rows(schema_mod.read_csv(os.path.join(path, "daily_data.csv"))),
+            check_categorical=False)
         df = pd.read_csv(os.path.join(path, "daily_data.csv"))
         self.assertTrue(df["times"].equals(expected_data["times"]),
                         "times are not equal")
@@ -235,6 +243,128 @@ class TestDataCombiner(unittest.TestCase):
         self.assertTrue(df["location"].equals(expected_data["location"]),
                         "locations are not equal")
 
+    def test_combine_rollups(self):
+        """
+        Testing the function combine_rollups. The three daily values of each parameter
+        fall in different years, so they are separate monthly and annual rows.
+        """
+        self.data_combiner.combine_daily()
+        self.data_combiner.combine_rollups()
+        path = f"{self.processed_path}/combined/TREC_Tower"
+        for resolution in ["weekly", "monthly", "annual"]:
+            self.assertTrue(os.path.exists(os.path.join(path, f"{resolution}_data.csv")))
+            self.assertTrue(os.path.exists(os.path.join(path, f"{resolution}_data.arrow")))
+
+        df = pd.read_csv(os.path.join(path, "annual_data.csv"))
+        self.assertEqual(list(df.columns), ["times", "parameter", "Units", "value_mean",
+                                            "value_std", "value_count", "value_sum",
+                                            "value_sumsq", "value_min",
+                                            "value_q10", "value_q25", "value_median",
+                                            "value_q75", "value_q90", "value_max",
+                                            "time_first", "time_last", "location"])
+        self.assertEqual(list(df["times"]), ["2011-01-01", "2018-01-01", "2022-01-01"] * 2)
+        self.assertTrue((df["value_count"] == 1).all())
+        air_temperature = df[df["parameter"] == "Air_Temperature"]
+        self.assertTrue(np.allclose(air_temperature["value_mean"], 42.4))
+        self.assertTrue(np.allclose(air_temperature["value_max"], 42.4))
+        self.assertTrue((df["location"] == "TREC_Tower").all())
+
+    def test_combine_daily_overlap(self):
+        """
+        Testing that the rows of overlapping sources are merged into one row per
+        parameter and time, with the mean and std of all their readings.
+        """
+        path = f"{self.processed_path}/new/TREC_Tower/tidy_daily_all_data.csv"
+        pd.DataFrame({
+            "times": ["2018-01-01", "2022-01-01"],
+            "Units": ["mg/L", "mg/L"],
+            "value_mean": [11.0, 9.9],
+            "value_std": [1.0, 0.6245],
+            "parameter": ["ODO", "ODO"],
+            "value_count": [24, 24],
+        }).to_csv(path, index=False)
+        old_path = f"{self.processed_path}/old/TREC_Tower/tidy_daily_all_data.csv"
+        old_df = pd.read_csv(old_path)
+        old_df["value_count"] = 24
+        old_df.to_csv(old_path, index=False)
+
+        self.data_combiner.combine_daily()
+        df = pd.read_csv(f"{self.processed_path}/combined/TREC_Tower/daily_data.csv")
+        odo = df[(df["parameter"] == "ODO") & (df["times"] == "2018-01-01")]
+        self.assertEqual(len(odo), 1)
+        self.assertEqual(odo["value_count"].iloc[0], 48)
+        readings_mean = (9.9 + 11.0) / 2
+        sumsq = 23 * (0.6245 ** 2 + 1.0 ** 2) + 24 * (9.9 ** 2 + 11.0 ** 2)
+        readings_std = np.sqrt((sumsq - 48 * readings_mean ** 2) / 47)
+        self.assertTrue(np.isclose(odo["value_mean"].iloc[0], readings_mean))
+        self.assertTrue(np.isclose(odo["value_std"].iloc[0], readings_std))
+        self.assertFalse(df.duplicated(["times", "parameter"]).any())
+
+    def test_combine_polars_backend(self):
+        """
+        Testing that the polars backend writes the same combined data as the pandas backend,
+        with overlapping sources, a renamed parameter and an outlier.
+        """
+        path = f"{self.processed_path}/new/TREC_Tower/tidy_hourly_all_data.csv"
+        pd.DataFrame({
+            "times": ["2018-01-01 13:00:00", "2018-01-01 13:00:00", "2022-01-01 14:00:00",
+                      "2022-01-01 15:00:00"],
+            "Units": ["mg/L", "F", "mg/L", "F"],
+            "value_mean": [11.0, 43.0, 45.0, np.nan],
+            "value_std": [1.0, 0.5, 0.6245, np.nan],
+            "parameter": ["ODO", "AirTemp", "DO", "Air_Temperature"],
+            "value_count": [24, 24, 24, 0],
+        }).to_csv(path, index=False)
+
+        for resolution in ["daily", "hourly"]:
+            self.data_combiner.set_backend("pandas")
+            self.data_combiner.combine(resolution)
+            path = f"{self.processed_path}/combined/TREC_Tower/{resolution}_data.csv"
+            expected = pd.read_csv(path)
+
+            self.data_combiner.set_backend("polars")
+            self.data_combiner.combine(resolution)
+            pd.testing.assert_frame_equal(pd.read_csv(path), expected)
+            # the outdated Arrow copy is removed, the dashboard writes a new one
+            self.assertFalse(os.path.exists(path.replace(".csv", ".arrow")))
+
+        # 2011 and 2018 rows of the other sources, the ODO outlier (45 mg/L) is removed,
+        # the 2018 rows of the new source are merged and the missing value is kept
+        self.assertEqual(len(expected), 5)
+        self.assertFalse(expected.duplicated(["times", "parameter"]).any())
+
+        with self.assertRaises(ValueError):
+            self.data_combiner.set_backend("dask")
+
+    def test_combine_keeps_precision(self):
+        """
+        Testing that the combined csv file keeps the float64 values of the sources
+        with both backends, and that only the Arrow copy is compact.
+        """
+        path = f"{self.processed_path}/new/TREC_Tower/tidy_daily_all_data.csv"
+        pd.DataFrame({
+            "times": ["1/1/2022", "1/1/2022"],
+            "Units": ["F", "mg/L"],
+            "value_mean": [68.18543689320389, 9.123456789012345],
+            "value_std": [2.8938205890087003, 0.1234567890123],
+            "parameter": ["Air_Temperature", "ODO"]
+        }).to_csv(path, index=False)
+
+        for backend in ["pandas", "polars"]:
+            self.data_combiner.set_backend(backend)
+            self.data_combiner.combine_daily()
+            path = f"{self.processed_path}/combined/TREC_Tower/daily_data.csv"
+            df = pd.read_csv(path)
+            df = df[df["times"] == "2022-01-01"].sort_values("parameter")
+            self.assertEqual(list(df["value_mean"]), [68.18543689320389, 9.123456789012345])
+            self.assertEqual(list(df["value_std"]), [2.8938205890087003, 0.1234567890123])
+
+        self.data_combiner.set_backend("pandas")
+        self.data_combiner.combine_daily()
+        schema_mod = data_combiner_mod.schema_mod
+        arrow_df = schema_mod.read_arrow(schema_mod.arrow_path(path))
+        self.assertEqual(arrow_df["value_mean"].dtype, "float32")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -6,10 +6,18 @@ import unittest
 import sys
 import pathlib
 import importlib
+import os
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
 
 sys.path.append("../../src/backend") # Local Running
 sys.path.append("/home/runner/work/LakeErie/LakeErie/codebase/test/backend/../../src/backend") # Git Actions Running
-from data_loader import DataLoader
+from data_loader import (APIError, DataLoader, MetadataCache, QuotaExceededError,
+                         TransientError, backoff_delay)
 
 # codebase_path = pathlib.Path(__file__).parents[2]
 # #https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
@@ -43,13 +51,14 @@ class TestDataLoader(unittest.TestCase):
         """
         mock_conn("www.wqdatalive.com").request.return_value = None
         mock_conn("www.wqdatalive.com").getresponse.return_value = mock_res
+        mock_res.status = 200
         mock_res.read.return_value = '{"devices": [{"id": "1234", "name": "test"}]}'.encode("utf-8")
 
         test_url = "/api/v1/devices?apiKey=1234"
         data = DataLoader(apiKey="1234", project="test").api_call(url=test_url)
 
         # Check that API is called with correct arguments
-        mock_conn("www.wqdatalive.com").request.assert_called_with("GET", test_url)
+        mock_conn("www.wqdatalive.com").request.assert_called_with("GET", test_url, headers={})
         # Check that API response is parsed correctly
         self.assertEqual(data, {"devices": [{"id": "1234", "name": "test"}]})
 
@@ -104,26 +113,183 @@ class TestDataLoader(unittest.TestCase):
             {"Air_Temperature": ("1234", "test units")}
         )
 
-    #@patch('data_loader.DataLoader.api_call', return_value={"data": [{"value": "1234", "timestamp": "2021-01-01T00:00:00.000Z"}]})
-    #@patch('data_loader.DataLoader.find_errors', return_value=True)
-    #def test_get_data(self, mock_find_errors, mock_api_call):
-    #    """
-    #    This functions thats the get_data function in the DataLoader class calls the WQData API
-    #    with the correct arguments and returns the correct data.
-        #"""
-        #data_loader = DataLoader(apiKey="1234", project="test")
-        #data = data_loader.get_data(
-        #    deviceId="1234",
-        #    parameterId="1234",
-        #    start_date="2021-01-01",
-        #    end_date="2021-01-02"
-        #)
+    @patch('data_loader.time.sleep')
+    @patch('data_loader.DataLoader.request')
+    def test_api_call_retries(self, mock_request, mock_sleep):
+        """
+        This function tests that api_call retries transient errors with a backoff,
+        and raises TransientError once every attempt failed.
+        """
+        mock_request.side_effect = [TransientError("reset"), TransientError("timeout"),
+                                    {"devices": []}]
+        data = DataLoader(apiKey="1234", project="test").api_call(url="/api/v1/devices")
+        self.assertEqual(data, {"devices": []})
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+        mock_request.reset_mock()
+        mock_request.side_effect = TransientError("503 Service Unavailable")
+        with self.assertRaises(TransientError):
+            DataLoader(apiKey="1234", project="test", max_attempts=2).api_call(url="/api/v1/devices")
+        self.assertEqual(mock_request.call_count, 2)
+
+    @patch('data_loader.http.client.HTTPSConnection')
+    def test_request_errors(self, mock_conn):
+        """
+        This function tests that request raises QuotaExceededError on a 429 response,
+        APIError on another 4xx response, and TransientError on network errors
+        (e.g. a DNS failure).
+        """
+        mock_res = mock_conn.return_value.getresponse.return_value
+        mock_res.getheader.return_value = None
+        data_loader = DataLoader(apiKey="1234", project="test")
+
+        mock_res.status, mock_res.reason = 429, "Too Many Requests"
+        mock_res.read.return_value = b'{"message": "Request exceeds hourly limit"}'
+        with self.assertRaises(QuotaExceededError):
+            data_loader.request("/api/v1/devices?apiKey=1234")
+
+        mock_res.status, mock_res.reason = 401, "Unauthorized"
+        mock_res.read.return_value = b'{"message": "Invalid API key"}'
+        with self.assertRaisesRegex(APIError, "Invalid API key"):
+            data_loader.request("/api/v1/devices?apiKey=1234")
+
+        mock_conn.return_value.request.side_effect = socket.gaierror("Name or service not known")
+        with self.assertRaises(TransientError):
+            data_loader.request("/api/v1/devices?apiKey=1234")
+
+    def test_backoff_delay(self):
+        """
+        This function tests that the backoff delays grow exponentially up to their cap.
+        """
+        for attempt in range(1, 10):
+            delay = backoff_delay(attempt, backoff=1.0, max_backoff=60.0)
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, min(60.0, 2.0 ** (attempt - 1)))
+
+    @patch('data_loader.DataLoader.request', return_value={"message": "Request exceeds hourly limit"})
+    def test_get_data_quota(self, mock_request):
+        """
+        This function tests that reaching the hourly limit raises QuotaExceededError
+        without retrying.
+        """
+        with self.assertRaises(QuotaExceededError):
+            DataLoader(apiKey="1234", project="test").get_data(
+                deviceId="1234", parameterId="1234", start_date="2021-01-01", end_date="2021-02-01")
+        mock_request.assert_called_once()
+
+    @patch('data_loader.DataLoader.request', return_value={"message": "Invalid API key"})
+    def test_get_data_without_data(self, mock_request):
+        """
+        This function tests that a response without data raises APIError, not KeyError.
+        """
+        with self.assertRaisesRegex(APIError, "Invalid API key"):
+            DataLoader(apiKey="1234", project="test").get_data(
+                deviceId="1234", parameterId="1234", start_date="2021-01-01", end_date="2021-02-01")
+
+    @patch('data_loader.DataLoader.api_call', return_value={"data": [
+        {"value": "12.5", "timestamp": "2021-01-01 00:00:00"},
+        {"value": None, "timestamp": "2021-01-01 00:10:00"},
+        {"value": 13, "timestamp": "2021-01-01 00:20:00"},
+        {"value": 14, "timestamp": "2021-01-01T00:30:00.000Z"},
+        {"value": 15, "timestamp": "2021-01-01T01:40:00.000+01:00"}]})
+    @patch('data_loader.DataLoader.find_errors', return_value=True)
+    def test_get_data(self, mock_find_errors, mock_api_call):
+        """
+        This function tests that the get_data function in the DataLoader class calls the WQData API
+        and returns the readings as a typed dataframe.
+        """
+        data_loader = DataLoader(apiKey="1234", project="test")
+        data = data_loader.get_data(
+            deviceId="1234",
+            parameterId="1234",
+            start_date="2021-01-01",
+            end_date="2021-01-02"
+        )
         # Verify that WQData API is only called once
-        # mock_api_call.assert_called_once()
+        mock_api_call.assert_called_once()
         # Verify that find_errors is only called once
-        # mock_find_errors.assert_called_once()
-        # Verify that data_loader correctly parses data from API and returns pandas dataFrame
-        #self.assertEqual(data["values"], "1234")
+        mock_find_errors.assert_called_once()
+        # Verify that data_loader parses the times and values into typed columns
+        self.assertEqual(str(data["times"].dtype), "datetime64[ns]")
+        self.assertEqual(data["times"][2], pd.Timestamp("2021-01-01 00:20:00"))
+        # times with an offset are converted to UTC
+        self.assertEqual(data["times"][3], pd.Timestamp("2021-01-01 00:30:00"))
+        self.assertEqual(data["times"][4], pd.Timestamp("2021-01-01 00:40:00"))
+        self.assertEqual(data["values"].dtype, np.float64)
+        self.assertEqual(data["values"][0], 12.5)
+        self.assertTrue(np.isnan(data["values"][1]))
+
+    @patch('data_loader.DataLoader.request')
+    def test_metadata_cache(self, mock_request):
+        """
+        This function tests that the device listing is cached on disk: a new DataLoader
+        does not call the API while the listing is fresh, and validates it with a
+        conditional request once it is stale.
+        """
+        mock_request.return_value = {"devices": [{"id": "1234", "name": "test device"}]}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metadata_cache.json")
+
+            def get_devices(ttl):
+                data_loader = DataLoader(apiKey="1234", project="test",
+                                         metadata_cache=MetadataCache(path, ttl=ttl))
+                data_loader.etag = '"v1"'
+                devices = data_loader.get_devices()
+                # a second call does not ask the API or the cache again
+                self.assertEqual(data_loader.get_devices(), devices)
+                return devices
+
+            self.assertEqual(get_devices(ttl=3600), {"test_device": "1234"})
+            self.assertEqual(mock_request.call_count, 1)
+            # fresh in a new process: no call
+            self.assertEqual(get_devices(ttl=3600), {"test_device": "1234"})
+            self.assertEqual(mock_request.call_count, 1)
+            # stale: conditional request, answered 304 Not Modified
+            mock_request.return_value = None
+            self.assertEqual(get_devices(ttl=0), {"test_device": "1234"})
+            mock_request.assert_called_with("/api/v1/devices?apiKey=1234",
+                                            {"If-None-Match": '"v1"'})
+            # the API key is not saved in the cache file
+            with open(path) as f:
+                self.assertNotIn("apiKey=1234", f.read())
+
+        # error responses are not cached
+        mock_request.return_value = {"message": "Request exceeds hourly limit"}
+        with tempfile.TemporaryDirectory() as directory:
+            cache = MetadataCache(os.path.join(directory, "metadata_cache.json"))
+            with self.assertRaises(QuotaExceededError):
+                DataLoader(apiKey="1234", project="test", metadata_cache=cache).get_devices()
+            self.assertEqual(cache.entries, {})
+            # nor are responses without the listing
+            mock_request.return_value = {"message": "Invalid API key"}
+            with self.assertRaisesRegex(APIError, "Invalid API key"):
+                DataLoader(apiKey="1234", project="test", metadata_cache=cache).get_devices()
+            self.assertEqual(cache.entries, {})
+
+    def test_metadata_cache_save(self):
+        """
+        This function tests that the loaders of both projects, saving the same cache file
+        at once, keep each other's entries, and that integer API keys are hashed too.
+        """
+        self.assertEqual(MetadataCache.key(100, "/api/v1/devices?apiKey=100"),
+                         MetadataCache.key("100", "/api/v1/devices?apiKey=100"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metadata_cache.json")
+            caches = [MetadataCache(path), MetadataCache(path)]
+
+            def put(index):
+                cache = caches[index % 2]
+                cache.put(f"key {index}", {"devices": []})
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(put, range(40)))
+            self.assertEqual(len(MetadataCache(path).entries), 40)
+            self.assertEqual(sorted(os.listdir(directory)),
+                             ["metadata_cache.json", "metadata_cache.json.lock"])
+            # the permissions of a file created by open(), e.g. the lock file
+            self.assertEqual(os.stat(path).st_mode & 0o777,
+                             os.stat(path + ".lock").st_mode & 0o777)
 
 
 # Execute Test Runner
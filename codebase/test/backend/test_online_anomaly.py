@@ -0,0 +1,130 @@
+"""
+This file is used to test the online_anomaly.py file and the OnlineAnomalyDetector class.
+Hourly data is fed to the detector in chunks, like the data loader downloads it.
+"""
+
+import os
+import unittest
+import pathlib
+import importlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='online_anomaly_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//online_anomaly.py"  # full path to the script
+    )
+
+online_anomaly_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(online_anomaly_mod)
+
+
+class TestOnlineAnomalyDetector(unittest.TestCase):
+    """
+    This testing class tests the OnlineAnomalyDetector class.
+    """
+
+    def setUp(self) -> None:
+        """
+        Create 30 days of hourly readings with a daily cycle and one spike.
+        """
+        times = pd.date_range("2023-06-01", periods=24 * 30, freq="H")
+        rng = np.random.default_rng(0)
+        values = 60 + 5 * np.sin(2 * np.pi * times.hour.to_numpy() / 24) \
+            + rng.normal(0, 0.2, len(times))
+        self.spike = 500
+        values[self.spike] = 90
+        self.df = pd.DataFrame({"times": times.astype(str), "values": values})
+        self.detector = online_anomaly_mod.OnlineAnomalyDetector()
+
+    def test_spike_flagged(self):
+        """
+        The spike is flagged, nothing is scored before min_history readings.
+        """
+        scored = self.detector.update("Beach2_Buoy", "Temp", self.df)
+        self.assertEqual(len(scored), len(self.df))
+        self.assertTrue(scored["anomaly"][:self.detector.min_history].isna().all())
+        self.assertEqual(scored.loc[self.spike, "anomaly"], "Yes")
+        # the spike does not drag the baseline of its hour up with it
+        self.assertLess(scored.loc[self.spike + 24, "baseline"], 70)
+
+    def test_chunks_match_single_update(self):
+        """
+        Scoring in overlapping chunks gives the same result as one update,
+        readings that were already scored are skipped.
+        """
+        full = self.detector.update("Beach2_Buoy", "Temp", self.df)
+
+        chunked_detector = online_anomaly_mod.OnlineAnomalyDetector()
+        first = chunked_detector.update("Beach2_Buoy", "Temp", self.df.iloc[:400])
+        second = chunked_detector.update("Beach2_Buoy", "Temp", self.df.iloc[300:])
+        self.assertEqual(len(second), len(self.df) - 400)
+        chunked = pd.concat([first, second], ignore_index=True)
+        pd.testing.assert_frame_equal(chunked, full)
+
+    def test_state_persisted(self):
+        """
+        A detector loaded from the saved state continues where the previous one stopped.
+        """
+        full = self.detector.update("Beach2_Buoy", "Temp", self.df)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_path = os.path.join(temp_dir, "state.json")
+            first_detector = online_anomaly_mod.OnlineAnomalyDetector()
+            first_detector.update("Beach2_Buoy", "Temp", self.df.iloc[:400])
+            first_detector.save_state(state_path)
+
+            second_detector = online_anomaly_mod.OnlineAnomalyDetector()
+            second_detector.load_state(state_path)
+            second = second_detector.update("Beach2_Buoy", "Temp", self.df.iloc[400:])
+
+        np.testing.assert_allclose(second["baseline"], full["baseline"][400:])
+        self.assertEqual(list(second["anomaly"]), list(full["anomaly"][400:]))
+
+    def test_iqr_limits(self):
+        """
+        The bands are q1 - k * iqr and q3 + k * iqr, so they surround the residuals
+        whatever their level.
+        """
+        residuals = np.arange(10.0, 110.0)
+        q1, q3 = np.percentile(residuals, [25, 75])
+        lower, upper = online_anomaly_mod.iqr_limits(residuals, 0.05)
+        self.assertAlmostEqual(lower, q1 - 3 * (q3 - q1))
+        self.assertAlmostEqual(upper, q3 + 3 * (q3 - q1))
+
+    def test_state_replaced(self):
+        """
+        Saving again replaces the state file and leaves no temporary file behind.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_path = os.path.join(temp_dir, "state.json")
+            self.detector.update("Beach2_Buoy", "Temp", self.df.iloc[:400])
+            self.detector.save_state(state_path)
+            self.detector.update("Beach2_Buoy", "Temp", self.df.iloc[400:])
+            self.detector.save_state(state_path)
+            self.assertEqual(os.listdir(temp_dir), ["state.json"])
+            with open(os.path.join(temp_dir, "other.json"), "w"):
+                pass
+            self.assertEqual(os.stat(state_path).st_mode & 0o777,
+                             os.stat(os.path.join(temp_dir, "other.json")).st_mode & 0o777)
+
+            loaded_detector = online_anomaly_mod.OnlineAnomalyDetector()
+            loaded_detector.load_state(state_path)
+            self.assertEqual(loaded_detector.state, self.detector.state)
+
+    def test_missing_state_file(self):
+        """
+        Loading a state file that does not exist yet starts empty.
+        """
+        self.detector.load_state("not_a_state_file.json")
+        self.assertEqual(self.detector.state, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,9 +7,11 @@ tests the downsample function.
 
 import os
 import unittest
+import tempfile
 import pathlib
 import importlib
 import sys
+from unittest.mock import patch
 
 import numpy as np
 import pandas as pd
@@ -134,5 +136,101 @@ class TestPreprocessIchartData(unittest.TestCase):
                         "units are not equal")
         
 
+
+class TestReadIchart(unittest.TestCase):
+    """
+    This testing class tests read_ichart, which parses the exports of iChart,
+    and the transform of whole devices from their exports.
+    """
+
+    export = (",4100-iSIC,4100-iSIC,SDL500R,4100-iSIC\n"
+              ",Avg,Avg,Avg,Avg\n"
+              "Date/Time,AirTemp,pH,Bat,Bat\n"
+              "m/d/y,F,,V,V\n"
+              "6/11/2007 7:00,-Invalid-,8.2,12.4,13.0\n"
+              "6/11/2007 6:50,67.1,8.1,12.5,13.1\n")
+
+    def transform_devices(self, module, temp_dir: str) -> None:
+        """
+        Write the export to two devices and transform them with the module.
+        """
+        transformer = module.OldDataTransformer
+        os.makedirs(f"{temp_dir}/processed")
+        for device in ["TREC_Tower", "Beach2_Tower"]:
+            os.makedirs(f"{temp_dir}/{device}")
+            with open(f"{temp_dir}/{device}/{device}_2007.csv", "w",
+                      encoding="latin-1") as file:
+                file.write(self.export)
+        transformer.set_path(temp_dir, f"{temp_dir}/processed")
+        transformer.device_id = ["TREC_Tower", "Beach2_Tower"]
+        transformer.device_transform(max_workers=2)
+
+    def check_devices(self, temp_dir: str) -> None:
+        """
+        Every device got its by-parameter and pivot files, sorted by time.
+        """
+        for device in ["TREC_Tower", "Beach2_Tower"]:
+            by_parameter_df = pd.read_csv(f"{temp_dir}/by_parameter/{device}/AirTemp_F.csv")
+            self.assertEqual(list(by_parameter_df.columns), ["times", "parameter", "value"])
+            pivot_df = pd.read_csv(f"{temp_dir}/pivot/{device}/AirTemp_pivot.csv")
+            self.assertEqual(list(pivot_df.columns), ["times", "AirTemp", "Units"])
+            self.assertEqual(list(pivot_df["times"]), ["2007-06-11 06:50:00",
+                                                       "2007-06-11 07:00:00"])
+            self.assertEqual(pivot_df.loc[0, "AirTemp"], 67.1)
+            self.assertTrue(np.isnan(pivot_df.loc[1, "AirTemp"]))
+            self.assertEqual(pivot_df.loc[0, "Units"], "F")
+            self.assertTrue(os.path.exists(f"{temp_dir}/pivot/{device}/pH_pivot.csv"))
+            # the values are written as they were exported, with every column
+            with open(f"{temp_dir}/processed/{device}_all_data.csv") as file:
+                self.assertEqual(file.read().splitlines(),
+                                 ["times,AirTemp_F,pH_,Bat_V,Bat_V",
+                                  "2007-06-11 06:50:00,67.1,8.1,12.5,13.1",
+                                  "2007-06-11 07:00:00,,8.2,12.4,13.0"])
+
+    def test_device_transform(self):
+        """
+        Every device gets its by-parameter and pivot files (made in memory, without
+        reading the by-parameter files back). The module was loaded by path, so the
+        worker processes could not find transform_device: the devices are transformed
+        in this process.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with patch.object(old_data_transformer_mod, "ProcessPoolExecutor") as executor:
+                self.transform_devices(old_data_transformer_mod, temp_dir)
+            executor.assert_not_called()
+            self.check_devices(temp_dir)
+
+    def test_device_transform_parallel(self):
+        """
+        The devices are transformed by worker processes when the module is imported by name.
+        """
+        sys.path.append("../../src/backend") # Local Running
+        sys.path.append("/home/runner/work/LakeErie/LakeErie/codebase/test/backend/../../src/backend") # Git Actions Running
+        import preprocess_ichart_data  # pylint: disable=import-outside-toplevel
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.transform_devices(preprocess_ichart_data, temp_dir)
+            self.check_devices(temp_dir)
+
+    def test_read_ichart(self):
+        """
+        The header lines give the column names, "-Invalid-" values are NaN,
+        times are parsed, the values keep their text and a duplicated parameter
+        keeps both its columns.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "TREC_Tower_2007.csv")
+            with open(path, "w", encoding="latin-1") as file:
+                file.write(self.export)
+            df, names = old_data_transformer_mod.read_ichart(path)
+
+        self.assertEqual(list(df.columns), ["times", "AirTemp_F", "pH_", "Bat_V", "Bat_V.1"])
+        self.assertEqual(names["Bat_V.1"], "Bat_V")
+        self.assertEqual(df["times"].tolist(), [pd.Timestamp("2007-06-11 07:00"),
+                                                pd.Timestamp("2007-06-11 06:50")])
+        self.assertTrue(pd.isna(df.loc[0, "AirTemp_F"]))
+        self.assertEqual(df["Bat_V"].tolist(), ["12.4", "12.5"])
+        self.assertEqual(df["Bat_V.1"].tolist(), ["13.0", "13.1"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+"""
+This file is used to test the run_anomaly_detection.py file and the AnomalyDetector class.
+It creates combined data files in a temporary directory, runs the batch job on them,
+and checks the precomputed anomalies that are written next to the combined data.
+"""
+
+import os
+import sys
+import unittest
+import pathlib
+import importlib
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='run_anomaly_detection_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//run_anomaly_detection.py"  # full path to the script
+    )
+
+run_anomaly_detection_mod = importlib.util.module_from_spec(spec)
+# registered so the worker processes can unpickle anomalize_parameter
+sys.modules[spec.name] = run_anomaly_detection_mod
+spec.loader.exec_module(run_anomaly_detection_mod)
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    """
+    This testing class tests the AnomalyDetector class and anomalize_parameter.
+    """
+
+    def setUp(self) -> None:
+        """
+        Create a combined daily csv for one location with two parameters and one spike.
+        """
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.processed_path = self.temp_dir.name
+        os.makedirs(f"{self.processed_path}/combined/TREC_Tower")
+
+        times = pd.date_range("2020-01-01", periods=60, freq="D")
+        air_temperature = 50 + 5 * np.sin(np.arange(60) * 2 * np.pi / 7)
+        air_temperature[30] = 150
+        combined_df = pd.DataFrame({
+            "times": np.concatenate([times, times]),
+            "Units": ["F"] * 60 + ["mg/L"] * 60,
+            "value_mean": np.concatenate([air_temperature, np.full(60, 9.0)]),
+            "value_std": 0.1,
+            "parameter": ["Air_Temperature"] * 60 + ["ODO"] * 60,
+            "location": "TREC_Tower",
+        })
+        combined_df.to_csv(f"{self.processed_path}/combined/TREC_Tower/daily_data.csv",
+                           index=False)
+
+        self.anomaly_detector = run_anomaly_detection_mod.AnomalyDetector()
+        self.anomaly_detector.set_path(self.processed_path)
+        self.anomaly_detector.set_map({"TREC_Tower": ["TREC_Tower", None, None]})
+        self.anomaly_detector.set_frequencies(["hourly", "daily"])
+
+    def tearDown(self) -> None:
+        """
+        Remove the temporary directory.
+        """
+        self.temp_dir.cleanup()
+
+    def test_run_all(self):
+        """
+        The job writes anomalies for every parameter of every existing frequency,
+        and flags the spike.
+        """
+        self.anomaly_detector.run_all(max_workers=2)
+        path = f"{self.processed_path}/combined/TREC_Tower"
+        # there is no hourly combined data, so no hourly anomalies either
+        self.assertFalse(os.path.exists(f"{path}/hourly_anomalies.csv"))
+        self.assertTrue(os.path.exists(f"{path}/daily_anomalies.csv"))
+
+        df = pd.read_csv(f"{path}/daily_anomalies.csv")
+        self.assertEqual(set(df["parameter"]), {"Air_Temperature", "ODO"})
+        self.assertTrue((df["location"] == "TREC_Tower").all())
+        self.assertEqual(len(df), 120)
+        air_temperature = df[df["parameter"] == "Air_Temperature"].reset_index(drop=True)
+        self.assertEqual(air_temperature.loc[30, "anomaly"], "Yes")
+
+    def test_anomalize_parameter_short_series(self):
+        """
+        A series no longer than the period gives an empty result instead of an error.
+        """
+        df = pd.DataFrame({
+            "times": pd.date_range("2020-01-01", periods=5, freq="D"),
+            "value_mean": [1.0, 2.0, 3.0, 4.0, 5.0],
+        })
+        result = run_anomaly_detection_mod.anomalize_parameter(df, "ODO", 7, 0.05, 0.75)
+        self.assertTrue(result.empty)
+        self.assertIn("anomaly", result.columns)
+
+    def test_anomalize_parameter_error(self):
+        """
+        An error of anomalize is raised to the caller instead of giving an empty result.
+        """
+        df = pd.DataFrame({
+            "times": pd.date_range("2020-01-01", periods=30, freq="D"),
+            "value_mean": np.arange(30.0),
+        })
+        with patch.object(run_anomaly_detection_mod.pytimetk, "anomalize",
+                          side_effect=ValueError("failed")):
+            with self.assertRaises(ValueError):
+                run_anomaly_detection_mod.anomalize_parameter(df, "ODO", 7, 0.05, 0.75)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,8 @@ import pathlib
 import importlib
 import sys
 
+import pandas as pd
+
 # codebase_path = pathlib.Path(__file__).parents[2]
 # #https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
 # # Run data loader
@@ -34,12 +36,15 @@ import sys
 
 sys.path.append("../../src/backend") # Local Running
 sys.path.append("/home/runner/work/LakeErie/LakeErie/codebase/test/backend/../../src/backend") # Git Actions Running
+from data_loader import QuotaExceededError, TransientError
 from run_data_loader import (
+    TRANSIENT_WAIT_SECONDS,
     START_YEAR,
     CURRENT_YEAR,
     get_times,
     aggregate_data,
     ping_api,
+    save_online_anomalies,
 )
 
 # from config import OLD_API_KEY, NEW_API_KEY
@@ -78,6 +83,36 @@ class TestRunnerDataLoader(unittest.TestCase):
         self.assertEqual(mock_time.sleep.call_count, 1)
 
 
+    @patch("run_data_loader.time")
+    @patch("run_data_loader.ping_api")
+    @patch("run_data_loader.DataLoader")
+    def test_aggregate_data_transient_error(self, mock_data_loader, mock_ping_api, mock_time):
+        """
+        A network failure is followed by a short wait, not a full hour
+        """
+        mock_ping_api.side_effect = [TransientError("timeout"), True]
+        aggregate_data(old=True, project="old")
+
+        self.assertEqual(mock_ping_api.call_count, 2)
+        self.assertEqual(mock_time.sleep.call_args_list[0].args, (TRANSIENT_WAIT_SECONDS,))
+
+    @patch("run_data_loader.os.path.exists", return_value=True)
+    def test_ping_api_quota(self, os_path_exists):
+        """
+        Reaching the hourly limit stops the call, and the next call resumes
+        from the same time range
+        """
+        mock_data_loader = MagicMock()
+        mock_data_loader.devices = {"mock_name": "mock_id"}
+        mock_data_loader.processed_devices = []
+        mock_data_loader.device_parameters = {"mock_id": {"mock_param": ("mock_id", "mock_unit")}}
+        mock_data_loader.processed_device_parameters = {"mock_id": []}
+        mock_data_loader.current_start_time = None
+        mock_data_loader.get_data.side_effect = QuotaExceededError("Request exceeds hourly limit")
+
+        self.assertFalse(ping_api(mock_data_loader))
+        self.assertEqual(mock_data_loader.current_start_time, f"{START_YEAR}-01-01")
+
     @patch("run_data_loader.os.path.exists", return_value=True)
     def test_ping_api(self, os_path_exists):
         """
@@ -86,8 +121,8 @@ class TestRunnerDataLoader(unittest.TestCase):
         # Create mock data_loader object
         mock_data_loader = MagicMock()
 
-        # Test first case: get_devices fails
-        mock_data_loader.get_devices.return_value = None
+        # Test first case: get_devices fails (hourly limit reached)
+        mock_data_loader.get_devices.side_effect = QuotaExceededError("Request exceeds hourly limit")
         mock_data_loader.devices = None
         cur_status = ping_api(mock_data_loader)
         self.assertFalse(cur_status)
@@ -98,20 +133,40 @@ class TestRunnerDataLoader(unittest.TestCase):
         cur_status = ping_api(mock_data_loader)
         self.assertTrue(cur_status)
 
-        # Test third case: parameters are not found for device from API
+        # Test third case: parameters are not found for device from API (hourly limit reached)
         mock_data_loader.devices = {"mock_name": "mock_id"}
         mock_data_loader.processed_devices = [] # No device has been processed yet
         mock_data_loader.device_parameters = {"mock_id": []}
-        mock_data_loader.get_device_parameters.return_value = None
+        mock_data_loader.get_device_parameters.side_effect = QuotaExceededError("Request exceeds hourly limit")
         cur_status = ping_api(mock_data_loader)
         self.assertFalse(cur_status)
 
         # Test fourth case: parameters are found for device from API
+        mock_data_loader.get_device_parameters.side_effect = None
         mock_data_loader.get_device_parameters.return_value = {"mock_param": ("mock_id", "mock_unit")}
         mock_data_loader.processed_devices_parameters = {"mock_id": ["mock_param"]}
         cur_status = ping_api(mock_data_loader)
         self.assertTrue(cur_status)
 
+    @patch("run_data_loader.pd.DataFrame.to_csv")
+    def test_save_online_anomalies(self, mock_to_csv):
+        """
+        Only the flagged readings are appended to the online anomalies file
+        """
+        mock_detector = MagicMock()
+        mock_detector.update.return_value = pd.DataFrame({
+            "times": ["2023-01-01 00:00:00", "2023-01-01 01:00:00"],
+            "value": [1.0, 50.0],
+            "anomaly": ["No", "Yes"],
+        })
+        save_online_anomalies(mock_detector, "mock_name", "mock_param", pd.DataFrame())
+        self.assertEqual(mock_to_csv.call_count, 1)
+
+        mock_detector.update.return_value = pd.DataFrame({
+            "times": ["2023-01-01 00:00:00"], "value": [1.0], "anomaly": ["No"]})
+        save_online_anomalies(mock_detector, "mock_name", "mock_param", pd.DataFrame())
+        self.assertEqual(mock_to_csv.call_count, 1)
+
 
 # Execute Test Runner
 if __name__ == '__main__':
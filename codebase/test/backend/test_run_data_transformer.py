@@ -147,6 +147,12 @@ class TestRunDataTransformer(unittest.TestCase):
         sd_check = np.isclose(df["value_std"],expected_daily_data["value_std"])
         for truth in sd_check:
             self.assertTrue(truth, "value_stds are not equal")
+        # statistics computed in the same pass
+        self.assertEqual(list(df["value_count"]), [4])
+        self.assertEqual(list(df["value_min"]), [42.4])
+        self.assertEqual(list(df["value_max"]), [43.4])
+        self.assertEqual(list(df["time_first"]), ["2014-05-06 03:40:00"])
+        self.assertEqual(list(df["time_last"]), ["2014-05-06 04:10:00"])
 
         expected_hourly_data = {
             "times": ["2014-05-06 03:00:00", "2014-05-06 04:00:00"],
@@ -175,6 +181,25 @@ class TestRunDataTransformer(unittest.TestCase):
             self.assertTrue(truth, "value_stds are not equal")
 
 
+    def test_parser_polars_backend(self):
+        """
+        This function tests that the polars backend of the parser writes the same
+        tidy files as the pandas backend.
+        """
+        self.data_wrangler.downsample()
+        path = f"{self.processed_path}/old/TREC_Tower"
+        expected = {frequency: pd.read_csv(os.path.join(path, f"tidy_{frequency}_all_data.csv"))
+                    for frequency in ["hourly", "daily"]}
+
+        self.data_wrangler.set_backend("polars")
+        self.data_wrangler.parser(path)
+        for frequency in ["hourly", "daily"]:
+            df = pd.read_csv(os.path.join(path, f"tidy_{frequency}_all_data.csv"))
+            pd.testing.assert_frame_equal(df, expected[frequency])
+
+        with self.assertRaises(ValueError):
+            self.data_wrangler.set_backend("dask")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,226 @@
+"""
+This file is used to test the schema.py file, which declares the column types of the
+tidy and combined data.
+"""
+
+import os
+import unittest
+import pathlib
+import importlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+
+
+codebase_path = pathlib.Path(__file__).parents[2]
+#https://stackoverflow.com/questions/65206129/importlib-not-utilising-recognising-path
+spec = importlib.util.spec_from_file_location(
+    name='schema_mod',  # name is not related to the file, it's the module name!
+    location= str(codebase_path) +
+    "//src//backend//schema.py"  # full path to the script
+    )
+
+schema_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(schema_mod)
+
+
+class TestSchema(unittest.TestCase):
+    """
+    This testing class tests compact, read_csv, the Arrow copies (read_combined)
+    and select_rows.
+    """
+
+    def setUp(self) -> None:
+        """
+        Create a small combined dataframe with the types of a csv file read by pandas.
+        """
+        self.combined_df = pd.DataFrame({
+            "times": ["2020-01-01", "2020-01-02", "2020-01-03"],
+            "parameter": ["ODO", "ODO", "Air_Temperature"],
+            "Units": ["mg/L", "mg/L", "F"],
+            "value_mean": [9.9, 10.1, 42.4],
+            "value_std": [0.6245, 0.5, np.nan],
+            "location": "TREC_Tower",
+        })
+
+    def test_compact(self):
+        """
+        The columns in the schema get their types, the values are kept.
+        """
+        df = schema_mod.compact(self.combined_df.copy())
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df["times"]))
+        for column in ["parameter", "Units", "location"]:
+            self.assertEqual(df[column].dtype, "category")
+        self.assertEqual(df["value_mean"].dtype, np.float32)
+        self.assertEqual(list(df["parameter"]), list(self.combined_df["parameter"]))
+        np.testing.assert_allclose(df["value_mean"], self.combined_df["value_mean"], rtol=1e-6)
+
+    def test_compact_missing_counts(self):
+        """
+        Counts with missing values are not converted to integers.
+        """
+        self.combined_df["value_count"] = [24, np.nan, 12]
+        df = schema_mod.compact(self.combined_df.copy())
+        self.assertTrue(np.isnan(df.loc[1, "value_count"]))
+        self.combined_df["value_count"] = [24, 6, 12]
+        df = schema_mod.compact(self.combined_df.copy())
+        self.assertEqual(df["value_count"].dtype, np.int32)
+
+    def test_to_datetime(self):
+        """
+        The format of every source is detected from its first time, and times that
+        do not fit it are still parsed. Missing times stay missing.
+        """
+        iso_times = pd.Series([np.nan, "2015-09-01 00:10:00", "2015-09-01 00:20:00"])
+        ichart_times = pd.Series(["6/11/2007 6:50", "6/11/2007 7:00", "6/11/2007 7:00"])
+        self.assertEqual(schema_mod.detect_time_format(iso_times), "ISO8601")
+        self.assertEqual(schema_mod.detect_time_format(ichart_times), "%m/%d/%Y %H:%M")
+
+        times = schema_mod.to_datetime(ichart_times)
+        self.assertEqual(list(times), [pd.Timestamp("2007-06-11 06:50"),
+                                       pd.Timestamp("2007-06-11 07:00"),
+                                       pd.Timestamp("2007-06-11 07:00")])
+        self.assertTrue(pd.isna(schema_mod.to_datetime(iso_times)[0]))
+        # a file appended to with another format
+        times = schema_mod.to_datetime(pd.Series(["2020-01-01", "6/11/2007"]))
+        self.assertEqual(times[1], pd.Timestamp("2007-06-11"))
+        # datetimes are returned as they are
+        self.assertIs(schema_mod.to_datetime(times), times)
+
+    def test_read_csv(self):
+        """
+        A csv file written from compact data is read back with the same values and types.
+        """
+        df = schema_mod.compact(self.combined_df.copy())
+        with tempfile.TemporaryDirectory() as temp_dir:
+            df.to_csv(f"{temp_dir}/daily_data.csv", index=False)
+            with open(f"{temp_dir}/daily_data.csv") as file:
+                # float32 values are written with their shortest representation
+                self.assertIn("42.4", file.read())
+            read_df = schema_mod.read_csv(f"{temp_dir}/daily_data.csv")
+        pd.testing.assert_frame_equal(read_df, df, check_categorical=False)
+
+    def test_read_combined(self):
+        """
+        The first read writes the Arrow copy, the next reads memory map it
+        (the columns are views, not copies). A copy older than the csv file, or with
+        another layout, is rewritten.
+        """
+        df = schema_mod.compact(self.combined_df.copy())
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = f"{temp_dir}/daily_data.csv"
+            df.to_csv(csv_path, index=False)
+            first_df = schema_mod.read_combined(csv_path)
+            self.assertTrue(os.path.exists(f"{temp_dir}/daily_data.arrow"))
+
+            mapped_df = schema_mod.read_combined(csv_path)
+            pd.testing.assert_frame_equal(mapped_df, first_df, check_categorical=False)
+            self.assertFalse(mapped_df["value_mean"].to_numpy().flags.owndata)
+            self.assertEqual(mapped_df["value_std"].isna().sum(), 1)
+            # rows are sorted by location, parameter and time
+            self.assertEqual(list(mapped_df["parameter"]), ["Air_Temperature", "ODO", "ODO"])
+
+            df["value_mean"] = np.float32(1.0)
+            df.to_csv(csv_path, index=False)
+            os.utime(f"{temp_dir}/daily_data.arrow", (0, 0))
+            self.assertTrue((schema_mod.read_combined(csv_path)["value_mean"] == 1).all())
+            self.assertTrue((schema_mod.read_combined(csv_path)["value_mean"] == 1).all())
+
+            # a copy with another layout (e.g. unsorted) is rewritten too
+            feather.write_feather(schema_mod.to_arrow(df), f"{temp_dir}/daily_data.arrow")
+            self.assertIsNone(schema_mod.read_arrow(f"{temp_dir}/daily_data.arrow"))
+            schema_mod.read_combined(csv_path)
+            self.assertIsNotNone(schema_mod.read_arrow(f"{temp_dir}/daily_data.arrow"))
+
+    def test_write_arrow_threads(self):
+        """
+        Sessions of the dashboard (threads of one process) writing the same Arrow copy
+        at once each write their own temporary file, and leave none behind.
+        """
+        df = schema_mod.sort_rows(schema_mod.compact(self.combined_df.copy()))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = f"{temp_dir}/daily_data.arrow"
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda _: schema_mod.write_arrow(df, path), range(32)))
+            self.assertEqual(os.listdir(temp_dir), ["daily_data.arrow"])
+            self.assertEqual(len(schema_mod.read_arrow(path)), 3)
+
+    def test_write_arrow_permissions(self):
+        """
+        The Arrow copy gets the permissions of a file created by open(), not the
+        owner-only permissions of the temporary file.
+        """
+        df = schema_mod.sort_rows(schema_mod.compact(self.combined_df.copy()))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = f"{temp_dir}/daily_data.arrow"
+            schema_mod.write_arrow(df, path)
+            with open(f"{temp_dir}/daily_data.csv", "w"):
+                pass
+            self.assertEqual(os.stat(path).st_mode & 0o777,
+                             os.stat(f"{temp_dir}/daily_data.csv").st_mode & 0o777)
+
+    def test_read_combined_unreadable_copy(self):
+        """
+        An Arrow copy that cannot be read (e.g. not allowed) falls back to the csv file.
+        """
+        df = schema_mod.compact(self.combined_df.copy())
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = f"{temp_dir}/daily_data.csv"
+            df.to_csv(csv_path, index=False)
+            expected_df = schema_mod.read_combined(csv_path)
+            with patch.object(schema_mod, "read_arrow", side_effect=PermissionError):
+                pd.testing.assert_frame_equal(schema_mod.read_combined(csv_path), expected_df,
+                                              check_categorical=False)
+
+    def test_read_combined_files(self):
+        """
+        The files of several locations are read into one dataframe with unified categories.
+        """
+        df = schema_mod.compact(self.combined_df.copy())
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = []
+            for location in ["TREC_Tower", "Beach2_Buoy"]:
+                os.makedirs(f"{temp_dir}/{location}")
+                df.assign(location=location).to_csv(f"{temp_dir}/{location}/daily_data.csv",
+                                                    index=False)
+                paths.append(f"{temp_dir}/{location}/daily_data.csv")
+            combined_df = schema_mod.read_combined_files(paths)
+        self.assertEqual(len(combined_df), 6)
+        self.assertEqual(combined_df["location"].dtype, "category")
+        # the files are in the order of their locations
+        self.assertEqual(list(combined_df["location"].unique()), ["Beach2_Buoy", "TREC_Tower"])
+
+    def test_select_rows(self):
+        """
+        The selection matches the boolean mask over the whole frame, for one or several
+        locations, and is empty for an unknown location or parameter.
+        """
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            "times": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1000, 600), "h"),
+            "parameter": rng.choice(["ODO", "Air_Temperature", "pH"], 600),
+            "Units": "F",
+            "value_mean": rng.normal(size=600),
+            "value_std": 0.1,
+            "location": rng.choice(["TREC_Tower", "Beach2_Buoy"], 600),
+        })
+        df = schema_mod.sort_rows(schema_mod.compact(df))
+        start_time, end_time = pd.Timestamp("2020-01-10"), pd.Timestamp("2020-02-01 05:00")
+        for locations in ["Beach2_Buoy", ["Beach2_Buoy", "TREC_Tower"]]:
+            selection = schema_mod.select_rows(df, locations, "ODO", start_time, end_time)
+            expected = df[(df["times"] > start_time) & (df["times"] <= end_time) &
+                          df["location"].isin(np.atleast_1d(locations)) &
+                          (df["parameter"] == "ODO")]
+            pd.testing.assert_frame_equal(selection, expected)
+        self.assertTrue(schema_mod.select_rows(df, "Beach6_Buoy", "ODO",
+                                               start_time, end_time).empty)
+        self.assertTrue(schema_mod.select_rows(df, "TREC_Tower", "DO",
+                                               start_time, end_time).empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
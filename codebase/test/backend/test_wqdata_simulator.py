@@ -0,0 +1,106 @@
+"""
+This is the testing script for the wqdata_simulator.py file, which serves a local WQData API.
+"""
+from unittest.mock import patch
+import unittest
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.append("../../src/backend") # Local Running
+sys.path.append("/home/runner/work/LakeErie/LakeErie/codebase/test/backend/../../src/backend") # Git Actions Running
+from data_loader import DataLoader, MetadataCache, QuotaExceededError
+from run_data_loader import aggregate_data
+from wqdata_simulator import WQDataSimulator
+
+
+class TestWQDataSimulator(unittest.TestCase):
+    """
+    Test Class for WQDataSimulator, called through DataLoader
+    """
+
+    def test_endpoints(self):
+        """
+        This function tests that DataLoader gets the devices, parameters and data
+        of the simulator, with at most max_points readings per call.
+        """
+        with WQDataSimulator(max_points=100) as simulator:
+            data_loader = DataLoader(apiKey="200", project="new", base_url=simulator.base_url)
+            devices = data_loader.get_devices()
+            self.assertIn("TREC_Tower_iSIC", devices)
+
+            parameters = data_loader.get_device_parameters(deviceId=devices["TREC_Tower_iSIC"])
+            # Battery is not one of the parameters DataLoader keeps
+            self.assertEqual(list(parameters), ["Air_Temperature"])
+
+            data = data_loader.get_data(deviceId=devices["TREC_Tower_iSIC"],
+                                        parameterId=parameters["Air_Temperature"][0],
+                                        start_date="2021-01-01",
+                                        end_date="2021-02-01")
+            self.assertEqual(len(data), 100)
+            # the first reading is the first 10 minutes after the start time
+            self.assertEqual(str(data["times"][0]), "2021-01-01 00:10:00")
+            self.assertEqual(simulator.stats["points"], 100)
+
+    def test_hourly_quota(self):
+        """
+        This function tests that the calls past the hourly quota are refused.
+        """
+        with WQDataSimulator(hourly_quota=2) as simulator:
+            data_loader = DataLoader(apiKey="100", project="old", base_url=simulator.base_url)
+            data_loader.get_devices()
+            data_loader.get_device_parameters(deviceId="1003")
+            with self.assertRaises(QuotaExceededError):
+                data_loader.get_device_parameters(deviceId="1006")
+            self.assertEqual(simulator.stats["quota_exceeded"], 1)
+
+    @patch('data_loader.time.sleep')
+    def test_error_injection(self, mock_sleep):
+        """
+        This function tests that the injected 503 errors are retried by DataLoader.
+        """
+        with WQDataSimulator(error_rate=0.5, seed=1) as simulator:
+            data_loader = DataLoader(apiKey="200", project="new", base_url=simulator.base_url,
+                                     max_attempts=20)
+            for _ in range(5):
+                data_loader.devices = None
+                self.assertIn("Surface_Data", data_loader.get_devices())
+            self.assertGreater(simulator.stats["errors"], 0)
+            self.assertEqual(mock_sleep.call_count, simulator.stats["errors"])
+
+    @patch('run_data_loader.time.sleep')
+    def test_aggregate_data(self, mock_sleep):
+        """
+        This function tests aggregate_data against the simulator, without mocking the API:
+        the first device of the new project is downloaded (test mode), and the device and
+        parameter listings are cached for the API key of run_data_loader.py.
+        """
+        with WQDataSimulator() as simulator, tempfile.TemporaryDirectory() as directory:
+            # aggregate_data writes to ../../data/raw/<project>, from src/backend
+            os.makedirs(f"{directory}/data/raw/new")
+            os.makedirs(f"{directory}/src/backend")
+            cache_path = f"{directory}/data/raw/metadata_cache.json"
+            cwd = os.getcwd()
+            os.chdir(f"{directory}/src/backend")
+            try:
+                aggregate_data(test=True, project="new", base_url=simulator.base_url,
+                               metadata_cache_path=cache_path)
+            finally:
+                os.chdir(cwd)
+
+            devices = os.listdir(f"{directory}/data/raw/new")
+            self.assertEqual(len(devices), 1)
+            data = pd.read_csv(f"{directory}/data/raw/new/{devices[0]}/ODO.csv")
+            self.assertGreater(len(data), 0)
+            self.assertEqual(simulator.stats["quota_exceeded"], 0)
+            cache = MetadataCache(cache_path)
+            self.assertTrue(any(key.endswith("/api/v1/devices") for key in cache.entries))
+            mock_sleep.assert_called_once()
+
+
+# Execute Test Runner
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWQDataSimulator)
+    _ = unittest.TextTestRunner().run(suite)
@@ -4,9 +4,12 @@ calculations on the selected data and create a graph with anomaly bands
 as well as display the statistical decomposition of the time series statistics 
 """
 
+import os
 import unittest
 import importlib
 import pathlib
+import tempfile
+from unittest.mock import patch
 
 import pandas as pd
 
@@ -450,3 +453,147 @@ class TestAnomalyDecomp(unittest.TestCase):
 
         expected_error_message = "clean_alpha must be a non-zero numeric value."
         self.assertEqual(str(context.exception), expected_error_message)
+
+
+######
+# Tests for the shared anomalize cache
+##########
+
+
+class TestRunAnomalize(unittest.TestCase):
+    """
+    Test cases for run_anomalize, the memoized anomalize call.
+    Streamlit only stores cache entries inside a running app,
+    so these tests check the cache key that each call is made with.
+    """
+
+    def setUp(self):
+        self.data = pd.DataFrame(
+            {
+                "times": pd.date_range("2023-01-01", periods=21, freq="D"),
+                "value_mean": [10.0, 20.0, 30.0, 40.0, 35.0, 25.0, 15.0] * 3,
+            }
+        )
+
+    @staticmethod
+    def cache_keys(mock_cached):
+        """Cache key (all arguments except the data itself) of every call"""
+        return [(c.args[0],) + c.args[2:] for c in mock_cached.call_args_list]
+
+    # Test the anomaly plot and the decomposition share one cache entry
+    def test_graph_and_decomp_share_key(self):
+        """
+        Test the plot and decomposition of the same data look up the same cache entry
+        """
+        with patch.object(anomaly_mod, "_cached_anomalize",
+                          wraps=anomaly_mod._cached_anomalize) as mock_cached:
+            anomaly_mod.create_anomaly_graph(self.data)
+            anomaly_mod.anomaly_decomp(self.data)
+        keys = self.cache_keys(mock_cached)
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(keys[0], keys[1])
+
+    # Test a change in data or parameters gives a new cache key
+    def test_new_key_recomputes(self):
+        """
+        Test different data or parameters are not served from the same cache entry
+        """
+        changed_data = self.data.copy()
+        changed_data.loc[3, "value_mean"] = 100
+        with patch.object(anomaly_mod, "_cached_anomalize",
+                          wraps=anomaly_mod._cached_anomalize) as mock_cached:
+            anomaly_mod.run_anomalize(self.data)
+            anomaly_mod.run_anomalize(changed_data)
+            anomaly_mod.run_anomalize(self.data, iqr_alpha=0.1)
+        self.assertEqual(len(set(self.cache_keys(mock_cached))), 3)
+
+    # Test missing values do not change the fingerprint
+    def test_fingerprint_ignores_dropped_rows(self):
+        """
+        Test the fingerprint is taken after rows without a value are dropped
+        """
+        with_gap = pd.concat([self.data, pd.DataFrame(
+            {"times": [pd.Timestamp("2023-02-01")], "value_mean": [None]})],
+            ignore_index=True)
+        with patch.object(anomaly_mod, "_cached_anomalize",
+                          wraps=anomaly_mod._cached_anomalize) as mock_cached:
+            anomaly_mod.run_anomalize(self.data)
+            anomaly_mod.run_anomalize(with_gap)
+        keys = self.cache_keys(mock_cached)
+        self.assertEqual(keys[0], keys[1])
+
+    # Test the engine is part of the cache key
+    def test_engine_in_key(self):
+        """
+        Test the two engines do not share a cache entry and return the same columns
+        """
+        with patch.object(anomaly_mod, "_cached_anomalize",
+                          wraps=anomaly_mod._cached_anomalize) as mock_cached:
+            pytimetk_df = anomaly_mod.run_anomalize(self.data)
+            native_df = anomaly_mod.run_anomalize(self.data, engine="native")
+        self.assertEqual(len(set(self.cache_keys(mock_cached))), 2)
+        self.assertEqual(list(native_df.columns), list(pytimetk_df.columns))
+
+    # Test an unknown engine raises a ValueError
+    def test_invalid_engine_raises_value_error(self):
+        """
+        Test an engine that is not in ANOMALY_ENGINES is rejected
+        """
+        with self.assertRaises(ValueError):
+            anomaly_mod.run_anomalize(self.data, engine="prophet")
+
+
+######
+# Tests for reading precomputed anomalies
+##########
+
+
+class TestLoadAnomalies(unittest.TestCase):
+    """Test cases for load_anomalies, which reads the output of run_anomaly_detection.py"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path_to_df = self.temp_dir.name + "/"
+        os.makedirs(self.path_to_df + "Trec_Tower")
+        pd.DataFrame(
+            {
+                "times": ["2023-01-01", "2023-01-02", "2023-01-03", "2023-01-02"],
+                "observed": [1.0, 2.0, 3.0, 4.0],
+                "anomaly": ["No", "Yes", "No", "No"],
+                "parameter": ["ODO", "ODO", "ODO", "Air_Temperature"],
+                "location": "Trec_Tower",
+            }
+        ).to_csv(self.path_to_df + "Trec_Tower/daily_anomalies.csv", index=False)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    # Test the precomputed anomalies are filtered to the selection
+    def test_default_parameters(self):
+        """
+        Test rows for the selected parameter and date range are returned
+        """
+        result = anomaly_mod.load_anomalies(self.path_to_df, "Trec_Tower", "ODO", "Daily",
+                                            pd.Timestamp("2022-12-31"), pd.Timestamp("2023-01-03"))
+        self.assertEqual(list(result["observed"]), [1.0, 2.0, 3.0])
+        self.assertNotIn("parameter", result.columns)
+
+    # Test a selection shorter than the precomputed history is calculated instead
+    def test_partial_selection(self):
+        """
+        Test None is returned when the date range does not cover the full history
+        """
+        self.assertIsNone(anomaly_mod.load_anomalies(
+            self.path_to_df, "Trec_Tower", "ODO", "Daily",
+            pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-03")))
+
+    # Test nothing is returned when the user changed the settings or nothing was precomputed
+    def test_not_precomputed(self):
+        """
+        Test None is returned for non-default settings and missing files
+        """
+        start, end = pd.Timestamp("2023-01-01"), pd.Timestamp("2023-01-03")
+        self.assertIsNone(anomaly_mod.load_anomalies(
+            self.path_to_df, "Trec_Tower", "ODO", "Daily", start, end, period=14))
+        self.assertIsNone(anomaly_mod.load_anomalies(
+            self.path_to_df, "Trec_Tower", "ODO", "Hourly", start, end))
@@ -54,6 +54,13 @@ class TestDFCreation(unittest.TestCase):
             df_manip_plotting_mod.df_creation(self.path_to_df)
         except RuntimeError:
             self.assertRaises(RuntimeError)
+    def test_site_parameter_first(self):
+        """
+        The variable picker lists the parameters of the site registry first, so the
+        default variable of the default site (TREC Tower) is its air temperature.
+        """
+        (_, variable_to_plot, _, _, _) = df_manip_plotting_mod.df_creation(self.path_to_df)
+        self.assertEqual(variable_to_plot, "Air_Temperature")
     def test_oneshot(self):
         """
         Check column names and function return types
@@ -122,12 +129,16 @@ class TestDFCreation(unittest.TestCase):
 
         # Column Name Tests
         # Column names should match what is in this list
+        # (rollup resolutions, e.g. weekly, also have count, quantile and first/last time columns)
+        statistic_names = ["value_count", "value_sum", "value_sumsq", "value_min",
+                           "value_q10", "value_q25", "value_median", "value_q75", "value_q90", "value_max",
+                           "time_first", "time_last"]
         col_names_req = ["times", "parameter", "Units",
-                         "value_mean", "value_std", "location"]
+                         "value_mean", "value_std", "location"] + statistic_names
         test_column_names(col_names_req)
         # Column names should match this list as well, order does not matter
         col_names_req_alt = ["parameter", "Units", "value_mean",
-                             "value_std", "location", "times"]
+                             "value_std", "location", "times"] + statistic_names[::-1]
         test_column_names(col_names_req_alt)
         # Column names should not match this list because 'times' should not be capitalized
         incorrect_column_names = ["Times", "parameter", "Units",
@@ -263,6 +274,39 @@ class TestAnnualComparisonFig(unittest.TestCase):
                                                )
         except (Exception,):
             self.assertRaises(TypeError)
+class TestAnnualComparisonData(unittest.TestCase):
+    '''Annual comparison data preparation: oneshot (1), edge (1)'''
+    def test_oneshot(self):
+        """
+        Hourly readings land on fractional days of the year and the same calendar
+        date lines up across leap and non-leap years
+        """
+        d = {'parameter': ['Air_Temp', 'Air_Temp', 'Air_Temp', 'ODO'],
+             'value_mean': [1.0, 1.1, 1.2, 8.0],
+             'value_std': [0, 1, 2, 0],
+             'location': ['trec', 'trec', 'trec', 'trec'],
+             'Units' : ['F', 'F', 'F', 'mg/L'],
+             'times' : ['2008-05-20 00:00', '2008-05-20 12:00',
+                        '2009-05-20 00:00', '2009-05-20 00:00']}
+        df = pd.DataFrame(data=d)
+        df_prepared = df_manip_plotting_mod.annual_comparison_data(df, 'Air_Temp')
+        self.assertEqual(len(df_prepared), 3)
+        self.assertEqual(list(df_prepared['year'].cat.categories), ['2008', '2009'])
+        self.assertEqual(list(df_prepared['timepoint']), [140.0, 140.5, 140.0])
+    def test_edge(self):
+        """
+        The caller's dataframe is not modified
+        """
+        d = {'parameter': ['Air_Temp', 'Air_Temp'],
+             'value_mean': [1.0, 1.1],
+             'value_std': [0, 1],
+             'location': ['trec', 'trec'],
+             'Units' : ['F', 'F'],
+             'times' : ['2010-01-01', '2010-01-02']}
+        df = pd.DataFrame(data=d)
+        df_manip_plotting_mod.annual_comparison_data(df, 'Air_Temp')
+        self.assertEqual(list(df.columns), list(d.keys()))
+        self.assertFalse(pd.api.types.is_datetime64_any_dtype(df['times']))
 class TestPlotIt(unittest.TestCase):
     '''
     Plotter function: smoke (1), edge (1)
@@ -0,0 +1,46 @@
+"""Test cases for lazy_imports.py, which imports heavy libraries on first use
+    and reports the cold-start import time of the pages."""
+
+import sys
+import unittest
+import importlib
+import pathlib
+
+codebase_path = pathlib.Path(__file__).parents[2]
+lazy_imports_mod_path = codebase_path / "src" / "frontend" / "lazy_imports.py"
+
+spec = importlib.util.spec_from_file_location(
+    name="lazy_imports_test_mod",
+    location=str(lazy_imports_mod_path),
+)
+
+lazy_imports_mod = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(lazy_imports_mod)
+
+
+class TestLazyImports(unittest.TestCase):
+    """
+    Test cases for lazy_import and report_import_time.
+    """
+
+    def test_lazy_import(self):
+        """The module is only imported when one of its attributes is used,
+        and the import is timed."""
+        sys.modules.pop("tabnanny", None)
+        tabnanny = lazy_imports_mod.lazy_import("tabnanny")
+        self.assertNotIn("tabnanny", sys.modules)
+        self.assertTrue(callable(tabnanny.check))
+        self.assertIn("tabnanny", sys.modules)
+        self.assertIn("tabnanny", lazy_imports_mod.IMPORT_TIMES)
+
+    def test_report_import_time(self):
+        """The import time of a page is only logged the first time it runs."""
+        with self.assertLogs(level="INFO") as logs:
+            report = lazy_imports_mod.report_import_time("Test", 0.25)
+        self.assertTrue(report.startswith("Cold start of the Test page: page imports 0.25 s"))
+        self.assertEqual(logs.records[-1].getMessage(), report)
+        self.assertEqual(lazy_imports_mod.report_import_time("Test", 0.1), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -40,3 +40,20 @@ class TestMapMain(unittest.TestCase):
 
         # Assert that the map object is not None
         self.assertIsNotNone(buoy_map)
+
+    def test_map_coordinates_from_config(self):
+        """Tests that the markers and the center of the map come from config_combine.py."""
+        buoy_map = leaflet_map_mod.map_main("Beach2_Buoy")
+        markers = [child for child in buoy_map._children.values()
+                   if hasattr(child, "location") and hasattr(child, "icon")]
+        self.assertEqual(len(markers), len(leaflet_map_mod.config_combine_mod.SITE_COORDINATES))
+        self.assertEqual(tuple(buoy_map.location), leaflet_map_mod.config_combine_mod.MAP_CENTER)
+
+    def test_map_html(self):
+        """Tests that the rendered map has every buoy and the selected one in red."""
+        html = leaflet_map_mod.map_html("Walnut_Creek")
+        for name in leaflet_map_mod.config_combine_mod.SITE_COORDINATES:
+            self.assertIn(name, html)
+        self.assertIn("red", html)
+        with self.assertRaises(ValueError):
+            leaflet_map_mod.map_html("Invalid_Buoy")